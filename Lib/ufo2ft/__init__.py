@@ -1,12 +1,15 @@
 import logging
 from enum import IntEnum
+from io import BytesIO
 
 from fontTools import varLib
+from fontTools.ttLib import TTFont
 
 from ufo2ft.constants import SPARSE_OTF_MASTER_TABLES, SPARSE_TTF_MASTER_TABLES
 from ufo2ft.featureCompiler import (
     MTI_FEATURES_PREFIX,
     FeatureCompiler,
+    LayoutFeaturesCache,
     MtiFeatureCompiler,
 )
 from ufo2ft.outlineCompiler import OutlineOTFCompiler, OutlineTTFCompiler
@@ -17,6 +20,11 @@ from ufo2ft.preProcessor import (
     TTFPreProcessor,
 )
 from ufo2ft.util import _getDefaultNotdefGlyph, getDefaultMasterFont
+from ufo2ft.variableFeatures import (
+    Variations,
+    compileVariableFeatures,
+    splitVariableFeatureWriters,
+)
 
 try:
     from ._version import version as __version__
@@ -52,7 +60,12 @@ def compileOTF(
     cffVersion=1,
     subroutinizer=None,
     notdefGlyph=None,
+    subroutinizerCache=None,
+    output=None,
+    flavor=None,
     _tables=None,
+    _featuresCache=None,
+    _glyphSets=None,
 ):
     """Create FontTools CFF font from a UFO.
 
@@ -104,7 +117,74 @@ def compileOTF(
       By default "cffsubr" is used for both CFF 1 and CFF 2.
       NOTE: cffsubr is required for subroutinizing CFF2 tables, as compreffor
       currently doesn't support it.
+
+    *subroutinizerCache* (Optional[str]) is the path of a directory where the
+      subroutinized CFF tables are cached, keyed by the content of the input
+      charstrings and private dict: when the outlines did not change since a
+      previous build, the subroutinizer is not run again. Alternatively, a
+      ufo2ft.cache.FileCache instance, e.g. to set a different maximum size.
+
+    *output* (Optional) is a file path or a writable binary stream. If set, the
+      final font is written to it as soon as it's post-processed, reusing the
+      data of the tables which were already compiled, and None is returned
+      instead of a TTFont object.
+
+    *flavor* (Optional[str]) compresses the output font as "woff" or "woff2".
     """
+    postProcessor, processOptions = _buildOTF(
+        ufo,
+        preProcessorClass=preProcessorClass,
+        outlineCompilerClass=outlineCompilerClass,
+        featureCompilerClass=featureCompilerClass,
+        featureWriters=featureWriters,
+        glyphOrder=glyphOrder,
+        useProductionNames=useProductionNames,
+        optimizeCFF=optimizeCFF,
+        roundTolerance=roundTolerance,
+        removeOverlaps=removeOverlaps,
+        overlapsBackend=overlapsBackend,
+        inplace=inplace,
+        layerName=layerName,
+        skipExportGlyphs=skipExportGlyphs,
+        debugFeatureFile=debugFeatureFile,
+        cffVersion=cffVersion,
+        subroutinizer=subroutinizer,
+        notdefGlyph=notdefGlyph,
+        subroutinizerCache=subroutinizerCache,
+        _tables=_tables,
+        _featuresCache=_featuresCache,
+        _glyphSets=_glyphSets,
+    )
+    otf = postProcessor.process(**processOptions)
+    return _saveOutput(postProcessor, otf, output, flavor)
+
+
+def _buildOTF(
+    ufo,
+    preProcessorClass=OTFPreProcessor,
+    outlineCompilerClass=OutlineOTFCompiler,
+    featureCompilerClass=None,
+    featureWriters=None,
+    glyphOrder=None,
+    useProductionNames=None,
+    optimizeCFF=CFFOptimization.SUBROUTINIZE,
+    roundTolerance=None,
+    removeOverlaps=False,
+    overlapsBackend=None,
+    inplace=False,
+    layerName=None,
+    skipExportGlyphs=None,
+    debugFeatureFile=None,
+    cffVersion=1,
+    subroutinizer=None,
+    notdefGlyph=None,
+    subroutinizerCache=None,
+    _tables=None,
+    _featuresCache=None,
+    _glyphSets=None,
+):
+    # Run all the compileOTF steps but the last: return the PostProcessor and
+    # the keyword arguments for its 'process' method.
     logger.info("Pre-processing glyphs")
 
     if skipExportGlyphs is None:
@@ -119,9 +199,17 @@ def compileOTF(
         skipExportGlyphs=skipExportGlyphs,
     )
     glyphSet = preProcessor.process()
+    if _glyphSets is not None:
+        # the pre-processed glyphs, e.g. for the variable features
+        _glyphSets.append(glyphSet)
 
     logger.info("Building OpenType tables")
     optimizeCFF = CFFOptimization(optimizeCFF)
+    compilerOptions = {}
+    if cffVersion != 1:
+        # only passed when needed, for the outline compilers which don't
+        # support this argument
+        compilerOptions["cffVersion"] = cffVersion
     outlineCompiler = outlineCompilerClass(
         ufo,
         glyphSet=glyphSet,
@@ -130,6 +218,7 @@ def compileOTF(
         roundTolerance=roundTolerance,
         optimizeCFF=optimizeCFF >= CFFOptimization.SPECIALIZE,
         tables=_tables,
+        **compilerOptions,
     )
     otf = outlineCompiler.compile()
 
@@ -142,17 +231,115 @@ def compileOTF(
             featureWriters=featureWriters,
             featureCompilerClass=featureCompilerClass,
             debugFeatureFile=debugFeatureFile,
+            buildContext=outlineCompiler.buildContext,
+            featuresCache=_featuresCache,
         )
 
     postProcessor = PostProcessor(otf, ufo, glyphSet=glyphSet)
-    otf = postProcessor.process(
-        useProductionNames,
+    processOptions = dict(
+        useProductionNames=useProductionNames,
         optimizeCFF=optimizeCFF >= CFFOptimization.SUBROUTINIZE,
         subroutinizer=subroutinizer,
         cffVersion=cffVersion,
+        subroutinizerCache=subroutinizerCache,
     )
+    return postProcessor, processOptions
+
 
-    return otf
+def compileOTFs(ufos, maxWorkers=None, flavor=None, **kwargs):
+    """Create FontTools CFF fonts from a list of UFOs.
+
+    This is the same as calling `compileOTF` on each UFO with the given
+    keyword arguments, but the post-processing of the fonts, where the CFF
+    charstrings get subroutinized, runs concurrently in a pool of threads.
+    The subroutinizers spend most of their time outside of the Python
+    interpreter (e.g. "cffsubr" runs the external 'tx' program), so this
+    step of a font overlaps with the subroutinization of the others and
+    with the compilation of the following UFOs.
+
+    *maxWorkers* (int) is the maximum number of fonts post-processed at
+      the same time. By default, the same as ThreadPoolExecutor's.
+
+    *flavor* (Optional[str]) is "woff" or "woff2": if set, the post-processed
+      fonts are compressed with `compressFonts`, and returned as bytes.
+
+    Return a list of TTFont instances (or bytes, if *flavor* is set), in the
+    same order as *ufos*.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = []
+        # the feature writers and filters are not thread-safe: only the
+        # post-processing is run concurrently.
+        for ufo in ufos:
+            postProcessor, processOptions = _buildOTF(ufo, **kwargs)
+            if flavor is None:
+                process = postProcessor.process
+            else:
+                process = _processAndSave(postProcessor)
+            futures.append(executor.submit(process, **processOptions))
+        fonts = [future.result() for future in futures]
+    if flavor is not None:
+        fonts = compressFonts(fonts, flavor=flavor, maxWorkers=maxWorkers)
+    return fonts
+
+
+def _processAndSave(postProcessor):
+    # Return a function running the post-processor, which returns the final
+    # font data instead of the TTFont.
+    def process(**processOptions):
+        postProcessor.process(**processOptions)
+        return postProcessor.save()
+
+    return process
+
+
+def compressFonts(fonts, flavor="woff2", maxWorkers=None):
+    """Compress a list of compiled fonts as WOFF or WOFF2.
+
+    The fonts are compressed concurrently in a pool of processes, as the
+    zlib or brotli compression and the WOFF2 transforms of the 'glyf' and
+    'loca' tables are CPU-bound.
+
+    *fonts* is a list of TTFont instances or of the fonts' data (bytes), e.g.
+      as written by `compileOTF` or `compileTTF` to their *output* stream.
+      Passing bytes avoids saving the TTFont objects again.
+
+    *flavor* (str) is "woff" or "woff2" (default). WOFF2 requires the brotli
+      module.
+
+    *maxWorkers* (int) is the maximum number of processes. By default, the
+      same as ProcessPoolExecutor's.
+
+    Return a list of the compressed fonts' data (bytes), in the same order as
+    *fonts*.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    if flavor not in ("woff", "woff2"):
+        raise ValueError(f"Unsupported font flavor: {flavor!r}")
+
+    fontData = []
+    for font in fonts:
+        if not isinstance(font, bytes):
+            stream = BytesIO()
+            font.save(stream)
+            font = stream.getvalue()
+        fontData.append(font)
+
+    if len(fontData) < 2 or maxWorkers == 1:
+        return [_compressFont(data, flavor) for data in fontData]
+    with ProcessPoolExecutor(max_workers=maxWorkers) as executor:
+        return list(executor.map(_compressFont, fontData, [flavor] * len(fontData)))
+
+
+def _compressFont(data, flavor):
+    font = TTFont(BytesIO(data))
+    font.flavor = flavor
+    stream = BytesIO()
+    font.save(stream)
+    return stream.getvalue()
 
 
 def compileTTF(
@@ -175,6 +362,8 @@ def compileTTF(
     skipExportGlyphs=None,
     debugFeatureFile=None,
     notdefGlyph=None,
+    output=None,
+    flavor=None,
 ):
     """Create FontTools TrueType font from a UFO.
 
@@ -195,6 +384,8 @@ def compileTTF(
     "public.skipExportGlyphs" lib key will be consulted. If it doesn't exist,
     all glyphs are exported. UFO groups and kerning will be pruned of skipped
     glyphs.
+
+    *output* and *flavor* work the same as in `compileOTF`.
     """
     logger.info("Pre-processing glyphs")
 
@@ -231,12 +422,22 @@ def compileTTF(
             featureWriters=featureWriters,
             featureCompilerClass=featureCompilerClass,
             debugFeatureFile=debugFeatureFile,
+            buildContext=outlineCompiler.buildContext,
         )
 
     postProcessor = PostProcessor(otf, ufo, glyphSet=glyphSet)
     otf = postProcessor.process(useProductionNames)
 
-    return otf
+    return _saveOutput(postProcessor, otf, output, flavor)
+
+
+def _saveOutput(postProcessor, otf, output, flavor):
+    # Return the post-processed font, or write it to 'output' if set.
+    if output is None:
+        otf.flavor = flavor
+        return otf
+    postProcessor.save(output, flavor=flavor)
+    return None
 
 
 def compileInterpolatableTTFs(
@@ -255,6 +456,7 @@ def compileInterpolatableTTFs(
     skipExportGlyphs=None,
     debugFeatureFile=None,
     notdefGlyph=None,
+    _glyphSets=None,
 ):
     """Create FontTools TrueType fonts from a list of UFOs with interpolatable
     outlines. Cubic curves are converted compatibly to quadratic curves using
@@ -299,6 +501,11 @@ def compileInterpolatableTTFs(
         skipExportGlyphs=skipExportGlyphs,
     )
     glyphSets = preProcessor.process()
+    if _glyphSets is not None:
+        _glyphSets.extend(glyphSets)
+
+    # the masters usually share the same features
+    featuresCache = LayoutFeaturesCache()
 
     for ufo, glyphSet, layerName in zip(ufos, glyphSets, layerNames):
         fontName = _LazyFontName(ufo)
@@ -328,6 +535,8 @@ def compileInterpolatableTTFs(
                 featureWriters=featureWriters,
                 featureCompilerClass=featureCompilerClass,
                 debugFeatureFile=debugFeatureFile,
+                buildContext=outlineCompiler.buildContext,
+                featuresCache=featuresCache,
             )
 
         postProcessor = PostProcessor(ttf, ufo, glyphSet=glyphSet)
@@ -361,6 +570,7 @@ def compileInterpolatableTTFsFromDS(
     inplace=False,
     debugFeatureFile=None,
     notdefGlyph=None,
+    _glyphSets=None,
 ):
     """Create FontTools TrueType fonts from the DesignSpaceDocument UFO sources
     with interpolatable outlines. Cubic curves are converted compatibly to
@@ -418,6 +628,7 @@ def compileInterpolatableTTFsFromDS(
         skipExportGlyphs=skipExportGlyphs,
         debugFeatureFile=debugFeatureFile,
         notdefGlyph=notdefGlyph,
+        _glyphSets=_glyphSets,
     )
 
     if inplace:
@@ -442,6 +653,7 @@ def compileInterpolatableOTFsFromDS(
     inplace=False,
     debugFeatureFile=None,
     notdefGlyph=None,
+    _glyphSets=None,
 ):
     """Create FontTools CFF fonts from the DesignSpaceDocument UFO sources
     with interpolatable outlines.
@@ -481,6 +693,9 @@ def compileInterpolatableOTFsFromDS(
     if notdefGlyph is None:
         notdefGlyph = _getDefaultNotdefGlyph(designSpaceDoc)
 
+    # the masters usually share the same features
+    featuresCache = LayoutFeaturesCache()
+
     otfs = []
     for source in designSpaceDoc.sources:
         otfs.append(
@@ -502,6 +717,8 @@ def compileInterpolatableOTFsFromDS(
                 debugFeatureFile=debugFeatureFile,
                 notdefGlyph=notdefGlyph,
                 _tables=SPARSE_OTF_MASTER_TABLES if source.layerName else None,
+                _featuresCache=featuresCache,
+                _glyphSets=_glyphSets,
             )
         )
 
@@ -524,6 +741,8 @@ def compileFeatures(
     featureWriters=None,
     featureCompilerClass=None,
     debugFeatureFile=None,
+    buildContext=None,
+    featuresCache=None,
 ):
     """Compile OpenType Layout features from `ufo` into FontTools OTL tables.
     If `ttFont` is None, a new TTFont object is created containing the new
@@ -541,6 +760,14 @@ def compileFeatures(
     `debugFeatureFile` can be a file or file-like object opened in text mode,
     in which to dump the text content of the feature file, useful for debugging
     auto-generated OpenType features like kern, mark, mkmk etc.
+
+    `buildContext` is an optional BuildContext instance, e.g. the one of the
+    outline compiler that built `ttFont`, used to share the data derived from
+    the UFO glyphs (glyph order, cmap, etc.) instead of computing it again.
+
+    `featuresCache` is an optional LayoutFeaturesCache instance, used to parse
+    the features only once for several UFOs with the same features, e.g. the
+    masters of a designspace.
     """
     if featureCompilerClass is None:
         if any(
@@ -550,8 +777,13 @@ def compileFeatures(
             featureCompilerClass = MtiFeatureCompiler
         else:
             featureCompilerClass = FeatureCompiler
+    kwargs = {}
+    if buildContext is not None:
+        kwargs["buildContext"] = buildContext
+    if featuresCache is not None:
+        kwargs["featuresCache"] = featuresCache
     featureCompiler = featureCompilerClass(
-        ufo, ttFont, glyphSet=glyphSet, featureWriters=featureWriters
+        ufo, ttFont, glyphSet=glyphSet, featureWriters=featureWriters, **kwargs
     )
     otFont = featureCompiler.compile()
 
@@ -562,6 +794,23 @@ def compileFeatures(
     return otFont
 
 
+def _splitVariableFeatures(
+    designSpaceDoc, baseUfo, featureWriters, featureCompilerClass, variableFeatures
+):
+    # Return the Variations of the masters, the feature writers to run for each
+    # master and those which generate the features from all the masters. The
+    # masters are collected before they are compiled, which replaces the UFOs
+    # in the designspace sources with 'inplace=True'.
+    if not variableFeatures:
+        return None, featureWriters, []
+    featureWriters, variableWriters = splitVariableFeatureWriters(
+        baseUfo, featureWriters, featureCompilerClass
+    )
+    if not variableWriters:
+        return None, featureWriters, []
+    return Variations(designSpaceDoc), featureWriters, variableWriters
+
+
 def compileVariableTTF(
     designSpaceDoc,
     preProcessorClass=TTFInterpolatablePreProcessor,
@@ -578,6 +827,9 @@ def compileVariableTTF(
     inplace=False,
     debugFeatureFile=None,
     notdefGlyph=None,
+    output=None,
+    flavor=None,
+    variableFeatures=False,
 ):
     """Create FontTools TrueType variable font from the DesignSpaceDocument UFO sources
     with interpolatable outlines, using fontTools.varLib.build.
@@ -588,12 +840,27 @@ def compileVariableTTF(
     *excludeVariationTables* is a list of sfnt table tags (str) that is passed on
       to fontTools.varLib.build, to skip building some variation tables.
 
+    *variableFeatures*, if set to True, makes the feature writers which support
+      it (e.g. the KernFeatureWriter) generate their features from all the
+      masters at once, with variable values, instead of running for each master
+      before varLib merges their GPOS tables (see ufo2ft.variableFeatures).
+
     The rest of the arguments works the same as in the other compile functions.
 
     Returns a new variable TTFont object.
     """
     baseUfo = getDefaultMasterFont(designSpaceDoc)
 
+    variations, featureWriters, variableWriters = _splitVariableFeatures(
+        designSpaceDoc,
+        baseUfo,
+        featureWriters,
+        featureCompilerClass,
+        variableFeatures and "GPOS" not in excludeVariationTables,
+    )
+    # the pre-processed glyphs of the sources, read by the variable writers
+    glyphSets = [] if variations is not None else None
+
     ttfDesignSpace = compileInterpolatableTTFsFromDS(
         designSpaceDoc,
         preProcessorClass=preProcessorClass,
@@ -608,7 +875,10 @@ def compileVariableTTF(
         inplace=inplace,
         debugFeatureFile=debugFeatureFile,
         notdefGlyph=notdefGlyph,
+        _glyphSets=glyphSets,
     )
+    if variations is not None:
+        variations.setGlyphSets(glyphSets)
 
     logger.info("Building variable TTF font")
 
@@ -616,10 +886,15 @@ def compileVariableTTF(
         ttfDesignSpace, exclude=excludeVariationTables, optimize=optimizeGvar
     )[0]
 
+    if variableWriters:
+        compileVariableFeatures(
+            variations, varfont, featureWriters + variableWriters, debugFeatureFile
+        )
+
     postProcessor = PostProcessor(varfont, baseUfo)
     varfont = postProcessor.process(useProductionNames)
 
-    return varfont
+    return _saveOutput(postProcessor, varfont, output, flavor)
 
 
 def compileVariableCFF2(
@@ -636,6 +911,10 @@ def compileVariableCFF2(
     debugFeatureFile=None,
     optimizeCFF=CFFOptimization.SPECIALIZE,
     notdefGlyph=None,
+    subroutinizerCache=None,
+    output=None,
+    flavor=None,
+    variableFeatures=False,
 ):
     """Create FontTools CFF2 variable font from the DesignSpaceDocument UFO sources
     with interpolatable outlines, using fontTools.varLib.build.
@@ -651,12 +930,26 @@ def compileVariableCFF2(
       fonttools/fonttools#1979.
       NOTE: Subroutinization of variable CFF2 requires the "cffsubr" extra requirement.
 
+    *subroutinizerCache*, *output* and *flavor* work the same as in `compileOTF`.
+
+    *variableFeatures* works the same as in `compileVariableTTF`.
+
     The rest of the arguments works the same as in the other compile functions.
 
     Returns a new variable TTFont object.
     """
     baseUfo = getDefaultMasterFont(designSpaceDoc)
 
+    variations, featureWriters, variableWriters = _splitVariableFeatures(
+        designSpaceDoc,
+        baseUfo,
+        featureWriters,
+        featureCompilerClass,
+        variableFeatures and "GPOS" not in excludeVariationTables,
+    )
+    # the pre-processed glyphs of the sources, read by the variable writers
+    glyphSets = [] if variations is not None else None
+
     otfDesignSpace = compileInterpolatableOTFsFromDS(
         designSpaceDoc,
         preProcessorClass=preProcessorClass,
@@ -669,7 +962,10 @@ def compileVariableCFF2(
         inplace=inplace,
         debugFeatureFile=debugFeatureFile,
         notdefGlyph=notdefGlyph,
+        _glyphSets=glyphSets,
     )
+    if variations is not None:
+        variations.setGlyphSets(glyphSets)
 
     logger.info("Building variable CFF2 font")
 
@@ -683,10 +979,16 @@ def compileVariableCFF2(
         optimize=optimizeCFF >= CFFOptimization.SPECIALIZE,
     )[0]
 
+    if variableWriters:
+        compileVariableFeatures(
+            variations, varfont, featureWriters + variableWriters, debugFeatureFile
+        )
+
     postProcessor = PostProcessor(varfont, baseUfo)
     varfont = postProcessor.process(
         useProductionNames,
         optimizeCFF=optimizeCFF >= CFFOptimization.SUBROUTINIZE,
+        subroutinizerCache=subroutinizerCache,
     )
 
-    return varfont
+    return _saveOutput(postProcessor, varfont, output, flavor)
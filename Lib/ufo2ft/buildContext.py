@@ -0,0 +1,109 @@
+from collections import OrderedDict
+
+from ufo2ft.featureWriters import ast
+from ufo2ft.util import (
+    UnicodeCoverageIndex,
+    makeOfficialGlyphOrder,
+    makeUnicodeToGlyphNameMapping,
+)
+
+
+class BuildContext:
+    """Data derived from a UFO font that is needed at several stages of
+    the build: glyph order, character mapping, GDEF glyph classes, etc.
+
+    Each value is computed on first access and then shared by the outline
+    compiler, the feature compiler and the feature writers. The values can
+    also be set explicitly, e.g. the outline compiler sets the final glyph
+    order and character mapping of the font it builds.
+
+    Args:
+      font: an object representing a UFO (defcon.Font or equivalent).
+      glyphSet: a (optional) dict containing pre-processed copies of the
+        UFO glyphs. By default, the glyphs of the UFO's default layer.
+      glyphOrder: a (optional) list of glyph names, used to sort the
+        glyph set. By default, the UFO's glyphOrder.
+
+    Nothing is tracked automatically: when the glyphs change (e.g. after
+    running filters), call `invalidate` to discard the cached values.
+    """
+
+    def __init__(self, font, glyphSet=None, glyphOrder=None):
+        self.font = font
+        self._glyphOrderSource = glyphOrder
+        self.invalidate(glyphSet)
+
+    def invalidate(self, glyphSet=None):
+        """Discard all the cached values. If `glyphSet` is provided, it
+        replaces the current glyph set.
+        """
+        if glyphSet is not None:
+            self.glyphSet = glyphSet
+        elif not hasattr(self, "glyphSet"):
+            self.glyphSet = {g.name: g for g in self.font}
+        self._glyphOrder = None
+        self._unicodeToGlyphNameMapping = None
+        self._unicodeCoverage = None
+        self._orderedGlyphSet = None
+        self._gdefGlyphClasses = None
+
+    @property
+    def glyphOrder(self):
+        """The list of glyph names in the order of the final font."""
+        if self._glyphOrder is None:
+            glyphOrder = self._glyphOrderSource
+            if glyphOrder is None:
+                glyphOrder = self.font.glyphOrder
+            self._glyphOrder = makeOfficialGlyphOrder(self.glyphSet, glyphOrder)
+        return self._glyphOrder
+
+    @glyphOrder.setter
+    def glyphOrder(self, value):
+        self._glyphOrder = list(value)
+        # these depend on the glyph order
+        self._unicodeToGlyphNameMapping = None
+        self._unicodeCoverage = None
+        self._orderedGlyphSet = None
+
+    @property
+    def unicodeToGlyphNameMapping(self):
+        """A ``unicode : glyph name`` dict, as in the font's cmap."""
+        if self._unicodeToGlyphNameMapping is None:
+            self._unicodeToGlyphNameMapping = makeUnicodeToGlyphNameMapping(
+                self.glyphSet, self.glyphOrder
+            )
+        return self._unicodeToGlyphNameMapping
+
+    @unicodeToGlyphNameMapping.setter
+    def unicodeToGlyphNameMapping(self, value):
+        if value != self._unicodeToGlyphNameMapping:
+            self._unicodeCoverage = None
+        self._unicodeToGlyphNameMapping = value
+
+    @property
+    def unicodeCoverage(self):
+        """A UnicodeCoverageIndex for `unicodeToGlyphNameMapping`."""
+        if self._unicodeCoverage is None:
+            self._unicodeCoverage = UnicodeCoverageIndex(self.unicodeToGlyphNameMapping)
+        return self._unicodeCoverage
+
+    @property
+    def orderedGlyphSet(self):
+        """OrderedDict[glyphName, glyph] sorted by `glyphOrder`."""
+        if self._orderedGlyphSet is None:
+            glyphSet = self.glyphSet
+            self._orderedGlyphSet = OrderedDict(
+                (gn, glyphSet[gn]) for gn in self.glyphOrder
+            )
+        return self._orderedGlyphSet
+
+    def getGDEFGlyphClasses(self, feaFile):
+        """Return the GDEF glyph classes defined in the feaLib FeatureFile
+        (see `ufo2ft.featureWriters.ast.getGDEFGlyphClasses`).
+
+        The result is cached for the given FeatureFile object: it is only
+        computed again for a different object, or after `invalidate`.
+        """
+        if self._gdefGlyphClasses is None or self._gdefGlyphClasses[0] is not feaFile:
+            self._gdefGlyphClasses = (feaFile, ast.getGDEFGlyphClasses(feaFile))
+        return self._gdefGlyphClasses[1]
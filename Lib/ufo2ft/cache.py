@@ -0,0 +1,130 @@
+"""On-disk cache for the results of the slowest build steps, reused across
+runs when their inputs don't change.
+"""
+
+import hashlib
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024  # bytes
+
+
+class FileCache:
+    """Store data (bytes) as files in a directory, one file per key.
+
+    The total size of the entries is kept below 'maxSize' bytes: when new
+    data is stored, the least recently used entries are deleted first.
+    Reading an entry updates the modification time of its file, which is
+    what determines the least recently used entries.
+
+    Files are written atomically, so the same directory can be shared by
+    builds running concurrently.
+
+    Args:
+      path: the path of the cache directory; it is created if missing.
+      maxSize: the maximum total size of the entries, in bytes.
+    """
+
+    _KEY_RE = re.compile(r"^[0-9A-Za-z_-]+$")
+    _TEMP_PREFIX = ".tmp-"
+
+    def __init__(self, path, maxSize=DEFAULT_MAX_SIZE):
+        self.path = os.fspath(path)
+        self.maxSize = maxSize
+
+    @staticmethod
+    def makeKey(*parts):
+        """Return a key computed from a sequence of str or bytes."""
+        h = hashlib.sha256()
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode("utf-8")
+            # prefix with the length so that parts can't run into each other
+            h.update(b"%d:" % len(part))
+            h.update(part)
+        return h.hexdigest()
+
+    def _getPath(self, key):
+        if not self._KEY_RE.match(key):
+            raise ValueError(f"invalid cache key: {key!r}")
+        return os.path.join(self.path, key)
+
+    def get(self, key, default=None):
+        """Return the data stored for 'key', or 'default' if missing."""
+        path = self._getPath(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return default
+        except OSError as e:
+            logger.warning("Failed to read cache entry %s: %s", path, e)
+            return default
+        try:
+            # mark as recently used
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def __contains__(self, key):
+        return os.path.isfile(self._getPath(key))
+
+    def set(self, key, data):
+        """Store the data (bytes) for 'key', then evict the least recently
+        used entries if the cache exceeds its maximum size.
+        """
+        path = self._getPath(key)
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix=self._TEMP_PREFIX, dir=self.path)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        self.prune()
+
+    def prune(self, maxSize=None):
+        """Delete the least recently used entries until their total size is
+        not greater than 'maxSize' (by default, the cache's maxSize).
+        """
+        if maxSize is None:
+            maxSize = self.maxSize
+        entries = []
+        totalSize = 0
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if entry.name.startswith(self._TEMP_PREFIX):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue  # deleted in the meantime
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+                    totalSize += stat.st_size
+        except FileNotFoundError:
+            return
+        if totalSize <= maxSize:
+            return
+        entries.sort()
+        for _, path, size in entries:
+            if totalSize <= maxSize:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            totalSize -= size
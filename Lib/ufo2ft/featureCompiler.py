@@ -1,15 +1,20 @@
+import copy
 import logging
 import os
-from collections import OrderedDict
 from inspect import isclass
 from io import StringIO
 from tempfile import NamedTemporaryFile
 
 from fontTools import mtiLib
-from fontTools.feaLib.builder import addOpenTypeFeaturesFromString
+from fontTools.feaLib.builder import (
+    addOpenTypeFeatures,
+    addOpenTypeFeaturesFromString,
+)
 from fontTools.feaLib.error import FeatureLibError, IncludedFeaNotFound
+from fontTools.feaLib.lexer import IncludingLexer
 from fontTools.feaLib.parser import Parser
 
+from ufo2ft.buildContext import BuildContext
 from ufo2ft.constants import MTI_FEATURES_PREFIX
 from ufo2ft.featureWriters import (
     KernFeatureWriter,
@@ -17,13 +22,18 @@ from ufo2ft.featureWriters import (
     ast,
     loadFeatureWriters,
 )
+from ufo2ft.util import compileGSUB
 
 logger = logging.getLogger(__name__)
 
 
-def parseLayoutFeatures(font):
+def parseLayoutFeatures(font, featuresCache=None):
     """Parse OpenType layout features in the UFO and return a
     feaLib.ast.FeatureFile instance.
+
+    If a LayoutFeaturesCache is provided, the features are only parsed if
+    the cache doesn't contain the same features already parsed for another
+    font, and a copy of the cached FeatureFile is returned.
     """
     featxt = font.features.text or ""
     if not featxt:
@@ -41,8 +51,12 @@ def parseLayoutFeatures(font):
         buf.name = os.path.join(ufoPath, "features.fea")
         includeDir = os.path.dirname(ufoPath)
     glyphNames = set(font.keys())
+    if featuresCache is not None:
+        doc = featuresCache.get(featxt, includeDir, glyphNames)
+        if doc is not None:
+            return doc
     try:
-        parser = Parser(buf, glyphNames, includeDir=includeDir)
+        parser = _Parser(buf, glyphNames, includeDir=includeDir)
         doc = parser.parse()
     except IncludedFeaNotFound as e:
         if ufoPath and os.path.exists(os.path.join(ufoPath, e.args[0])):
@@ -53,15 +67,134 @@ def parseLayoutFeatures(font):
                 "contained in it."
             )
         raise
+    if featuresCache is not None:
+        featuresCache.set(featxt, includeDir, glyphNames, doc, parser.includedFiles)
     return doc
 
 
+class _IncludingLexer(IncludingLexer):
+    # An IncludingLexer which records the paths of the included files.
+
+    def __init__(self, featurefile, *, includeDir=None):
+        self.includedFiles = []
+        super().__init__(featurefile, includeDir=includeDir)
+
+    def make_lexer_(self, file_or_path):
+        if not hasattr(file_or_path, "read"):
+            self.includedFiles.append(file_or_path)
+        return super().make_lexer_(file_or_path)
+
+
+class _Parser(Parser):
+    # A feaLib Parser which records the paths of the included files, even
+    # those which contain no statements.
+
+    def __init__(self, featurefile, glyphNames=(), includeDir=None):
+        # the Parser always creates its own lexer and reads the first token:
+        # start from an empty file, then read the features with our lexer
+        super().__init__(StringIO(), glyphNames, includeDir=includeDir)
+        self.lexer_ = _IncludingLexer(featurefile, includeDir=includeDir)
+        self.advance_lexer_(comments=True)
+
+    @property
+    def includedFiles(self):
+        return self.lexer_.includedFiles
+
+
+class LayoutFeaturesCache:
+    """Keep the feature files parsed by `parseLayoutFeatures`, so that the
+    fonts sharing the same features, like the masters of a designspace, are
+    parsed only once.
+
+    The entries are keyed by the features text, the include directory and the
+    set of glyph names. An entry is discarded when one of the files it
+    includes is modified.
+
+    Each lookup returns a new copy of the FeatureFile, which can be modified
+    by the feature writers. Note that the locations of its statements point
+    to the features of the first font that was parsed.
+
+    The cache also keeps the temporary GSUB tables which the feature writers
+    compile to close glyph sets over substitutions (see `compileGSUB`).
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._gsubTables = {}
+
+    def get(self, text, includeDir, glyphNames):
+        """Return a copy of the FeatureFile parsed from the same text,
+        or None.
+        """
+        key = (text, includeDir, frozenset(glyphNames))
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        featureFile, includedFiles = entry
+        if includedFiles != _statFiles(includedFiles):
+            logger.debug("Included feature files were modified")
+            del self._entries[key]
+            return None
+        return copy.deepcopy(featureFile)
+
+    def set(self, text, includeDir, glyphNames, featureFile, includedFiles=()):
+        """Store a copy of the FeatureFile parsed from the given text, and
+        the paths of the files it includes.
+        """
+        key = (text, includeDir, frozenset(glyphNames))
+        includedFiles = _statFiles(includedFiles)
+        self._entries[key] = (copy.deepcopy(featureFile), includedFiles)
+
+    def compileGSUB(self, featureFile, glyphOrder):
+        """Return a GSUB table compiled from the substitution rules of the
+        FeatureFile, or None if it has none.
+
+        The positioning rules are left out (see
+        `ufo2ft.featureWriters.ast.makeGSUBFeatureFile`), and the table is
+        only compiled again for different substitution rules or glyph order.
+        """
+        gsubFile = ast.makeGSUBFeatureFile(featureFile)
+        if gsubFile is None:
+            return None
+        key = (gsubFile.asFea(), tuple(glyphOrder))
+        if key not in self._gsubTables:
+            self._gsubTables[key] = compileGSUB(gsubFile, glyphOrder)
+        return self._gsubTables[key]
+
+
+def _statFiles(paths):
+    # Return a dict of (modification time, size) tuples keyed by file path,
+    # or None for files which can't be found.
+    result = {}
+    for path in paths:
+        if path in result:
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            result[path] = None
+        else:
+            result[path] = (st.st_mtime_ns, st.st_size)
+    return result
+
+
 class BaseFeatureCompiler:
     """Base class for generating OpenType features and compiling OpenType
     layout tables from these.
     """
 
-    def __init__(self, ufo, ttFont=None, glyphSet=None, **kwargs):
+    _gsubCache = None
+
+    def __init__(
+        self,
+        ufo,
+        ttFont=None,
+        glyphSet=None,
+        buildContext=None,
+        featuresCache=None,
+        variations=None,
+        **kwargs,
+    ):
         """
         Args:
           ufo: an object representing a UFO (defcon.Font or equivalent)
@@ -71,8 +204,18 @@ class BaseFeatureCompiler:
             the same glyph order as the ufo object.
           glyphSet: a (optional) dict containing pre-processed copies of
             the UFO glyphs.
+          buildContext: a (optional) BuildContext instance holding the data
+            derived from the glyphs which was already computed by the
+            outline compiler, e.g. the glyph order and the cmap.
+          featuresCache: a (optional) LayoutFeaturesCache instance where
+            the parsed features are shared with other fonts.
+          variations: a (optional) ufo2ft.variableFeatures.Variations
+            instance, with which the feature writers that support it
+            generate the features of a variable font from all its masters.
         """
         self.ufo = ufo
+        self.featuresCache = featuresCache
+        self.variations = variations
 
         if ttFont is None:
             from fontTools.ttLib import TTFont
@@ -84,11 +227,41 @@ class BaseFeatureCompiler:
         self.ttFont = ttFont
 
         glyphOrder = ttFont.getGlyphOrder()
-        if glyphSet is not None:
-            assert set(glyphOrder) == set(glyphSet.keys())
-        else:
-            glyphSet = ufo
-        self.glyphSet = OrderedDict((gn, glyphSet[gn]) for gn in glyphOrder)
+        if (
+            buildContext is None
+            or (glyphSet is not None and glyphSet is not buildContext.glyphSet)
+            or buildContext.glyphOrder != glyphOrder
+        ):
+            if glyphSet is not None:
+                assert set(glyphOrder) == set(glyphSet.keys())
+            else:
+                glyphSet = ufo
+            buildContext = BuildContext(ufo, glyphSet)
+            buildContext.glyphOrder = glyphOrder
+        # the feature writers use the character mapping of the ttFont, if any,
+        # instead of building the mapping from the UFO glyphs
+        if "cmap" in ttFont:
+            cmap = ttFont["cmap"].getBestCmap()
+            if cmap is not None:
+                buildContext.unicodeToGlyphNameMapping = cmap
+        self.buildContext = buildContext
+        self.glyphSet = buildContext.orderedGlyphSet
+
+    def compileGSUB(self, featureFile):
+        """Return a temporary GSUB table compiled from the substitution rules
+        of the FeatureFile with the glyph order of the ttFont, or None if
+        there are none. This is used by the feature writers that need to
+        close glyph sets over substitutions.
+
+        The tables are cached in the featuresCache, if any, so they are shared
+        with the other fonts using it; otherwise in this compiler.
+        """
+        featuresCache = self.featuresCache
+        if featuresCache is None:
+            if self._gsubCache is None:
+                self._gsubCache = LayoutFeaturesCache()
+            featuresCache = self._gsubCache
+        return featuresCache.compileGSUB(featureFile, self.ttFont.getGlyphOrder())
 
     def setupFeatures(self):
         """Make the features source.
@@ -149,6 +322,16 @@ class FeatureCompiler(BaseFeatureCompiler):
 
     defaultFeatureWriters = [KernFeatureWriter, MarkFeatureWriter]
 
+    # The feaLib FeatureFile generated by the feature writers is compiled
+    # directly, without formatting it as text and parsing it again, when all
+    # the writers only write valid AST objects (see the writers' attribute
+    # 'compilableStatements'). Subclasses can set this to False to always
+    # compile the features text instead.
+    compileFeatureFile = True
+
+    featureFile = None
+    _features = None
+
     def __init__(self, ufo, ttFont=None, glyphSet=None, featureWriters=None, **kwargs):
         """
         Args:
@@ -163,7 +346,7 @@ class FeatureCompiler(BaseFeatureCompiler):
             If the featureWriters list is empty, no automatic feature is
             generated and only pre-existing features are compiled.
         """
-        BaseFeatureCompiler.__init__(self, ufo, ttFont, glyphSet)
+        BaseFeatureCompiler.__init__(self, ufo, ttFont, glyphSet, **kwargs)
 
         self.initFeatureWriters(featureWriters)
 
@@ -216,20 +399,40 @@ class FeatureCompiler(BaseFeatureCompiler):
         in a different way if desired.
         """
         if self.featureWriters:
-            featureFile = parseLayoutFeatures(self.ufo)
+            featureFile = parseLayoutFeatures(self.ufo, self.featuresCache)
 
             for writer in self.featureWriters:
                 writer.write(self.ufo, featureFile, compiler=self)
 
-            # stringify AST to get correct line numbers in error messages
-            self.features = featureFile.asFea()
+            # the text is only generated if requested, see 'features'
+            self.features = None
+            self.featureFile = featureFile
         else:
             # no featureWriters, simply read existing features' text
             self.features = self.ufo.features.text or ""
 
+    @property
+    def features(self):
+        """The features source text.
+
+        When the features were generated by the feature writers, the text is
+        formatted from the FeatureFile on first access, e.g. when writing the
+        debug feature file.
+        """
+        if self._features is None and self.featureFile is not None:
+            self._features = self.featureFile.asFea()
+        return self._features
+
+    @features.setter
+    def features(self, value):
+        self._features = value
+        # the text replaces the FeatureFile as the features source
+        self.featureFile = None
+
     def writeFeatures(self, outfile):
-        if hasattr(self, "features"):
-            outfile.write(self.features)
+        features = self.features
+        if features is not None:
+            outfile.write(features)
 
     def buildTables(self):
         """
@@ -240,6 +443,27 @@ class FeatureCompiler(BaseFeatureCompiler):
         may override this method to handle the table compilation
         in a different way if desired.
         """
+        featureFile = self.featureFile
+        if (
+            featureFile is not None
+            and self.compileFeatureFile
+            and all(
+                getattr(writer, "compilableStatements", False)
+                for writer in self.featureWriters
+            )
+        ):
+            if not featureFile.statements:
+                return
+            try:
+                addOpenTypeFeatures(self.ttFont, featureFile)
+            except FeatureLibError:
+                # the generated statements have no location in the source:
+                # compile the features text saved for inspection, so that
+                # the error refers to a line of the temporary file
+                path = self._logFailedFeatures()
+                addOpenTypeFeaturesFromString(self.ttFont, self.features, filename=path)
+                raise
+            return
 
         if not self.features:
             return
@@ -252,13 +476,17 @@ class FeatureCompiler(BaseFeatureCompiler):
             addOpenTypeFeaturesFromString(self.ttFont, self.features, filename=path)
         except FeatureLibError:
             if path is None:
-                # if compilation fails, create temporary file for inspection
-                data = self.features.encode("utf-8")
-                with NamedTemporaryFile(delete=False) as tmp:
-                    tmp.write(data)
-                logger.error("Compilation failed! Inspect temporary file: %r", tmp.name)
+                self._logFailedFeatures()
             raise
 
+    def _logFailedFeatures(self):
+        # if compilation fails, create temporary file for inspection
+        data = self.features.encode("utf-8")
+        with NamedTemporaryFile(delete=False) as tmp:
+            tmp.write(data)
+        logger.error("Compilation failed! Inspect temporary file: %r", tmp.name)
+        return tmp.name
+
 
 class MtiFeatureCompiler(BaseFeatureCompiler):
     """Compile OpenType layout tables from MTI feature files using
@@ -2,6 +2,7 @@
 
 
 import collections
+import copy
 import re
 
 # we re-export here all the feaLib AST classes so they can be used from
@@ -127,8 +128,8 @@ def makeGlyphClassDefinitions(groups, feaFile=None, stripPrefix=""):
 
 
 def makeGlyphClassDefinition(className, members):
-    glyphNames = [ast.GlyphName(g) for g in members]
-    glyphClass = ast.GlyphClass(glyphNames)
+    # feaLib's GlyphClass holds the glyph names as strings
+    glyphClass = ast.GlyphClass(list(members))
     classDef = ast.GlyphClassDefinition(className, glyphClass)
     return classDef
 
@@ -215,3 +216,81 @@ def getGDEFGlyphClasses(feaLib):
                         else frozenset(),
                     )
     return _GDEFGlyphClasses(None, None, None, None)
+
+
+class PositioningRules(ast.Statement):
+    """Base class for statements holding many positioning rules at once,
+    which the feature writers build directly with the feaLib Builder rather
+    than making an AST statement for each rule.
+
+    Subclasses implement `build(builder)`, and `asFea` which returns the
+    equivalent rules in feature file syntax.
+    """
+
+
+_POSITIONING_STATEMENTS = (
+    PositioningRules,
+    ast.SinglePosStatement,
+    ast.PairPosStatement,
+    ast.CursivePosStatement,
+    ast.MarkBasePosStatement,
+    ast.MarkLigPosStatement,
+    ast.MarkMarkPosStatement,
+    ast.ChainContextPosStatement,
+)
+
+_SUBSTITUTION_STATEMENTS = (
+    ast.SingleSubstStatement,
+    ast.MultipleSubstStatement,
+    ast.AlternateSubstStatement,
+    ast.LigatureSubstStatement,
+    ast.ReverseChainSingleSubstStatement,
+    ast.ChainContextSubstStatement,
+)
+
+
+def hasSubstitutionRules(block):
+    """Return True if the block, or any of its nested blocks, contains
+    substitution rules.
+    """
+    return any(
+        isinstance(st, _SUBSTITUTION_STATEMENTS)
+        or (isinstance(st, ast.Block) and hasSubstitutionRules(st))
+        for st in block.statements
+    )
+
+
+def makeGSUBFeatureFile(feaFile):
+    """Return a copy of the FeatureFile without the positioning rules, i.e.
+    with only the statements needed to build its GSUB table, or None if the
+    feature file contains no substitution rules.
+
+    The blocks are shallow copies, and the statements are shared with the
+    original feature file. The references to lookups that are left empty
+    are removed.
+    """
+    emptyLookups = set()
+    result = ast.FeatureFile()
+    result.statements, hasRules = _filterGSUBStatements(feaFile, emptyLookups)
+    return result if hasRules else None
+
+
+def _filterGSUBStatements(block, emptyLookups):
+    statements = []
+    hasRules = False
+    for st in block.statements:
+        if isinstance(st, _POSITIONING_STATEMENTS):
+            continue
+        if isinstance(st, ast.LookupReferenceStatement):
+            if st.lookup.name in emptyLookups:
+                continue
+        elif isinstance(st, _SUBSTITUTION_STATEMENTS):
+            hasRules = True
+        elif isinstance(st, ast.Block):
+            st = copy.copy(st)
+            st.statements, blockHasRules = _filterGSUBStatements(st, emptyLookups)
+            if isinstance(st, ast.LookupBlock) and not blockHasRules:
+                emptyLookups.add(st.name)
+            hasRules = hasRules or blockHasRules
+        statements.append(st)
+    return statements, hasRules
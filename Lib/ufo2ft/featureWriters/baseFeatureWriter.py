@@ -1,5 +1,9 @@
+import io
 import logging
+import pickle
+import re
 from collections import OrderedDict
+from inspect import isclass
 from types import SimpleNamespace
 
 from ufo2ft.errors import InvalidFeaturesData
@@ -31,6 +35,24 @@ class BaseFeatureWriter:
     The `options` class attribute contains a mapping of option
     names with their default values. These can be overridden on an
     instance by passing keyword arguments to the constructor.
+
+    Writers which set the `supportsVariations` class attribute to True can
+    generate the features of a variable font from all its masters at once,
+    instead of running for each master (see `getVariations`).
+
+    Writers which set the `compilableStatements` class attribute to True
+    only write valid feaLib AST objects (e.g. with the helpers of the
+    ufo2ft.featureWriters.ast module), which the FeatureCompiler can compile
+    without formatting the feature file as text (see `compileFeatureFile`).
+
+    The 'cache' constructor argument (the path of a directory, or a
+    ufo2ft.cache.FileCache instance) enables the cache of the generated
+    statements, for the writers which define the fingerprint of their inputs
+    (see `getCacheKeyParts`): when the inputs didn't change since a previous
+    build, the statements are inserted again without being generated. The
+    entries are pickled, and only the classes of the feaLib AST and of the
+    feature writers' modules can be loaded from them. The features of
+    variable fonts are not cached.
     """
 
     tableTag = None
@@ -38,10 +60,13 @@ class BaseFeatureWriter:
     mode = "skip"
     insertFeatureMarker = INSERT_FEATURE_MARKER
     options = {}
+    supportsVariations = False
+    compilableStatements = False
+    cache = None
 
     _SUPPORTED_MODES = frozenset(["skip", "append"])
 
-    def __init__(self, features=None, mode=None, **kwargs):
+    def __init__(self, features=None, mode=None, cache=None, **kwargs):
         if features is not None:
             features = frozenset(features)
             assert features, "features cannot be empty"
@@ -55,6 +80,9 @@ class BaseFeatureWriter:
         if self.mode not in self._SUPPORTED_MODES:
             raise ValueError(self.mode)
 
+        if cache is not None:
+            self.cache = cache
+
         options = dict(self.__class__.options)
         for k in kwargs:
             if k not in options:
@@ -81,6 +109,12 @@ class BaseFeatureWriter:
 
         Returns the context namespace instance.
         """
+        context = self.__dict__.pop("_baseContext", None)
+        if context is not None:
+            # already set to compute the cache key (see '_run')
+            self.context = context
+            return context
+
         todo = set(self.features)
         insertComments = None
         if self.mode == "skip":
@@ -122,14 +156,142 @@ class BaseFeatureWriter:
         Returns True if feature file was modified, False if no new features
         were generated.
         """
-        self.setContext(font, feaFile, compiler=compiler)
+        return self._run(font, feaFile, compiler)
+
+    def _run(self, font, feaFile, compiler=None):
+        # Set the context and run _write, or insert again the statements
+        # which were cached in a previous run with the same inputs.
+        cache = key = None
+        if self.cache is not None:
+            from ufo2ft.cache import FileCache
+
+            cache = self.cache
+            if not isinstance(cache, FileCache):
+                cache = self.cache = FileCache(cache)
+            # the key is computed with the base context only, so that the
+            # data of the subclasses' context is not collected on a cache hit
+            baseContext = BaseFeatureWriter.setContext(
+                self, font, feaFile, compiler=compiler
+            )
+            try:
+                parts = None
+                if self.context.todo and self.getVariations() is None:
+                    parts = self.getCacheKeyParts()
+                if parts is not None:
+                    key = FileCache.makeKey(*parts)
+                    objects = _getFeatureFileObjects(feaFile)
+                    entry = self._getCacheEntry(cache, key, objects)
+                    if entry is not None:
+                        self.log.info("Reusing generated features from cache")
+                        modified, inserts = entry
+                        for kwargs in inserts:
+                            self._insertCached(feaFile, kwargs)
+                        return modified
+            finally:
+                del self.context
+            # on a cache miss, the subclass' context extends the base context
+            self._baseContext = baseContext
+
         try:
-            if self.shouldContinue():
-                return self._write()
-            else:
-                return False
+            self.setContext(font, feaFile, compiler=compiler)
+            if key is not None:
+                inserts = self.context.cacheInserts = []
+            modified = bool(self.shouldContinue() and self._write())
+            if key is not None:
+                self._setCacheEntry(cache, key, objects, (modified, inserts))
+            return modified
         finally:
-            del self.context
+            self.__dict__.pop("_baseContext", None)
+            if hasattr(self, "context"):
+                del self.context
+
+    def _getCacheEntry(self, cache, key, objects):
+        data = cache.get(key)
+        if data is None:
+            return None
+        # the objects of the feature file, referenced by the statements, are
+        # stored as their kind and name (see _getFeatureFileObjects)
+        unpickler = _CacheUnpickler(io.BytesIO(data), type(self).__module__)
+        unpickler.persistent_load = objects.__getitem__
+        try:
+            return unpickler.load()
+        except Exception as e:
+            self.log.warning("Failed to load cached features: %s", e)
+            return None
+
+    def _setCacheEntry(self, cache, key, objects, entry):
+        names = {id(obj): name for name, obj in objects.items()}
+        stream = io.BytesIO()
+        pickler = pickle.Pickler(stream, protocol=pickle.HIGHEST_PROTOCOL)
+        pickler.persistent_id = lambda obj: names.get(id(obj))
+        try:
+            pickler.dump(entry)
+        except Exception as e:
+            self.log.warning("Failed to cache generated features: %s", e)
+            return
+        cache.set(key, stream.getvalue())
+
+    def _insertCached(self, feaFile, kwargs):
+        # the mark classes are added to the feature file when their
+        # definitions are generated, before they are inserted
+        for markClassDef in kwargs["markClassDefs"] or ():
+            markClass = markClassDef.markClass
+            if markClassDef not in markClass.definitions:
+                markClass.addDefinition(markClassDef)
+            feaFile.markClasses.setdefault(markClass.name, markClass)
+        self._insert(feaFile, **kwargs)
+
+    def getCacheKeyParts(self):
+        """Return a list of str or bytes, the fingerprint of all the inputs
+        of the features generated for the current font, from which the key
+        of the cached statements is computed; or None if they must not be
+        cached.
+
+        This is called with the context set by `BaseFeatureWriter.setContext`,
+        not by the subclass. The default implementation returns None:
+        subclasses which support the cache add the font data which they read
+        to the parts returned by `getBaseCacheKeyParts`.
+        """
+        return None
+
+    def getBaseCacheKeyParts(self):
+        """Return the parts of the cache key common to all the writers: the
+        versions of ufo2ft and fontTools, the class and the settings of the
+        writer, the glyph order, the cmap, the UFO's features, and what the
+        writers read from the current feature file: the names it defines,
+        its mark classes, language systems, GDEF glyph classes and
+        substitution rules.
+
+        The statements generated by the other writers are not part of the
+        key, except for the names and the substitutions which they define.
+        """
+        from fontTools import version as fontToolsVersion
+
+        from ufo2ft import __version__
+
+        cls = type(self)
+        feaFile = self.context.feaFile
+        cmap = self.makeUnicodeToGlyphNameMapping()
+        markClasses = [
+            (name, [d.asFea() for d in markClass.definitions])
+            for name, markClass in sorted(feaFile.markClasses.items())
+        ]
+        return [
+            __version__,
+            fontToolsVersion,
+            f"{cls.__module__}.{cls.__qualname__}",
+            self.mode,
+            repr(sorted(self.context.todo)),
+            repr(sorted(vars(self.options).items())),
+            " ".join(self.getOrderedGlyphSet().keys()),
+            repr(sorted(cmap.items())),
+            self.context.font.features.text or "",
+            repr(sorted(_getFeatureFileObjects(feaFile))),
+            repr(markClasses),
+            repr(ast.getScriptLanguageSystems(feaFile)),
+            repr([sorted(glyphs or ()) for glyphs in self.getGDEFGlyphClasses()]),
+            _getSubstitutionsText(feaFile),
+        ]
 
     def _write(self):
         """Subclasses must override this."""
@@ -151,7 +313,20 @@ class BaseFeatureWriter:
         If the insert marker is at the top of a feature block, the feature is
         inserted before that block, and after if the insert marker is at the
         bottom.
+
+        When the cache is enabled, the statements are also recorded in the
+        cache entry.
         """
+        inserts = dict(
+            classDefs=classDefs,
+            anchorDefs=anchorDefs,
+            markClassDefs=markClassDefs,
+            lookups=lookups,
+            features=features,
+        )
+        cacheInserts = getattr(self.context, "cacheInserts", None)
+        if cacheInserts is not None:
+            cacheInserts.append(inserts)
 
         statements = feaFile.statements
 
@@ -248,24 +423,30 @@ class BaseFeatureWriter:
 
     def makeUnicodeToGlyphNameMapping(self):
         """Return the Unicode to glyph name mapping for the current font."""
-        # Try to get the "best" Unicode cmap subtable if this writer is running
+        # Use the mapping shared by the build context if this writer is running
         # in the context of a FeatureCompiler, else create a new mapping from
         # the UFO glyphs
-        compiler = self.context.compiler
-        cmap = None
-        if compiler is not None:
-            table = compiler.ttFont.get("cmap")
-            if table is not None:
-                cmap = table.getBestCmap()
-        if cmap is None:
-            from ufo2ft.util import makeUnicodeToGlyphNameMapping
-
-            if compiler is not None:
-                glyphSet = compiler.glyphSet
-            else:
-                glyphSet = self.context.font
-            cmap = makeUnicodeToGlyphNameMapping(glyphSet)
-        return cmap
+        buildContext = self.getBuildContext()
+        if buildContext is not None:
+            return buildContext.unicodeToGlyphNameMapping
+
+        from ufo2ft.util import makeUnicodeToGlyphNameMapping
+
+        return makeUnicodeToGlyphNameMapping(self.context.font)
+
+    def getUnicodeCoverage(self):
+        """Return a UnicodeCoverageIndex for the current font's Unicode to
+        glyph name mapping.
+        """
+        # The index is shared through the build context, so that the Unicode
+        # properties it computes are reused by all the writers.
+        buildContext = self.getBuildContext()
+        if buildContext is not None:
+            return buildContext.unicodeCoverage
+
+        from ufo2ft.util import UnicodeCoverageIndex
+
+        return UnicodeCoverageIndex(self.makeUnicodeToGlyphNameMapping())
 
     def getOrderedGlyphSet(self):
         """Return OrderedDict[glyphName, glyph] sorted by glyphOrder."""
@@ -284,25 +465,134 @@ class BaseFeatureWriter:
         glyphOrder = makeOfficialGlyphOrder(glyphSet, font.glyphOrder)
         return OrderedDict((gn, glyphSet[gn]) for gn in glyphOrder)
 
+    def getGDEFGlyphClasses(self):
+        """Return the GDEF GlyphClassDef base/mark/ligature/component glyphs
+        defined in the current feature file (see ast.getGDEFGlyphClasses).
+        """
+        feaFile = self.context.feaFile
+        buildContext = self.getBuildContext()
+        if buildContext is not None:
+            return buildContext.getGDEFGlyphClasses(feaFile)
+        return ast.getGDEFGlyphClasses(feaFile)
+
+    def getBuildContext(self):
+        """Return the BuildContext of the current FeatureCompiler, or None
+        if this writer is not running in the context of a FeatureCompiler.
+        """
+        return getattr(self.context.compiler, "buildContext", None)
+
+    def getVariations(self):
+        """Return the Variations of the masters when generating the features
+        of a variable font from all its masters (see ufo2ft.variableFeatures),
+        or None when generating the features of a single font.
+        """
+        return getattr(self.context.compiler, "variations", None)
+
     def compileGSUB(self):
-        """Compile a temporary GSUB table from the current feature file."""
+        """Compile a temporary GSUB table from the substitution rules of the
+        current feature file. Return None if there are no substitutions.
+
+        When running in the context of a FeatureCompiler, the table is cached
+        by the latter (see `BaseFeatureCompiler.compileGSUB`), so it is not
+        compiled again by other writers, or for other fonts sharing the same
+        substitution rules and glyph order.
+        """
         from ufo2ft.util import compileGSUB
 
+        feaFile = self.context.feaFile
         compiler = self.context.compiler
         if compiler is not None:
-            # The result is cached in the compiler instance, so if another
-            # writer requests one it is not compiled again.
-            if hasattr(compiler, "_gsub"):
-                return compiler._gsub
-
+            if hasattr(compiler, "compileGSUB"):
+                return compiler.compileGSUB(feaFile)
             glyphOrder = compiler.ttFont.getGlyphOrder()
         else:
             # the 'real' glyph order doesn't matter because the table is not
             # compiled to binary, only the glyph names are used
             glyphOrder = sorted(self.context.font.keys())
 
-        gsub = compileGSUB(self.context.feaFile, glyphOrder)
-
-        if compiler and not hasattr(compiler, "_gsub"):
-            compiler._gsub = gsub
-        return gsub
+        gsubFile = ast.makeGSUBFeatureFile(feaFile)
+        if gsubFile is None:
+            return None
+        return compileGSUB(gsubFile, glyphOrder)
+
+
+class _CacheUnpickler(pickle.Unpickler):
+    # Only load the classes of the statements and of the objects which the
+    # feature writers generate, so that a tampered cache entry can't call
+    # arbitrary functions.
+
+    _SAFE_GLOBALS = frozenset(
+        [
+            ("builtins", "set"),
+            ("builtins", "frozenset"),
+            ("collections", "OrderedDict"),
+            ("array", "array"),
+            ("array", "_array_reconstructor"),
+        ]
+    )
+
+    def __init__(self, file, writerModule):
+        super().__init__(file)
+        self.writerModule = writerModule
+
+    def find_class(self, module, name):
+        if (module, name) in self._SAFE_GLOBALS:
+            return super().find_class(module, name)
+        isWriterModule = module == self.writerModule or module.startswith(
+            "ufo2ft.featureWriters."
+        )
+        if isWriterModule or module == "fontTools.feaLib.ast":
+            cls = super().find_class(module, name)
+            if isclass(cls) and cls.__module__ == module:
+                return cls
+        raise pickle.UnpicklingError(f"global '{module}.{name}' is forbidden")
+
+
+def _getFeatureFileObjects(feaFile):
+    # Return the named objects of the feature file, which the generated
+    # statements may reference, keyed by their kind and name: the glyph class
+    # definitions and the lookups, recursively, and the mark classes.
+    objects = {}
+
+    def addStatements(block):
+        for statement in block.statements:
+            if isinstance(statement, ast.GlyphClassDefinition):
+                objects["glyphClass", statement.name] = statement
+            elif isinstance(statement, ast.LookupBlock):
+                objects["lookup", statement.name] = statement
+            if hasattr(statement, "statements"):
+                addStatements(statement)
+
+    addStatements(feaFile)
+    for name, markClass in feaFile.markClasses.items():
+        objects["markClass", name] = markClass
+    return objects
+
+
+def _getSubstitutionsText(feaFile):
+    # Return the text of the blocks of the feature file which contain
+    # substitution rules, and of the glyph classes which they use, e.g. to
+    # compute a cache key without formatting the positioning rules.
+    gsubFile = ast.makeGSUBFeatureFile(feaFile)
+    if gsubFile is None:
+        return ""
+    classDefs = {}
+    blocks = []
+    for statement in gsubFile.statements:
+        if isinstance(statement, ast.GlyphClassDefinition):
+            classDefs[statement.name] = statement.asFea()
+        elif isinstance(statement, ast.Block) and ast.hasSubstitutionRules(statement):
+            blocks.append(statement.asFea())
+    # the glyph classes used by the blocks, and by those classes
+    lines = []
+    names = set(_CLASS_NAME_RE.findall("".join(blocks)))
+    while names:
+        name = names.pop()
+        text = classDefs.pop(name, None)
+        if text is not None:
+            lines.append(text)
+            names.update(_CLASS_NAME_RE.findall(text))
+    return "\n".join(sorted(lines) + blocks)
+
+
+_CLASS_NAME_RE = re.compile(r"@([A-Za-z_0-9.\-]+)")
@@ -1,10 +1,18 @@
+import itertools
+import logging
+from array import array
 from types import SimpleNamespace
 
 from fontTools import unicodedata
 from fontTools.misc.fixedTools import otRound
+from fontTools.otlLib.builder import PairPosBuilder, buildValue
+from fontTools.ufoLib.kerning import lookupKerningValue
+from fontTools.varLib.builder import buildVarDevTable
 
 from ufo2ft.featureWriters import BaseFeatureWriter, ast
-from ufo2ft.util import classifyGlyphs
+from ufo2ft.variableFeatures import NO_VARIATION_INDEX
+
+logger = logging.getLogger(__name__)
 
 SIDE1_PREFIX = "public.kern1."
 SIDE2_PREFIX = "public.kern2."
@@ -106,11 +114,21 @@ DIST_ENABLED_SCRIPTS = {
 DFLT_SCRIPTS = {"Zyyy", "Zinh"}
 
 
+def scriptOrNone(script):
+    """Return the script code, or None for the neutral scripts."""
+    if script in DFLT_SCRIPTS:
+        return None
+    return script
+
+
 def unicodeScriptDirection(uv):
-    sc = unicodedata.script(chr(uv))
-    if sc in DFLT_SCRIPTS:
+    return scriptDirection(unicodedata.script(chr(uv)))
+
+
+def scriptDirection(script):
+    if script in DFLT_SCRIPTS:
         return None
-    return unicodedata.script_horizontal_direction(sc)
+    return unicodedata.script_horizontal_direction(script)
 
 
 RTL_BIDI_TYPES = {"R", "AL"}
@@ -121,8 +139,13 @@ def unicodeBidiType(uv):
     """Return "R" for characters with RTL direction, or "L" for LTR (whether
     'strong' or 'weak'), or None for neutral direction.
     """
-    char = chr(uv)
-    bidiType = unicodedata.bidirectional(char)
+    return bidiTypeDirection(unicodedata.bidirectional(chr(uv)))
+
+
+def bidiTypeDirection(bidiType):
+    """Same as `unicodeBidiType`, but takes a Unicode bidirectional type
+    instead of a codepoint.
+    """
     if bidiType in RTL_BIDI_TYPES:
         return "R"
     elif bidiType in LTR_BIDI_TYPES:
@@ -131,28 +154,218 @@ def unicodeBidiType(uv):
         return None
 
 
-class KerningPair:
+# bit flags for the 'directions' and 'bidiTypes' of the kerning pairs
+DIRECTION_FLAGS = {"LTR": 1, "RTL": 2}
+BIDI_TYPE_FLAGS = {"L": 1, "R": 2}
+PAIR_FLAGS = {"directions": DIRECTION_FLAGS, "bidiTypes": BIDI_TYPE_FLAGS}
+
+
+def _flagsToKeys(flags, keyFlags):
+    return {key for key, flag in keyFlags.items() if flags & flag}
+
+
+def _keysToFlags(keys, keyFlags):
+    flags = 0
+    for key in keys:
+        flags |= keyFlags[key]
+    return flags
+
+
+def _sideGlyphs(side):
+    """Return the set of glyph names of a side of a KerningPair."""
+    if isinstance(side, ast.GlyphClassName):
+        return set(side.glyphSet())
+    return {side.glyph}
+
+
+def _sideKey(side):
+    """Return a hashable key for a side of a KerningPair: the glyph name, or
+    the definition of the class (which is shared by all the pairs using it).
+    """
+    if isinstance(side, ast.GlyphClassName):
+        return side.glyphclass
+    return side.glyph
+
+
+def _makeSide(side):
+    if isinstance(side, str):
+        return ast.GlyphName(side)
+    elif isinstance(side, ast.GlyphClassDefinition):
+        return ast.GlyphClassName(side)
+    elif isinstance(side, (ast.GlyphName, ast.GlyphClassName)):
+        return side
+    raise AssertionError(side)
 
-    __slots__ = ("side1", "side2", "value", "directions", "bidiTypes")
 
-    def __init__(self, side1, side2, value, directions=None, bidiTypes=None):
-        if isinstance(side1, str):
-            self.side1 = ast.GlyphName(side1)
-        elif isinstance(side1, ast.GlyphClassDefinition):
-            self.side1 = ast.GlyphClassName(side1)
+def optimizeKerning(kerning, side1Groups, side2Groups, groupKey=None):
+    """Return a (kerning, side1Groups, side2Groups) tuple with new dicts
+    containing the same kerning as the given ones, with fewer pairs and
+    classes once compiled:
+
+    - the pairs whose value (once rounded) is the same as the value they
+      override (or zero), are removed, i.e. redundant exceptions, zero-valued
+      class pairs and zero-valued glyph pairs that don't override anything;
+    - the side1 (or side2) groups that kern with the same values against
+      the same side2 (or side1) glyphs and groups are merged, keeping the
+      name of the first one.
+
+    If 'groupKey' is provided, it is called with the list of glyphs of each
+    group, and only the groups with the same key are merged, e.g. so that
+    the pairs of groups of different directions, or of marks and bases,
+    still go in different lookups.
+
+    The groups must only contain glyphs belonging to a single group, and
+    their keys must have the UFO3 'public.kern{1,2}.' prefixes.
+    """
+    sizeBefore = _estimateKerningSize(kerning, side1Groups, side2Groups)
+    kerning = {pair: value for pair, value in kerning.items()}
+    numPairs = len(kerning)
+    groupOf1 = {
+        glyph: name for name, members in side1Groups.items() for glyph in members
+    }
+    groupOf2 = {
+        glyph: name for name, members in side2Groups.items() for glyph in members
+    }
+
+    def value(side1, side2):
+        return otRound(kerning.get((side1, side2), 0))
+
+    def fallback(side1, side2):
+        # the value of the first less specific pair in the order of the UFO
+        # kerning lookup, for a glyph-glyph or group-glyph pair
+        if side1 in side1Groups:
+            candidates = [(side1, groupOf2.get(side2))]
         else:
-            raise AssertionError(side1)
+            group1, group2 = groupOf1.get(side1), groupOf2.get(side2)
+            candidates = [(side1, group2), (group1, side2), (group1, group2)]
+        for pair in candidates:
+            if None not in pair and pair in kerning:
+                return otRound(kerning[pair])
+        return 0
+
+    def isRedundant(side1, side2):
+        v = value(side1, side2)
+        if side1 in side1Groups and side2 in side2Groups:
+            return v == 0
+        if side1 not in side1Groups and side2 in side2Groups:
+            # a glyph-group exception must give the same value to all the
+            # side2 glyphs which don't have their own exception
+            group1 = groupOf1.get(side1)
+            for glyph in side2Groups[side2]:
+                if (side1, glyph) in kerning:
+                    continue
+                if group1 is None:
+                    if v != 0:
+                        return False
+                elif (group1, glyph) in kerning:
+                    if v != value(group1, glyph):
+                        return False
+                elif v != value(group1, side2):
+                    return False
+            return True
+        return v == fallback(side1, side2)
+
+    # from the least to the most specific pairs, so that the fallback values
+    # are final when the more specific pairs are checked
+    def specificity(pair):
+        side1, side2 = pair
+        return (side1 not in side1Groups) * 2 + (side2 not in side2Groups)
+
+    for pair in sorted(kerning, key=specificity):
+        if isRedundant(*pair):
+            del kerning[pair]
 
-        if isinstance(side2, str):
-            self.side2 = ast.GlyphName(side2)
-        elif isinstance(side2, ast.GlyphClassDefinition):
-            self.side2 = ast.GlyphClassName(side2)
+    side1Groups, numMerged1 = _mergeKerningGroups(kerning, side1Groups, 0, groupKey)
+    side2Groups, numMerged2 = _mergeKerningGroups(kerning, side2Groups, 1, groupKey)
+
+    logger.info(
+        "Optimized kerning: %d pairs removed, %d side1 and %d side2 classes "
+        "merged, about %d bytes saved",
+        numPairs - len(kerning),
+        numMerged1,
+        numMerged2,
+        sizeBefore - _estimateKerningSize(kerning, side1Groups, side2Groups),
+    )
+    return kerning, side1Groups, side2Groups
+
+
+def _mergeKerningGroups(kerning, groups, side, groupKey=None):
+    # Merge the groups with identical kerning against the other side, i.e.
+    # the same rows (side=0) or columns (side=1), and the same 'groupKey'.
+    # Update 'kerning' in-place and return the new groups and the number of
+    # groups merged.
+    other = 1 - side
+    kernings = {}
+    for pair, value in kerning.items():
+        if pair[side] in groups:
+            kernings.setdefault(pair[side], {})[pair[other]] = otRound(value)
+    byKerning = {}
+    for name in sorted(kernings):
+        key = frozenset(kernings[name].items())
+        if groupKey is not None:
+            key = (groupKey(groups[name]), key)
+        byKerning.setdefault(key, []).append(name)
+    renamed = {}
+    newGroups = dict(groups)
+    for names in byKerning.values():
+        first = names[0]
+        for name in names[1:]:
+            renamed[name] = first
+            newGroups[first] = newGroups[first] + newGroups.pop(name)
+    if renamed:
+        for pair in [pair for pair in kerning if pair[side] in renamed]:
+            value = kerning.pop(pair)
+            newPair = list(pair)
+            newPair[side] = renamed[pair[side]]
+            kerning[tuple(newPair)] = value
+    return newGroups, len(renamed)
+
+
+def _estimateKerningSize(kerning, side1Groups, side2Groups):
+    # Return an estimate of the size in bytes of the PairPos subtables of
+    # the kerning: a pair value record for each pair of glyphs, and a single
+    # class-based subtable for the pairs of groups.
+    glyphPairCount = 0
+    classes1, classes2 = set(), set()
+    for side1, side2 in kerning:
+        if side1 in side1Groups and side2 in side2Groups:
+            classes1.add(side1)
+            classes2.add(side2)
         else:
-            raise AssertionError(side2)
+            glyphPairCount += len(side1Groups.get(side1, (side1,))) * len(
+                side2Groups.get(side2, (side2,))
+            )
+    size = 4 * glyphPairCount
+    if classes1:
+        size += _estimateClassPairPosSize(
+            len(classes1),
+            len(classes2),
+            sum(len(side1Groups[name]) for name in classes1),
+            sum(len(side2Groups[name]) for name in classes2),
+            2,
+        )
+    return size
+
+
+class KerningPair:
 
+    __slots__ = ("side1", "side2", "value", "directions", "bidiTypes", "varIdx")
+
+    def __init__(
+        self,
+        side1,
+        side2,
+        value,
+        directions=None,
+        bidiTypes=None,
+        varIdx=NO_VARIATION_INDEX,
+    ):
+        self.side1 = _makeSide(side1)
+        self.side2 = _makeSide(side2)
         self.value = value
         self.directions = directions or set()
         self.bidiTypes = bidiTypes or set()
+        self.varIdx = varIdx
 
     @property
     def firstIsClass(self):
@@ -164,17 +377,7 @@ class KerningPair:
 
     @property
     def glyphs(self):
-        if self.firstIsClass:
-            classDef1 = self.side1.glyphclass
-            glyphs1 = {g.asFea() for g in classDef1.glyphSet()}
-        else:
-            glyphs1 = {self.side1.asFea()}
-        if self.secondIsClass:
-            classDef2 = self.side2.glyphclass
-            glyphs2 = {g.asFea() for g in classDef2.glyphSet()}
-        else:
-            glyphs2 = {self.side2.asFea()}
-        return glyphs1 | glyphs2
+        return _sideGlyphs(self.side1) | _sideGlyphs(self.side2)
 
     def __repr__(self):
         return "<{} {} {} {}{}{}>".format(
@@ -187,6 +390,288 @@ class KerningPair:
         )
 
 
+class ExcludeDirections:
+    """An 'exclude' callable for KernFeatureWriter._makeKerningLookup,
+    testing only the directions of the kerning pairs.
+
+    'testFlags' is called with the DIRECTION_FLAGS of a pair, and returns
+    True to exclude it. Like any 'exclude' callable, the instance can also
+    be called with a KerningPair.
+    """
+
+    def __init__(self, testFlags):
+        self.testFlags = testFlags
+
+    def __call__(self, pair):
+        return bool(self.testFlags(_keysToFlags(pair.directions, DIRECTION_FLAGS)))
+
+
+class KerningPairs:
+    """A compact list of kerning pairs, stored as columns.
+
+    The sides of the pairs (ast.GlyphName or ast.GlyphClassName) are stored
+    once in the 'sides' list, and referenced by index in the 'side1' and
+    'side2' arrays. The 'values' are rounded to integers, and 'directions'
+    and 'bidiTypes' are bit flags (see DIRECTION_FLAGS and BIDI_TYPE_FLAGS).
+    In a variable font, 'varIdxs' are the indices of the deltas of the
+    values in the variation store, or NO_VARIATION_INDEX.
+
+    Indexing or iterating returns KerningPair objects, which are made on the
+    fly: modifying them doesn't change the list. A slice returns a new
+    KerningPairs.
+    """
+
+    def __init__(self):
+        self.sides = []
+        self._sideIndices = {}
+        self.side1 = array("i")
+        self.side2 = array("i")
+        self.values = array("i")
+        self.directions = bytearray()
+        self.bidiTypes = bytearray()
+        self.varIdxs = array("L")
+
+    def addSide(self, side):
+        """Return the index of the side (glyph name, glyph class definition,
+        or the respective AST reference) in 'sides', adding it if missing.
+        """
+        side = _makeSide(side)
+        key = _sideKey(side)
+        index = self._sideIndices.get(key)
+        if index is None:
+            index = self._sideIndices[key] = len(self.sides)
+            self.sides.append(side)
+        return index
+
+    def append(
+        self,
+        side1,
+        side2,
+        value,
+        directions=0,
+        bidiTypes=0,
+        varIdx=NO_VARIATION_INDEX,
+    ):
+        self.side1.append(self.addSide(side1))
+        self.side2.append(self.addSide(side2))
+        self.values.append(otRound(value))
+        self.directions.append(directions)
+        self.bidiTypes.append(bidiTypes)
+        self.varIdxs.append(varIdx)
+
+    @classmethod
+    def fromPairs(cls, pairs):
+        """Return a new KerningPairs with the given KerningPair objects."""
+        result = cls()
+        for pair in pairs:
+            result.append(
+                pair.side1,
+                pair.side2,
+                pair.value,
+                _keysToFlags(pair.directions, DIRECTION_FLAGS),
+                _keysToFlags(pair.bidiTypes, BIDI_TYPE_FLAGS),
+                pair.varIdx,
+            )
+        return result
+
+    def subset(self, indices):
+        """Return a new KerningPairs with the pairs at the given indices,
+        sharing the same sides.
+        """
+        result = self.__class__.__new__(self.__class__)
+        result.sides = self.sides
+        result._sideIndices = self._sideIndices
+        result.side1 = array("i", [self.side1[i] for i in indices])
+        result.side2 = array("i", [self.side2[i] for i in indices])
+        result.values = array("i", [self.values[i] for i in indices])
+        result.directions = bytearray(self.directions[i] for i in indices)
+        result.bidiTypes = bytearray(self.bidiTypes[i] for i in indices)
+        result.varIdxs = array("L", [self.varIdxs[i] for i in indices])
+        return result
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.subset(range(len(self))[index])
+        return KerningPair(
+            self.sides[self.side1[index]],
+            self.sides[self.side2[index]],
+            self.values[index],
+            _flagsToKeys(self.directions[index], DIRECTION_FLAGS),
+            _flagsToKeys(self.bidiTypes[index], BIDI_TYPE_FLAGS),
+            self.varIdxs[index],
+        )
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# The class pairs of a lookup are split into several subtables before the
+# estimated size of a subtable exceeds this: the offsets to its coverage and
+# class definitions, which follow the class value records, are 16-bit.
+MAX_CLASS_PAIR_POS_SIZE = 0xFFFF
+
+
+def _estimateClassPairPosSize(
+    class1Count, class2Count, glyph1Count, glyph2Count, valueSize
+):
+    """Return an upper estimate of the size in bytes of a class-based PairPos
+    subtable (format 2), for the given number of first and second classes,
+    of glyphs in those classes, and of bytes per value record.
+    """
+    return (
+        16  # header
+        # the class value records, including class 0 for the second glyphs
+        + class1Count * (class2Count + 1) * valueSize
+        # coverage (format 1)
+        + 4
+        + 2 * glyph1Count
+        # class definitions (format 2, one range per glyph at most)
+        + 4
+        + 6 * glyph1Count
+        + 4
+        + 6 * glyph2Count
+    )
+
+
+def _classPairSide1(rule):
+    side1, side2 = rule[:2]
+    if isinstance(side1, ast.GlyphClassName) and isinstance(side2, ast.GlyphClassName):
+        return side1
+    return None
+
+
+class KerningRules(ast.PositioningRules):
+    """The pair positioning rules for a KerningPairs list, which feaLib
+    builds directly from the pairs. If 'rtl' is True, the values adjust both
+    the placement and the advance, except for the pairs with LTR bidi types
+    (numbers are always shaped LTR even in RTL scripts).
+
+    In a variable font, the values of the pairs with a variation index vary
+    with VariationIndex device tables. All the value records then have the
+    device table offsets, so that all the class pairs with the same first
+    class stay in the same subtable.
+    """
+
+    def __init__(self, pairs, rtl=False, location=None):
+        super().__init__(location)
+        self.pairs = pairs
+        self.rtl = rtl
+        self.variable = any(i != NO_VARIATION_INDEX for i in pairs.varIdxs)
+
+    def iterRules(self):
+        """Yield a (side1, side2, value, rtl, varIdx) tuple for each pair, and
+        None where the class pairs must continue in a new subtable.
+
+        The class pairs are split before the estimated size of their subtable
+        exceeds MAX_CLASS_PAIR_POS_SIZE, so that the lookup compiles without
+        overflows. All the class pairs with the same first class stay in the
+        same subtable, otherwise the pairs of the later subtables would never
+        be applied for its glyphs.
+        """
+        class1Count = glyph1Count = glyph2Count = valueSize = 0
+        classes2 = set()
+        for side1, rules in itertools.groupby(self._iterPairs(), _classPairSide1):
+            if side1 is None:
+                yield from rules
+                continue
+            rules = list(rules)
+            ruleClasses2 = {rule[1] for rule in rules}
+            ruleValueSize = max(self._valueSize(*rule[2:]) for rule in rules)
+            newClasses2 = ruleClasses2.difference(classes2)
+            size = _estimateClassPairPosSize(
+                class1Count + 1,
+                len(classes2) + len(newClasses2),
+                glyph1Count + len(side1.glyphSet()),
+                glyph2Count + sum(len(side2.glyphSet()) for side2 in newClasses2),
+                max(valueSize, ruleValueSize),
+            )
+            if class1Count and size > MAX_CLASS_PAIR_POS_SIZE:
+                yield None
+                class1Count = glyph1Count = glyph2Count = valueSize = 0
+                classes2 = set()
+                newClasses2 = ruleClasses2
+            class1Count += 1
+            classes2.update(newClasses2)
+            glyph1Count += len(side1.glyphSet())
+            glyph2Count += sum(len(side2.glyphSet()) for side2 in newClasses2)
+            valueSize = max(valueSize, ruleValueSize)
+            yield from rules
+
+    def _iterPairs(self):
+        pairs = self.pairs
+        sides = pairs.sides
+        ltrFlag = BIDI_TYPE_FLAGS["L"]
+        for side1, side2, value, bidiTypes, varIdx in zip(
+            pairs.side1, pairs.side2, pairs.values, pairs.bidiTypes, pairs.varIdxs
+        ):
+            rtl = self.rtl and not bidiTypes & ltrFlag
+            yield sides[side1], sides[side2], value, rtl, varIdx
+
+    @staticmethod
+    def _valueFields(value, rtl, varIdx):
+        # same as the value records that feaLib makes for the rules
+        if rtl and (value or varIdx != NO_VARIATION_INDEX):
+            return ("XPlacement", "XAdvance")
+        return ("XAdvance",)
+
+    def _valueSize(self, value, rtl, varIdx):
+        size = 2 * len(self._valueFields(value, rtl, varIdx))
+        if self.variable:
+            # the device table offsets
+            size *= 2
+        return size
+
+    def _buildValue(self, value, rtl, varIdx):
+        fields = self._valueFields(value, rtl, varIdx)
+        valueRecord = buildValue(dict.fromkeys(fields, value))
+        if self.variable:
+            device = None
+            if varIdx != NO_VARIATION_INDEX:
+                device = buildVarDevTable(varIdx)
+            for field in fields:
+                setattr(valueRecord, field[:4] + "Device", device)
+        return valueRecord
+
+    def build(self, builder):
+        location = self.location
+        lookup = builder.get_lookup_(location, PairPosBuilder)
+        valueRecords = {}
+        for rule in self.iterRules():
+            if rule is None:
+                lookup.add_subtable_break(location)
+                continue
+            side1, side2 = rule[:2]
+            valueKey = rule[2:]
+            valueRecord = valueRecords.get(valueKey)
+            if valueRecord is None:
+                valueRecord = valueRecords[valueKey] = self._buildValue(*valueKey)
+            firstIsClass = isinstance(side1, ast.GlyphClassName)
+            secondIsClass = isinstance(side2, ast.GlyphClassName)
+            if firstIsClass ^ secondIsClass:
+                # enumerated pair
+                for glyph1, glyph2 in itertools.product(
+                    side1.glyphSet(), side2.glyphSet()
+                ):
+                    lookup.addGlyphPair(location, glyph1, valueRecord, glyph2, None)
+            elif firstIsClass:
+                lookup.addClassPair(
+                    location, side1.glyphSet(), valueRecord, side2.glyphSet(), None
+                )
+            else:
+                lookup.addGlyphPair(
+                    location, side1.glyph, valueRecord, side2.glyph, None
+                )
+
+    def asFea(self, indent=""):
+        return ("\n" + indent).join(
+            KernFeatureWriter._makeRule(rule).asFea() for rule in self.iterRules()
+        )
+
+
 class KernFeatureWriter(BaseFeatureWriter):
     """Generates a kerning feature based on groups and rules contained
     in an UFO's kerning data.
@@ -195,22 +680,96 @@ class KernFeatureWriter(BaseFeatureWriter):
     2) "skip" (default) will not write anything if the features are already present;
     1) "append" will add additional lookups to an existing feature, if present,
        or it will add a new one at the end of all features.
+
+    With the "optimizeKerning" option, the kerning is simplified before
+    generating the lookups (see `optimizeKerning`): the exceptions which
+    don't change the kerning are dropped, and the kerning classes with the
+    same kerning are merged.
+
+    With the "directBuild" option, each kerning lookup contains a single
+    KerningRules statement instead of one PairPosStatement per pair, and
+    feaLib builds the PairPos subtables directly from the kerning pairs.
+    The lookups keep the same names, and the feature file text is the same.
+
+    With the "scriptLookups" option, the pairs which can only occur in the
+    runs of a single script go in separate lookups (named after the Unicode
+    script code, e.g. "kern_Latn"), which are only registered for the
+    'languagesystem' statements of that script, so the shapers don't have
+    to go through them for the text in other scripts. The scripts of the
+    glyphs are those of the characters in the cmap, extended over the GSUB
+    substitutions. The pairs of neutral glyphs only, of several scripts, or
+    of scripts without 'languagesystem' stay in the shared lookups. All the
+    pairs with the same first glyphs go in the same lookup, so that the
+    exceptions are still applied instead of the class pairs.
+
+    For a variable font, the writer can generate the kerning from all the
+    masters at once (see ufo2ft.variableFeatures): the pairs are those of
+    any master, with the classes of the default master, and the values of
+    the pairs missing in a master are looked up through its groups. The
+    lookups are built directly (as with "directBuild"), with the values of
+    the default master, and VariationIndex device tables for the values
+    which vary. The "optimizeKerning" option is then ignored.
     """
 
     tableTag = "GPOS"
     features = frozenset(["kern", "dist"])
-    options = dict(ignoreMarks=True)
+    options = dict(
+        ignoreMarks=True, directBuild=False, optimizeKerning=False, scriptLookups=False
+    )
+    supportsVariations = True
+    compilableStatements = True
 
     def setContext(self, font, feaFile, compiler=None):
         ctx = super().setContext(font, feaFile, compiler=compiler)
-        ctx.gdefClasses = ast.getGDEFGlyphClasses(feaFile)
-        ctx.kerning = self.getKerningData(font, feaFile, self.getOrderedGlyphSet())
+        ctx.gdefClasses = self.getGDEFGlyphClasses()
+        ctx.variations = self.getVariations()
+        optimize = self.options.optimizeKerning and ctx.variations is None
+        ctx.kerning = self.getKerningData(
+            font,
+            feaFile,
+            self.getOrderedGlyphSet(),
+            optimize=optimize,
+            variations=ctx.variations,
+            groupKey=self._makeKerningGroupKey() if optimize else None,
+        )
 
-        feaScripts = ast.getScriptLanguageSystems(feaFile)
-        ctx.scriptGroups = self._groupScriptsByTagAndDirection(feaScripts)
+        ctx.feaScripts = ast.getScriptLanguageSystems(feaFile)
+        ctx.scriptGroups = self._groupScriptsByTagAndDirection(ctx.feaScripts)
 
         return ctx
 
+    def _makeKerningGroupKey(self):
+        """Return the 'groupKey' function for `optimizeKerning`: the groups
+        are only merged if their glyphs have the same script directions,
+        bidi types and mark status (and scripts, with the "scriptLookups"
+        option), so that their pairs go in the same lookups as before.
+        """
+        glyphProperties = {}
+
+        def addProperty(name, glyphSets):
+            for key, glyphs in glyphSets.items():
+                for glyph in glyphs:
+                    glyphProperties.setdefault(glyph, set()).add((name, key))
+
+        coverage = self.getUnicodeCoverage()
+        if any(scriptDirection(sc) == "RTL" for sc in coverage.values("script")):
+            gsub = self.compileGSUB()
+            addProperty("direction", coverage.classify("script", scriptDirection, gsub))
+            addProperty(
+                "bidiType", coverage.classify("bidiType", bidiTypeDirection, gsub)
+            )
+        if self.options.scriptLookups:
+            gsub = self.compileGSUB()
+            addProperty("script", coverage.classify("script", scriptOrNone, gsub))
+        marks = self.context.gdefClasses.mark
+        if marks:
+            addProperty("mark", {True: marks})
+
+        def groupKey(glyphs):
+            return frozenset().union(*(glyphProperties.get(g, ()) for g in glyphs))
+
+        return groupKey
+
     def shouldContinue(self):
         if not self.context.kerning.pairs:
             self.log.debug("No kerning data; skipped")
@@ -225,6 +784,14 @@ class KernFeatureWriter(BaseFeatureWriter):
 
         return super().shouldContinue()
 
+    def getCacheKeyParts(self):
+        font = self.context.font
+        parts = self.getBaseCacheKeyParts()
+        parts.append(" ".join(sorted(font.keys())))
+        parts.append(repr(sorted((k, list(v)) for k, v in font.groups.items())))
+        parts.append(repr(sorted(font.kerning.items())))
+        return parts
+
     def _write(self):
         lookups = self._makeKerningLookups()
         if not lookups:
@@ -259,9 +826,52 @@ class KernFeatureWriter(BaseFeatureWriter):
         return True
 
     @classmethod
-    def getKerningData(cls, font, feaFile=None, glyphSet=None):
-        side1Classes, side2Classes = cls.getKerningClasses(font, feaFile, glyphSet)
-        pairs = cls.getKerningPairs(font, side1Classes, side2Classes, glyphSet)
+    def getKerningData(
+        cls,
+        font,
+        feaFile=None,
+        glyphSet=None,
+        optimize=False,
+        variations=None,
+        groupKey=None,
+    ):
+        if variations is not None:
+            side1Classes, side2Classes = cls.getKerningClasses(font, feaFile, glyphSet)
+            pairs = cls.getKerningPairs(
+                font,
+                side1Classes,
+                side2Classes,
+                glyphSet,
+                kerning=cls.getMasterKerning(variations.fonts),
+                variations=variations,
+            )
+        elif not optimize:
+            side1Classes, side2Classes = cls.getKerningClasses(font, feaFile, glyphSet)
+            pairs = cls.getKerningPairs(font, side1Classes, side2Classes, glyphSet)
+        else:
+            side1Groups, side2Groups = cls.getKerningGroups(font, glyphSet)
+            kerning, side1Groups, side2Groups = optimizeKerning(
+                font.kerning, side1Groups, side2Groups, groupKey
+            )
+            side1Classes = ast.makeGlyphClassDefinitions(
+                side1Groups, feaFile, stripPrefix="public."
+            )
+            side2Classes = ast.makeGlyphClassDefinitions(
+                side2Groups, feaFile, stripPrefix="public."
+            )
+            pairs = cls.getKerningPairs(
+                font, side1Classes, side2Classes, glyphSet, kerning=kerning
+            )
+        if not isinstance(pairs, KerningPairs):
+            import warnings
+
+            warnings.warn(
+                "getKerningPairs should return a KerningPairs instance; "
+                "support for lists of KerningPair is deprecated",
+                category=DeprecationWarning,
+                stacklevel=2,
+            )
+            pairs = KerningPairs.fromPairs(pairs)
         return SimpleNamespace(
             side1Classes=side1Classes, side2Classes=side2Classes, pairs=pairs
         )
@@ -299,14 +909,55 @@ class KernFeatureWriter(BaseFeatureWriter):
         return side1Classes, side2Classes
 
     @staticmethod
-    def getKerningPairs(font, side1Classes, side2Classes, glyphSet=None):
+    def getMasterKerning(fonts):
+        """Return the kerning of all the masters of a variable font: a dict
+        of the pairs of any master, with a tuple of the values of each master
+        in the order of 'fonts'. The pairs missing in a master are looked up
+        through its groups, like the UFO specification describes.
+        """
+        masters = []
+        for font in fonts:
+            glyphToFirstGroup = {}
+            glyphToSecondGroup = {}
+            for name, members in font.groups.items():
+                if name.startswith(SIDE1_PREFIX):
+                    glyphToFirstGroup.update(dict.fromkeys(members, name))
+                elif name.startswith(SIDE2_PREFIX):
+                    glyphToSecondGroup.update(dict.fromkeys(members, name))
+            # the arguments of lookupKerningValue after the pair
+            masters.append(
+                (font.kerning, font.groups, 0, glyphToFirstGroup, glyphToSecondGroup)
+            )
+        kerning = {}
+        for font in fonts:
+            for pair in font.kerning.keys():
+                if pair not in kerning:
+                    kerning[pair] = tuple(
+                        lookupKerningValue(pair, *master) for master in masters
+                    )
+        return kerning
+
+    @staticmethod
+    def getKerningPairs(
+        font, side1Classes, side2Classes, glyphSet=None, kerning=None, variations=None
+    ):
+        """Return the KerningPairs of the font's kerning, or of 'kerning' if
+        given, sorted with the glyph pairs first.
+
+        This used to return a list of KerningPair objects: the returned
+        KerningPairs can still be iterated and indexed like that list, but
+        it can't be modified in place. Subclasses overriding this method and
+        returning a list are deprecated: the list is converted, with a
+        DeprecationWarning.
+        """
         if glyphSet:
             allGlyphs = set(glyphSet.keys())
         else:
             allGlyphs = set(font.keys())
-        kerning = font.kerning
+        if kerning is None:
+            kerning = font.kerning
 
-        pairsByFlags = {}
+        pairs = []
         for (side1, side2) in kerning:
             # filter out pairs that reference missing groups or glyphs
             if side1 not in side1Classes and side1 not in allGlyphs:
@@ -314,31 +965,52 @@ class KernFeatureWriter(BaseFeatureWriter):
             if side2 not in side2Classes and side2 not in allGlyphs:
                 continue
             flags = (side1 in side1Classes, side2 in side2Classes)
-            pairsByFlags.setdefault(flags, set()).add((side1, side2))
-
-        result = []
-        for flags, pairs in sorted(pairsByFlags.items()):
-            for side1, side2 in sorted(pairs):
-                value = kerning[side1, side2]
-                if all(flags) and value == 0:
-                    # ignore zero-valued class kern pairs
-                    continue
-                firstIsClass, secondIsClass = flags
-                if firstIsClass:
-                    side1 = side1Classes[side1]
-                if secondIsClass:
-                    side2 = side2Classes[side2]
-                result.append(KerningPair(side1, side2, value))
+            pairs.append((flags, side1, side2))
+        # sort glyph pairs first, then glyph-class, class-glyph and class-class
+        pairs.sort()
+
+        result = KerningPairs()
+        for flags, side1, side2 in pairs:
+            value = kerning[side1, side2]
+            varIdx = NO_VARIATION_INDEX
+            if variations is not None:
+                # the values of all the masters (see getMasterKerning)
+                value, varIdx = variations.storeMasterValues(value)
+            if all(flags) and value == 0 and varIdx == NO_VARIATION_INDEX:
+                # ignore zero-valued class kern pairs
+                continue
+            firstIsClass, secondIsClass = flags
+            if firstIsClass:
+                side1 = side1Classes[side1]
+            if secondIsClass:
+                side2 = side2Classes[side2]
+            result.append(side1, side2, value, varIdx=varIdx)
         return result
 
     def _intersectPairs(self, attribute, glyphSets):
-        allKeys = set()
-        for pair in self.context.kerning.pairs:
-            for key, glyphs in glyphSets.items():
-                if not pair.glyphs.isdisjoint(glyphs):
-                    getattr(pair, attribute).add(key)
-                    allKeys.add(key)
-        return allKeys
+        # index the flags of the sets each glyph belongs to, then compute the
+        # flags of each side (glyph or class) only once for all the pairs
+        keyFlags = PAIR_FLAGS[attribute]
+        flagsByGlyph = {}
+        for key, glyphs in glyphSets.items():
+            flag = keyFlags[key]
+            for glyph in glyphs:
+                flagsByGlyph[glyph] = flagsByGlyph.get(glyph, 0) | flag
+        pairs = self.context.kerning.pairs
+        sideFlags = []
+        for side in pairs.sides:
+            flags = 0
+            for glyph in _sideGlyphs(side):
+                flags |= flagsByGlyph.get(glyph, 0)
+            sideFlags.append(flags)
+        column = getattr(pairs, attribute)
+        allFlags = 0
+        for i, (side1, side2) in enumerate(zip(pairs.side1, pairs.side2)):
+            flags = sideFlags[side1] | sideFlags[side2]
+            if flags:
+                column[i] |= flags
+                allFlags |= flags
+        return _flagsToKeys(allFlags, keyFlags)
 
     @staticmethod
     def _groupScriptsByTagAndDirection(feaScripts):
@@ -359,12 +1031,10 @@ class KernFeatureWriter(BaseFeatureWriter):
         return scriptGroups
 
     @staticmethod
-    def _makePairPosRule(pair, rtl=False):
-        enumerated = pair.firstIsClass ^ pair.secondIsClass
-        value = otRound(pair.value)
-        if rtl and "L" in pair.bidiTypes:
-            # numbers are always shaped LTR even in RTL scripts
-            rtl = False
+    def _makePairPosRule(side1, side2, value, rtl=False):
+        enumerated = isinstance(side1, ast.GlyphClassName) ^ isinstance(
+            side2, ast.GlyphClassName
+        )
         valuerecord = ast.ValueRecord(
             xPlacement=value if rtl else None,
             yPlacement=0 if rtl else None,
@@ -372,75 +1042,125 @@ class KernFeatureWriter(BaseFeatureWriter):
             yAdvance=0 if rtl else None,
         )
         return ast.PairPosStatement(
-            glyphs1=pair.side1,
+            glyphs1=side1,
             valuerecord1=valuerecord,
-            glyphs2=pair.side2,
+            glyphs2=side2,
             valuerecord2=None,
             enumerated=enumerated,
         )
 
+    @classmethod
+    def _makeRule(cls, rule):
+        # 'rule' is one of the items yielded by KerningRules.iterRules; the
+        # feature syntax has no variable values, so a variable font's rules
+        # have the values of the default master
+        if rule is None:
+            return ast.SubtableStatement()
+        side1, side2, value, rtl, _ = rule
+        return cls._makePairPosRule(side1, side2, value, rtl)
+
     def _makeKerningLookup(
         self, name, pairs, exclude=None, rtl=False, ignoreMarks=True
     ):
+        # 'exclude' is called with each KerningPair; for an ExcludeDirections,
+        # only the direction flags of the pairs are tested
         assert pairs
-        rules = []
-        for pair in pairs:
-            if exclude is not None and exclude(pair):
-                self.log.debug("pair excluded from '%s' lookup: %r", name, pair)
+        logExcluded = self.log.isEnabledFor(logging.DEBUG)
+        if isinstance(exclude, ExcludeDirections):
+            excluded = [exclude.testFlags(flags) for flags in pairs.directions]
+        elif exclude is not None:
+            excluded = [exclude(pair) for pair in pairs]
+        else:
+            excluded = [False] * len(pairs)
+        indices = []
+        for i, isExcluded in enumerate(excluded):
+            if isExcluded:
+                if logExcluded:
+                    self.log.debug("pair excluded from '%s' lookup: %r", name, pairs[i])
                 continue
-            rules.append(self._makePairPosRule(pair, rtl=rtl))
-        if rules:
-            lookup = ast.LookupBlock(name)
-            if ignoreMarks and self.options.ignoreMarks:
-                lookup.statements.append(ast.makeLookupFlag("IgnoreMarks"))
-            lookup.statements.extend(rules)
-            return lookup
+            indices.append(i)
+        if not indices:
+            return None
+        if len(indices) < len(pairs):
+            pairs = pairs.subset(indices)
+        if self.options.directBuild or self.context.variations is not None:
+            rules = [KerningRules(pairs, rtl=rtl)]
+        else:
+            rules = [
+                self._makeRule(rule)
+                for rule in KerningRules(pairs, rtl=rtl).iterRules()
+            ]
+        lookup = ast.LookupBlock(name)
+        if ignoreMarks and self.options.ignoreMarks:
+            lookup.statements.append(ast.makeLookupFlag("IgnoreMarks"))
+        lookup.statements.extend(rules)
+        return lookup
 
     def _makeKerningLookups(self):
-        cmap = self.makeUnicodeToGlyphNameMapping()
-        if any(unicodeScriptDirection(uv) == "RTL" for uv in cmap):
+        coverage = self.getUnicodeCoverage()
+        if any(scriptDirection(sc) == "RTL" for sc in coverage.values("script")):
             # If there are any characters from globally RTL scripts in the
             # cmap, we compile a temporary GSUB table to resolve substitutions
             # and group glyphs by script horizontal direction and bidirectional
             # type. We then mark each kerning pair with these properties when
             # any of the glyphs involved in a pair intersects these groups.
             gsub = self.compileGSUB()
-            dirGlyphs = classifyGlyphs(unicodeScriptDirection, cmap, gsub)
+            dirGlyphs = coverage.classify("script", scriptDirection, gsub)
             directions = self._intersectPairs("directions", dirGlyphs)
             shouldSplit = "RTL" in directions
             if shouldSplit:
-                bidiGlyphs = classifyGlyphs(unicodeBidiType, cmap, gsub)
+                bidiGlyphs = coverage.classify("bidiType", bidiTypeDirection, gsub)
                 self._intersectPairs("bidiTypes", bidiGlyphs)
         else:
             shouldSplit = False
 
         marks = self.context.gdefClasses.mark
+        # the lookups are keyed by direction ("DFLT", "LTR" or "RTL"), and by
+        # Unicode script code for the scriptLookups option
         lookups = {}
+        pairs = self.context.kerning.pairs
         if shouldSplit:
-            # make one DFLT lookup with script-agnostic characters, and two
-            # LTR/RTL lookups excluding pairs from the opposite group.
             # We drop kerning pairs with ambiguous direction: i.e. those containing
             # glyphs from scripts with different overall horizontal direction, or
             # glyphs with incompatible bidirectional type (e.g. arabic letters vs
             # arabic numerals).
-            pairs = []
-            for pair in self.context.kerning.pairs:
-                if ("RTL" in pair.directions and "LTR" in pair.directions) or (
-                    "R" in pair.bidiTypes and "L" in pair.bidiTypes
+            ambiguousDirections = DIRECTION_FLAGS["LTR"] | DIRECTION_FLAGS["RTL"]
+            ambiguousBidiTypes = BIDI_TYPE_FLAGS["L"] | BIDI_TYPE_FLAGS["R"]
+            indices = []
+            for i, (directions, bidiTypes) in enumerate(
+                zip(pairs.directions, pairs.bidiTypes)
+            ):
+                if (
+                    directions & ambiguousDirections == ambiguousDirections
+                    or bidiTypes & ambiguousBidiTypes == ambiguousBidiTypes
                 ):
                     self.log.warning(
-                        "skipped kern pair with ambiguous direction: %r", pair
+                        "skipped kern pair with ambiguous direction: %r", pairs[i]
                     )
                     continue
-                pairs.append(pair)
-            if not pairs:
+                indices.append(i)
+            if not indices:
                 return lookups
+            if len(indices) < len(pairs):
+                pairs = pairs.subset(indices)
 
+        if self.options.scriptLookups:
+            pairs, pairsByScript = self._splitScriptPairs(pairs)
+            for script, scriptPairs in sorted(pairsByScript.items()):
+                self._makeScriptKernLookups(lookups, script, scriptPairs)
+
+        if not pairs:
+            # all the pairs went in the lookups of the scriptLookups option
+            return lookups
+        if shouldSplit:
+            # make one DFLT lookup with script-agnostic characters, and two
+            # LTR/RTL lookups excluding pairs from the opposite group.
             if self.options.ignoreMarks:
                 # If there are pairs with a mix of mark/base then the IgnoreMarks
                 # flag is unnecessary and should not be set
                 basePairs, markPairs = self._splitBaseAndMarkPairs(pairs, marks)
-                self._makeSplitDirectionKernLookups(lookups, basePairs)
+                if basePairs:
+                    self._makeSplitDirectionKernLookups(lookups, basePairs)
                 if markPairs:
                     self._makeSplitDirectionKernLookups(
                         lookups, markPairs, ignoreMarks=False, suffix="_marks"
@@ -450,39 +1170,122 @@ class KernFeatureWriter(BaseFeatureWriter):
         else:
             # only make a single (implicitly LTR) lookup including all base/base pairs
             # and a single lookup including all base/mark pairs (if any)
-            pairs = self.context.kerning.pairs
-            if self.options.ignoreMarks:
-                basePairs, markPairs = self._splitBaseAndMarkPairs(pairs, marks)
-                lookups["LTR"] = [self._makeKerningLookup("kern_ltr", basePairs)]
-                if markPairs:
-                    lookups["LTR"].append(
-                        self._makeKerningLookup(
-                            "kern_ltr_marks", markPairs, ignoreMarks=False
-                        )
+            self._makeScriptKernLookups(lookups, "LTR", pairs, name="kern_ltr")
+        return lookups
+
+    def _makeScriptKernLookups(self, lookups, key, pairs, name=None, rtl=False):
+        if name is None:
+            name = "kern_" + key
+            rtl = scriptDirection(key) == "RTL"
+        if self.options.ignoreMarks:
+            basePairs, markPairs = self._splitBaseAndMarkPairs(
+                pairs, self.context.gdefClasses.mark
+            )
+            if basePairs or not markPairs:
+                lookups.setdefault(key, []).append(
+                    self._makeKerningLookup(name, basePairs, rtl=rtl)
+                )
+            if markPairs:
+                lookups.setdefault(key, []).append(
+                    self._makeKerningLookup(
+                        name + "_marks", markPairs, rtl=rtl, ignoreMarks=False
                     )
+                )
+        else:
+            lookups.setdefault(key, []).append(
+                self._makeKerningLookup(name, pairs, rtl=rtl)
+            )
+
+    def _splitScriptPairs(self, pairs):
+        """Return the pairs which stay in the shared lookups, and a dictionary
+        of the pairs which only occur in the runs of one script, keyed by its
+        Unicode script code.
+        """
+        todo = self.context.todo
+        scripts = {
+            script
+            for script in self.context.feaScripts
+            if ("dist" if script in DIST_ENABLED_SCRIPTS else "kern") in todo
+        }
+        if not scripts:
+            return pairs, {}
+        glyphSets = self.getUnicodeCoverage().classify(
+            "script", scriptOrNone, self.compileGSUB()
+        )
+        glyphScripts = {}
+        for script, glyphs in glyphSets.items():
+            for glyph in glyphs:
+                glyphScripts.setdefault(glyph, set()).add(script)
+        sides = pairs.sides
+        sideScripts = [
+            set().union(*(glyphScripts.get(g, ()) for g in _sideGlyphs(side)))
+            for side in sides
+        ]
+        # the pairs whose first glyphs intersect must go in the same lookup,
+        # so that a pair never applies on top of an exception to it: the first
+        # glyphs go with their class, which is the same for all the pairs
+        classOfGlyph = {}
+        for i in set(pairs.side1):
+            if isinstance(sides[i], ast.GlyphClassName):
+                for glyph in sides[i].glyphSet():
+                    classOfGlyph[glyph] = i
+        pairClusters = []
+        clusterScripts = {}
+        for side1, side2 in zip(pairs.side1, pairs.side2):
+            side = sides[side1]
+            if isinstance(side, ast.GlyphName):
+                cluster = classOfGlyph.get(side.glyph, side1)
             else:
-                lookups["LTR"] = [self._makeKerningLookup("kern_ltr", pairs)]
-        return lookups
+                cluster = side1
+            pairClusters.append(cluster)
+            pairScripts = sideScripts[side1] | sideScripts[side2]
+            if len(pairScripts) != 1:
+                # neutral glyphs only, or several scripts
+                clusterScripts[cluster] = None
+            elif clusterScripts.get(cluster, pairScripts) != pairScripts:
+                clusterScripts[cluster] = None
+            else:
+                clusterScripts[cluster] = pairScripts
+        sharedIndices = []
+        indicesByScript = {}
+        for i, cluster in enumerate(pairClusters):
+            clusterScript = clusterScripts[cluster]
+            if clusterScript is not None and not clusterScript.isdisjoint(scripts):
+                (script,) = clusterScript
+                indicesByScript.setdefault(script, []).append(i)
+            else:
+                sharedIndices.append(i)
+        return (
+            pairs.subset(sharedIndices),
+            {
+                script: pairs.subset(indices)
+                for script, indices in indicesByScript.items()
+            },
+        )
 
     def _splitBaseAndMarkPairs(self, pairs, marks):
-        basePairs, markPairs = [], []
-        if marks:
-            for pair in pairs:
-                if any(glyph in marks for glyph in pair.glyphs):
-                    markPairs.append(pair)
-                else:
-                    basePairs.append(pair)
-        else:
-            basePairs[:] = pairs
-        return basePairs, markPairs
+        if not marks:
+            return pairs, pairs.subset(())
+        # check each side (glyph or class) for marks only once
+        sideHasMarks = [not marks.isdisjoint(_sideGlyphs(side)) for side in pairs.sides]
+        baseIndices, markIndices = [], []
+        for i, (side1, side2) in enumerate(zip(pairs.side1, pairs.side2)):
+            if sideHasMarks[side1] or sideHasMarks[side2]:
+                markIndices.append(i)
+            else:
+                baseIndices.append(i)
+        if not markIndices:
+            return pairs, pairs.subset(())
+        return pairs.subset(baseIndices), pairs.subset(markIndices)
 
     def _makeSplitDirectionKernLookups(
         self, lookups, pairs, ignoreMarks=True, suffix=""
     ):
+        ltrFlag, rtlFlag = DIRECTION_FLAGS["LTR"], DIRECTION_FLAGS["RTL"]
         dfltKern = self._makeKerningLookup(
             "kern_dflt" + suffix,
             pairs,
-            exclude=(lambda pair: {"LTR", "RTL"}.intersection(pair.directions)),
+            exclude=ExcludeDirections(lambda directions: directions),
             rtl=False,
             ignoreMarks=ignoreMarks,
         )
@@ -492,7 +1295,9 @@ class KernFeatureWriter(BaseFeatureWriter):
         ltrKern = self._makeKerningLookup(
             "kern_ltr" + suffix,
             pairs,
-            exclude=(lambda pair: not pair.directions or "RTL" in pair.directions),
+            exclude=ExcludeDirections(
+                lambda directions: not directions or directions & rtlFlag
+            ),
             rtl=False,
             ignoreMarks=ignoreMarks,
         )
@@ -502,7 +1307,9 @@ class KernFeatureWriter(BaseFeatureWriter):
         rtlKern = self._makeKerningLookup(
             "kern_rtl" + suffix,
             pairs,
-            exclude=(lambda pair: not pair.directions or "LTR" in pair.directions),
+            exclude=ExcludeDirections(
+                lambda directions: not directions or directions & ltrFlag
+            ),
             rtl=True,
             ignoreMarks=ignoreMarks,
         )
@@ -514,11 +1321,13 @@ class KernFeatureWriter(BaseFeatureWriter):
         if "kern" in self.context.todo:
             kern = ast.FeatureBlock("kern")
             self._registerKernLookups(kern, lookups)
+            self._registerScriptLookups(kern, lookups)
             if kern.statements:
                 features["kern"] = kern
         if "dist" in self.context.todo:
             dist = ast.FeatureBlock("dist")
             self._registerDistLookups(dist, lookups)
+            self._registerScriptLookups(dist, lookups)
             if dist.statements:
                 features["dist"] = dist
         return features
@@ -574,6 +1383,14 @@ class KernFeatureWriter(BaseFeatureWriter):
                 for script, langs in rtlScripts:
                     ast.addLookupReferences(feature, rtlLookups, script, langs)
 
+    def _registerScriptLookups(self, feature, lookups):
+        # the lookups of the scriptLookups option for the feature's scripts
+        isDist = feature.name == "dist"
+        for script, scriptLangSys in self.context.feaScripts.items():
+            if script in lookups and (script in DIST_ENABLED_SCRIPTS) == isDist:
+                for otScript, langs in scriptLangSys:
+                    ast.addLookupReferences(feature, lookups[script], otScript, langs)
+
     def _registerDistLookups(self, feature, lookups):
         scripts = self.context.scriptGroups["dist"]
         ltrLookups = lookups.get("LTR")
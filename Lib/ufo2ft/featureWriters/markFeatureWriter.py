@@ -1,13 +1,58 @@
 import itertools
+import logging
 import re
 from collections import OrderedDict, defaultdict
 from functools import partial
 
+from fontTools.feaLib.builder import makeOpenTypeAnchor
+from fontTools.feaLib.error import FeatureLibError
 from fontTools.misc.fixedTools import otRound
-
+from fontTools.otlLib.builder import (
+    MarkBasePosBuilder,
+    MarkLigPosBuilder,
+    MarkMarkPosBuilder,
+    buildAnchor,
+)
+from fontTools.varLib.builder import buildVarDevTable
+
+from ufo2ft.errors import InvalidFontData
 from ufo2ft.featureWriters import BaseFeatureWriter, ast
 from ufo2ft.fontInfoData import getAttrWithFallback
-from ufo2ft.util import classifyGlyphs, unicodeInScripts
+from ufo2ft.util import _LazyFontName, scriptExtensionsInScripts
+from ufo2ft.variableFeatures import NO_VARIATION_INDEX
+
+
+class VariableAnchor(ast.Anchor):
+    """An anchor whose coordinates vary in a variable font: 'xVarIdx' and
+    'yVarIdx' are the indices of their deltas in the variation store, or
+    NO_VARIATION_INDEX. The feature syntax has no variable anchors, so the
+    text has the coordinates of the default master.
+    """
+
+    def __init__(
+        self, x, y, xVarIdx=NO_VARIATION_INDEX, yVarIdx=NO_VARIATION_INDEX, **kwargs
+    ):
+        super().__init__(x, y, **kwargs)
+        self.xVarIdx = xVarIdx
+        self.yVarIdx = yVarIdx
+
+
+def _buildAnchor(x, y, xVarIdx=NO_VARIATION_INDEX, yVarIdx=NO_VARIATION_INDEX):
+    # an otTables.Anchor, with VariationIndex device tables for the
+    # coordinates which vary
+    deviceX = deviceY = None
+    if xVarIdx != NO_VARIATION_INDEX:
+        deviceX = buildVarDevTable(xVarIdx)
+    if yVarIdx != NO_VARIATION_INDEX:
+        deviceY = buildVarDevTable(yVarIdx)
+    return buildAnchor(x, y, deviceX=deviceX, deviceY=deviceY)
+
+
+def _makeOpenTypeAnchor(anchor):
+    # same as feaLib's makeOpenTypeAnchor, which doesn't know VariableAnchor
+    if isinstance(anchor, VariableAnchor):
+        return _buildAnchor(anchor.x, anchor.y, anchor.xVarIdx, anchor.yVarIdx)
+    return makeOpenTypeAnchor(anchor)
 
 
 class AbstractMarkPos:
@@ -44,10 +89,25 @@ class AbstractMarkPos:
         marks = self._filterMarks(include)
         return self.__class__(self.name, marks) if any(marks) else None
 
+    def iterAnchors(self):
+        """Yield the NamedAnchor objects of all the marks."""
+        return iter(self.marks)
+
+    def groupMarks(self, key):
+        """Return a dict of objects for the same glyph, one per distinct
+        value of 'key' (a callable taking a NamedAnchor) for the marks, with
+        the marks for that value. This is the same as calling 'filter' for
+        each value, with a single pass over the marks.
+        """
+        groups = {}
+        for anchor in self.marks:
+            groups.setdefault(key(anchor), []).append(anchor)
+        return {k: self.__class__(self.name, marks) for k, marks in groups.items()}
+
     def getMarkGlyphToMarkClasses(self):
         """Return a list of pairs (markGlyph, markClasses)."""
         markGlyphToMarkClasses = defaultdict(set)
-        for namedAnchor in self.marks:
+        for namedAnchor in self.iterAnchors():
             for markGlyph in namedAnchor.markClass.glyphs:
                 markGlyphToMarkClasses[markGlyph].add(namedAnchor.markClass.name)
         return markGlyphToMarkClasses.items()
@@ -56,16 +116,19 @@ class AbstractMarkPos:
 class MarkToBasePos(AbstractMarkPos):
 
     Statement = ast.MarkBasePosStatement
+    LookupBuilder = MarkBasePosBuilder
 
 
 class MarkToMarkPos(AbstractMarkPos):
 
     Statement = ast.MarkMarkPosStatement
+    LookupBuilder = MarkMarkPosBuilder
 
 
 class MarkToLigaPos(AbstractMarkPos):
 
     Statement = ast.MarkLigPosStatement
+    LookupBuilder = MarkLigPosBuilder
 
     def _filterMarks(self, include):
         return [
@@ -82,14 +145,93 @@ class MarkToLigaPos(AbstractMarkPos):
             for component in self.marks
         ]
 
-    def getMarkGlyphToMarkClasses(self):
-        """Return a list of pairs (markGlyph, markClasses)."""
-        markGlyphToMarkClasses = defaultdict(set)
-        for component in self.marks:
-            for namedAnchor in component:
-                for markGlyph in namedAnchor.markClass.glyphs:
-                    markGlyphToMarkClasses[markGlyph].add(namedAnchor.markClass.name)
-        return markGlyphToMarkClasses.items()
+    def iterAnchors(self):
+        return itertools.chain.from_iterable(self.marks)
+
+    def groupMarks(self, key):
+        groups = {}
+        for i, component in enumerate(self.marks):
+            for anchor in component:
+                k = key(anchor)
+                components = groups.get(k)
+                if components is None:
+                    components = groups[k] = [[] for _ in self.marks]
+                components[i].append(anchor)
+        return {
+            k: self.__class__(self.name, components) for k, components in groups.items()
+        }
+
+
+class MarkRules(ast.PositioningRules):
+    """The mark attachment rules for a list of AbstractMarkPos objects of
+    the same type, which feaLib builds directly into the lookup, without an
+    AST statement and anchors for each base glyph.
+
+    The marks of each mark class are only added once to the lookup, and
+    the base anchors with the same coordinates are shared. In a variable
+    font, the anchors have VariationIndex device tables for the coordinates
+    which vary.
+    """
+
+    def __init__(self, attachments, location=None):
+        super().__init__(location)
+        self.attachments = attachments
+
+    def build(self, builder):
+        if not self.attachments:
+            return
+        location = self.location
+        lookup = builder.get_lookup_(location, self.attachments[0].LookupBuilder)
+        markClasses = set()
+        anchors = {}
+
+        def addMarks(markClass):
+            # same as feaLib's Builder.add_marks_, once per mark class
+            if markClass.name in markClasses:
+                return
+            markClasses.add(markClass.name)
+            for markClassDef in markClass.definitions:
+                otMarkAnchor = _makeOpenTypeAnchor(markClassDef.anchor)
+                for mark in markClassDef.glyphs.glyphSet():
+                    if mark not in lookup.marks:
+                        lookup.marks[mark] = (markClass.name, otMarkAnchor)
+                    elif lookup.marks[mark][0] != markClass.name:
+                        raise FeatureLibError(
+                            "Glyph %s cannot be in both @%s and @%s"
+                            % (mark, lookup.marks[mark][0], markClass.name),
+                            location,
+                        )
+
+        def makeAnchors(marks):
+            result = {}
+            for anchor in sorted(marks, key=lambda a: a.name):
+                addMarks(anchor.markClass)
+                key = (
+                    otRound(anchor.x),
+                    otRound(anchor.y),
+                    anchor.xVarIdx,
+                    anchor.yVarIdx,
+                )
+                otAnchor = anchors.get(key)
+                if otAnchor is None:
+                    otAnchor = anchors[key] = _buildAnchor(*key)
+                result[anchor.markClass.name] = otAnchor
+            return result
+
+        for pos in self.attachments:
+            if isinstance(pos, MarkToLigaPos):
+                lookup.ligatures[pos.name] = [
+                    makeAnchors(component) for component in pos.marks
+                ]
+            elif isinstance(pos, MarkToMarkPos):
+                lookup.baseMarks.setdefault(pos.name, {}).update(makeAnchors(pos.marks))
+            else:
+                lookup.bases.setdefault(pos.name, {}).update(makeAnchors(pos.marks))
+
+    def asFea(self, indent=""):
+        return ("\n" + indent).join(
+            pos.asAST().asFea(indent) for pos in self.attachments
+        )
 
 
 MARK_PREFIX = LIGA_SEPARATOR = "_"
@@ -148,9 +290,22 @@ def parseAnchorName(
 
 
 class NamedAnchor:
-    """A position with a name, and an associated markClass."""
+    """A position with a name, and an associated markClass. In a variable
+    font, 'xVarIdx' and 'yVarIdx' are the indices of the deltas of the
+    coordinates in the variation store, or NO_VARIATION_INDEX.
+    """
 
-    __slots__ = ("name", "x", "y", "isMark", "key", "number", "markClass")
+    __slots__ = (
+        "name",
+        "x",
+        "y",
+        "isMark",
+        "key",
+        "number",
+        "markClass",
+        "xVarIdx",
+        "yVarIdx",
+    )
 
     # subclasses can customize these to use different anchor naming schemes
     markPrefix = MARK_PREFIX
@@ -178,6 +333,7 @@ class NamedAnchor:
         self.key = key
         self.number = number
         self.markClass = markClass
+        self.xVarIdx = self.yVarIdx = NO_VARIATION_INDEX
 
     @property
     def markAnchorName(self):
@@ -249,6 +405,18 @@ class MarkFeatureWriter(BaseFeatureWriter):
     '_3'), which is encoded as '<anchor NULL>' in the generated 'pos ligature'
     statement.
 
+    With the "directBuild" option, each generated lookup contains a single
+    MarkRules statement instead of one statement per base, ligature or mark
+    glyph, and feaLib builds the subtables directly from the anchors. The
+    lookups keep the same names, and the feature file text is the same.
+
+    For a variable font, the writer can generate the features from the
+    anchors of all the masters at once (see ufo2ft.variableFeatures): the
+    glyphs must have anchors with the same names in all the masters, else
+    InvalidFontData is raised. The lookups are built directly (as with
+    "directBuild"), with the anchors of the default master, and
+    VariationIndex device tables for the coordinates which vary.
+
     If the glyph set contains glyphs whose unicode codepoint's script extension
     property intersects with one of the "Indic" script codes defined below,
     then the "abvm" and "blwm" features are also generated for those glyphs,
@@ -264,6 +432,9 @@ class MarkFeatureWriter(BaseFeatureWriter):
 
     tableTag = "GPOS"
     features = frozenset(["mark", "mkmk", "abvm", "blwm"])
+    options = dict(directBuild=False)
+    supportsVariations = True
+    compilableStatements = True
 
     # subclasses may override this to use different anchor naming schemes
     NamedAnchor = NamedAnchor
@@ -296,7 +467,9 @@ class MarkFeatureWriter(BaseFeatureWriter):
 
     def setContext(self, font, feaFile, compiler=None):
         ctx = super().setContext(font, feaFile, compiler=compiler)
-        ctx.gdefClasses = ast.getGDEFGlyphClasses(feaFile)
+        ctx.gdefClasses = self.getGDEFGlyphClasses()
+        ctx.variations = self.getVariations()
+        ctx.masterAnchors = {}
         ctx.anchorLists = self._getAnchorLists()
         ctx.anchorPairs = self._getAnchorPairs()
 
@@ -306,6 +479,19 @@ class MarkFeatureWriter(BaseFeatureWriter):
             return False
         return super().shouldContinue()
 
+    def getCacheKeyParts(self):
+        parts = self.getBaseCacheKeyParts()
+        parts.append(repr(getAttrWithFallback(self.context.font.info, "unitsPerEm")))
+        parts.append(
+            repr(
+                [
+                    (glyphName, [(a.name, a.x, a.y) for a in glyph.anchors])
+                    for glyphName, glyph in self.getOrderedGlyphSet().items()
+                ]
+            )
+        )
+        return parts
+
     def _getAnchorLists(self):
         gdefClasses = self.context.gdefClasses
         if gdefClasses.base is not None:
@@ -332,10 +518,53 @@ class MarkFeatureWriter(BaseFeatureWriter):
                     )
                 a = self.NamedAnchor(name=anchorName, x=anchor.x, y=anchor.y)
                 anchorDict[anchorName] = a
+            if self.context.variations is not None:
+                self._getMasterAnchors(glyphName, anchorDict)
             if anchorDict:
                 result[glyphName] = list(anchorDict.values())
         return result
 
+    def _getMasterAnchors(self, glyphName, anchorDict):
+        # collect the coordinates of the glyph's anchors in all the masters,
+        # which must have the same anchors as the default master
+        variations = self.context.variations
+        masterAnchors = []
+        for i, (font, glyphSet) in enumerate(
+            zip(variations.fonts, variations.glyphSets)
+        ):
+            if i == variations.defaultIndex:
+                coords = {name: (a.x, a.y) for name, a in anchorDict.items()}
+            else:
+                coords = {}
+                if glyphName in glyphSet:
+                    for anchor in glyphSet[glyphName].anchors:
+                        if anchor.name:
+                            coords[anchor.name] = (anchor.x, anchor.y)
+                if coords.keys() != anchorDict.keys():
+                    raise InvalidFontData(
+                        "Glyph '%s' has incompatible anchors in master %s: "
+                        "expected %s, found %s"
+                        % (
+                            glyphName,
+                            _LazyFontName(font),
+                            sorted(anchorDict),
+                            sorted(coords),
+                        )
+                    )
+            masterAnchors.append(coords)
+        if anchorDict:
+            self.context.masterAnchors[glyphName] = masterAnchors
+
+    def _setAnchorVariations(self):
+        # store the deltas of the coordinates of the anchors that are used
+        variations = self.context.variations
+        masterAnchors = self.context.masterAnchors
+        for glyphName, anchors in self.context.anchorLists.items():
+            for anchor in anchors:
+                xs, ys = zip(*(m[anchor.name] for m in masterAnchors[glyphName]))
+                anchor.x, anchor.xVarIdx = variations.storeMasterValues(xs)
+                anchor.y, anchor.yVarIdx = variations.storeMasterValues(ys)
+
     def _getAnchorPairs(self):
         markAnchorNames = set()
         for anchors in self.context.anchorLists.values():
@@ -395,7 +624,13 @@ class MarkFeatureWriter(BaseFeatureWriter):
             className = ast.makeFeaClassName(classPrefix + markAnchorName)
             for glyphName, anchor in glyphAnchorPairs.items():
                 mcd = self._defineMarkClass(
-                    glyphName, anchor.x, anchor.y, className, currentClasses
+                    glyphName,
+                    anchor.x,
+                    anchor.y,
+                    className,
+                    currentClasses,
+                    anchor.xVarIdx,
+                    anchor.yVarIdx,
                 )
                 if mcd is not None:
                     newDefs.append(mcd)
@@ -404,8 +639,20 @@ class MarkFeatureWriter(BaseFeatureWriter):
                 allMarkClasses[anchor.key] = currentClasses[className]
         return newDefs
 
-    def _defineMarkClass(self, glyphName, x, y, className, markClasses):
-        anchor = ast.Anchor(x=otRound(x), y=otRound(y))
+    def _defineMarkClass(
+        self,
+        glyphName,
+        x,
+        y,
+        className,
+        markClasses,
+        xVarIdx=NO_VARIATION_INDEX,
+        yVarIdx=NO_VARIATION_INDEX,
+    ):
+        if xVarIdx == yVarIdx == NO_VARIATION_INDEX:
+            anchor = ast.Anchor(x=otRound(x), y=otRound(y))
+        else:
+            anchor = VariableAnchor(otRound(x), otRound(y), xVarIdx, yVarIdx)
         markClass = markClasses.get(className)
         if markClass is None:
             markClass = ast.MarkClass(className)
@@ -437,6 +684,10 @@ class MarkFeatureWriter(BaseFeatureWriter):
         return all(
             getattr(a1, attr) == getattr(a2, attr)
             for attr in ("x", "y", "contourpoint", "xDeviceTable", "yDeviceTable")
+        ) and all(
+            getattr(a1, attr, NO_VARIATION_INDEX)
+            == getattr(a2, attr, NO_VARIATION_INDEX)
+            for attr in ("xVarIdx", "yVarIdx")
         )
 
     def _setBaseAnchorMarkClasses(self):
@@ -447,7 +698,23 @@ class MarkFeatureWriter(BaseFeatureWriter):
                     continue
                 anchor.markClass = markClasses[anchor.key]
 
-    def _groupMarkClasses(self, markGlyphToMarkClasses):
+    @staticmethod
+    def _makeMarkClassAdjacency(markGlyphToMarkClasses):
+        """Return a dict of the mark classes which conflict with each mark
+        class, i.e. which have mark glyphs in common with it.
+        """
+        adjacency = {}
+        # many mark glyphs belong to the same mark classes: only make the
+        # edges once for each distinct combination of classes
+        for markClasses in {frozenset(mcs) for mcs in markGlyphToMarkClasses.values()}:
+            for markClass in markClasses:
+                neighbours = adjacency.setdefault(markClass, set())
+                if len(markClasses) > 1:
+                    neighbours.update(markClasses)
+                    neighbours.discard(markClass)
+        return adjacency
+
+    def _groupMarkClasses(self, adjacency):
         # To compute the number of lookups that we need to build, we want
         # the minimum number of lookups such that, whenever a mark glyph
         # belongs to several mark classes, these classes are not in the same
@@ -455,19 +722,9 @@ class MarkFeatureWriter(BaseFeatureWriter):
         # but that's a bit wasteful, we might be able to do better by grouping
         # mark classes that do not conflict.
         # This is a graph coloring problem: the graph nodes are mark classes,
-        # edges are between classes that would conflict and the colors are
-        # the lookups in which they can go.
-        adjacency = {
-            # We'll get the same markClass several times in the dict
-            # comprehension below but it's ok, only one will be kept.
-            markClass: set()
-            for markClasses in markGlyphToMarkClasses.values()
-            for markClass in markClasses
-        }
-        for _markGlyph, markClasses in markGlyphToMarkClasses.items():
-            for markClass, other in itertools.combinations(markClasses, 2):
-                adjacency[markClass].add(other)
-                adjacency[other].add(markClass)
+        # edges are between classes that would conflict (see
+        # _makeMarkClassAdjacency) and the colors are the lookups in which
+        # they can go.
         colorGroups = colorGraph(adjacency)
         # Sort the groups, because the group that contains MC_top or MC_bottom
         # needs to go to the end (as specified in self.anchorSortKey) so that
@@ -494,12 +751,22 @@ class MarkFeatureWriter(BaseFeatureWriter):
             ),
         )
 
-    def _logIfAmbiguous(self, attachments, groupedMarkClasses):
+    def _logIfAmbiguous(self, attachments, groupedMarkClasses, adjacency):
         """Warn about ambiguous situations and log the current resolution.
         An anchor attachment is ambiguous if for the same mark glyph, more
         than one mark class can be used to attach it to the base.
         """
+        if not self.log.isEnabledFor(logging.INFO):
+            return
+        order = {
+            markClass: i
+            for i, markClass in enumerate(itertools.chain(*groupedMarkClasses))
+        }
         for attachment in attachments:
+            # only look at the mark glyphs if some mark classes conflict
+            markClasses = {anchor.markClass.name for anchor in attachment.iterAnchors()}
+            if all(adjacency[mc].isdisjoint(markClasses) for mc in markClasses):
+                continue
             for markGlyph, markClasses in attachment.getMarkGlyphToMarkClasses():
                 if len(markClasses) > 1:
                     self.log.info(
@@ -508,12 +775,7 @@ class MarkFeatureWriter(BaseFeatureWriter):
                         "The last one will prevail.",
                         attachment.name,
                         markGlyph,
-                        ", ".join(
-                            markClass
-                            for group in groupedMarkClasses
-                            for markClass in group
-                            if markClass in markClasses
-                        ),
+                        ", ".join(sorted(markClasses, key=order.__getitem__)),
                     )
 
     def _removeClassPrefix(self, markClass):
@@ -540,28 +802,35 @@ class MarkFeatureWriter(BaseFeatureWriter):
         #   through different anchor names, we may have to split the attachment
         #   into two attachments, using null anchors instead of one or the other
         #   mark class in each split attachment.
+        # Index the mark classes used by the attachments, then their mark
+        # glyphs, so that each mark class is only expanded once.
+        markClasses = {}
+        for attachment in attachments:
+            for anchor in attachment.iterAnchors():
+                markClasses[anchor.markClass.name] = anchor.markClass
         markGlyphToMarkClasses = defaultdict(set)
+        for name, markClass in markClasses.items():
+            for markGlyph in markClass.glyphs:
+                markGlyphToMarkClasses[markGlyph].add(name)
+        adjacency = self._makeMarkClassAdjacency(markGlyphToMarkClasses)
+        groupedMarkClasses = self._groupMarkClasses(adjacency)
+        self._logIfAmbiguous(attachments, groupedMarkClasses, adjacency)
+        lookupIndices = {
+            markClass: i
+            for i, group in enumerate(groupedMarkClasses)
+            for markClass in group
+        }
+
+        def lookupIndex(anchor):
+            return lookupIndices[anchor.markClass.name]
+
+        # One attachment has one base glyph and many marks, each of the class
+        # NamedAnchor. Each NamedAnchor has one markClass, which determines
+        # the lookup it goes in: split each attachment once between lookups.
+        lookups = [[] for _ in groupedMarkClasses]
         for attachment in attachments:
-            for markGlyph, markClasses in attachment.getMarkGlyphToMarkClasses():
-                markGlyphToMarkClasses[markGlyph].update(markClasses)
-        groupedMarkClasses = self._groupMarkClasses(markGlyphToMarkClasses)
-        self._logIfAmbiguous(attachments, groupedMarkClasses)
-        lookups = []
-        for markClasses in groupedMarkClasses:
-            lookup = []
-            # Filter existing attachments
-            for attachment in attachments:
-                # One attachment has one base glyph and many marks, each of
-                # the class NamedAnchor. Each NamedAnchor has one markClass.
-                # We keep the NamedAnchor if the markClass is allowed in the
-                # current lookup.
-                def include(anchor):
-                    return anchor.markClass.name in markClasses
-
-                filteredAttachment = attachment.filter(include)
-                if filteredAttachment:
-                    lookup.append(filteredAttachment)
-            lookups.append(lookup)
+            for i, groupedAttachment in attachment.groupMarks(lookupIndex).items():
+                lookups[i].append(groupedAttachment)
         return lookups
 
     def _makeMarkToBaseAttachments(self):
@@ -659,14 +928,16 @@ class MarkFeatureWriter(BaseFeatureWriter):
                     continue
             yield pos
 
+    def _makeMarkRules(self, attachments):
+        if self.options.directBuild or self.context.variations is not None:
+            return [MarkRules(attachments)]
+        return [pos.asAST() for pos in attachments]
+
     def _makeMarkLookup(self, lookupName, attachments, include, marksFilter=None):
-        statements = [
-            pos.asAST()
-            for pos in self._iterAttachments(attachments, include, marksFilter)
-        ]
-        if statements:
+        attachments = list(self._iterAttachments(attachments, include, marksFilter))
+        if attachments:
             lkp = ast.LookupBlock(lookupName)
-            lkp.statements.extend(statements)
+            lkp.statements.extend(self._makeMarkRules(attachments))
             return lkp
 
     def _makeMarkFilteringSetClass(self, lookupName, attachments, markClass, include):
@@ -697,7 +968,7 @@ class MarkFeatureWriter(BaseFeatureWriter):
         lkp = ast.LookupBlock(lookupName)
         lkp.statements.append(filteringClass)
         lkp.statements.append(ast.makeLookupFlag(markFilteringSet=filteringClass))
-        lkp.statements.extend(pos.asAST() for pos in attachments)
+        lkp.statements.extend(self._makeMarkRules(attachments))
         return lkp
 
     def _makeMarkFeature(self, include):
@@ -850,14 +1121,14 @@ class MarkFeatureWriter(BaseFeatureWriter):
         return features
 
     def _getIndicGlyphs(self):
-        cmap = self.makeUnicodeToGlyphNameMapping()
-        unicodeIsIndic = partial(unicodeInScripts, scripts=self.indicScripts)
-        if any(unicodeIsIndic for uv in cmap):
+        coverage = self.getUnicodeCoverage()
+        isIndic = partial(scriptExtensionsInScripts, scripts=self.indicScripts)
+        if any(isIndic(sx) for sx in coverage.values("scriptExtensions")):
             # If there are any characters from Indic scripts in the cmap, we
             # compile a temporary GSUB table to resolve substitutions and get
             # the set of all the "Indic" glyphs, including alternate glyphs.
             gsub = self.compileGSUB()
-            glyphGroups = classifyGlyphs(unicodeIsIndic, cmap, gsub)
+            glyphGroups = coverage.classify("scriptExtensions", isIndic, gsub)
             # the 'glyphGroups' dict is keyed by the return value of the
             # classifying include, so here 'True' means all the Indic glyphs
             return glyphGroups.get(True, set())
@@ -866,6 +1137,8 @@ class MarkFeatureWriter(BaseFeatureWriter):
 
     def _write(self):
         self._pruneUnusedAnchors()
+        if self.context.variations is not None:
+            self._setAnchorVariations()
 
         newClassDefs = self._makeMarkClassDefinitions()
         self._setBaseAnchorMarkClasses()
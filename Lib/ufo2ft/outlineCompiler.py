@@ -5,7 +5,10 @@ from io import BytesIO
 from types import SimpleNamespace
 
 from fontTools.cffLib import (
+    CFFFontSet,
     CharStrings,
+    FDArrayIndex,
+    FontDict,
     GlobalSubrsIndex,
     IndexedStrings,
     PrivateDict,
@@ -15,6 +18,7 @@ from fontTools.cffLib import (
 )
 from fontTools.misc.arrayTools import unionRect
 from fontTools.misc.fixedTools import otRound
+from fontTools.misc.textTools import Tag
 from fontTools.pens.boundsPen import ControlBoundsPen
 from fontTools.pens.reverseContourPen import ReverseContourPen
 from fontTools.pens.t2CharStringPen import T2CharStringPen
@@ -24,6 +28,7 @@ from fontTools.ttLib.tables._g_l_y_f import USE_MY_METRICS, Glyph
 from fontTools.ttLib.tables._h_e_a_d import mac_epoch_diff
 from fontTools.ttLib.tables.O_S_2f_2 import Panose
 
+from ufo2ft.buildContext import BuildContext
 from ufo2ft.constants import COLOR_LAYERS_KEY, COLOR_PALETTES_KEY
 from ufo2ft.errors import InvalidFontData
 from ufo2ft.fontInfoData import (
@@ -68,6 +73,7 @@ class BaseOutlineCompiler:
     """Create a feature-less outline binary."""
 
     sfntVersion = None
+    lazy = False
     tables = frozenset(
         [
             "head",
@@ -92,19 +98,33 @@ class BaseOutlineCompiler:
         glyphOrder=None,
         tables=None,
         notdefGlyph=None,
+        buildContext=None,
     ):
         self.ufo = font
         # use the previously filtered glyphSet, if any
         if glyphSet is None:
-            glyphSet = {g.name: g for g in font}
+            if buildContext is not None:
+                glyphSet = buildContext.glyphSet
+            else:
+                glyphSet = {g.name: g for g in font}
+        hasNotdef = ".notdef" in glyphSet
         self.makeMissingRequiredGlyphs(font, glyphSet, self.sfntVersion, notdefGlyph)
         self.allGlyphs = glyphSet
+        # share the data derived from the glyph set with the feature compiler
+        if buildContext is None:
+            buildContext = BuildContext(font, glyphSet, glyphOrder)
+        elif buildContext.glyphSet is not glyphSet or not hasNotdef:
+            buildContext.invalidate(glyphSet)
+        self.buildContext = buildContext
         # store the glyph order
         if glyphOrder is None:
             glyphOrder = font.glyphOrder
-        self.glyphOrder = self.makeOfficialGlyphOrder(glyphOrder)
+        self.glyphOrder = buildContext.glyphOrder = self.makeOfficialGlyphOrder(
+            glyphOrder
+        )
         # make a reusable character mapping
         self.unicodeToGlyphNameMapping = self.makeUnicodeToGlyphNameMapping()
+        buildContext.unicodeToGlyphNameMapping = self.unicodeToGlyphNameMapping
         if tables is not None:
             self.tables = tables
         # cached values defined later on
@@ -112,11 +132,29 @@ class BaseOutlineCompiler:
         self._fontBoundingBox = None
         self._compiledGlyphs = None
 
-    def compile(self):
+    def compile(self, lazy=False):
         """
         Compile the OpenType binary.
+
+        If *lazy* is True, the tables of the returned TTFont are not built
+        upfront: each one is built by its ``setupTable_*`` method only when
+        it is first accessed, or when the font is saved. Tables which depend
+        on other tables (e.g. 'hhea' on 'hmtx') build those as needed.
+        The tables imported from TTX files replace those of the builders.
+        ``setupOtherTables`` is still called, with the `lazy` attribute set
+        to True, and only builds upfront the tables which it doesn't leave
+        to ``getTableBuilders``.
+
+        The lazy mode is meant for the direct use of the outline compilers,
+        e.g. to read a few tables of a font: the compileOTF and compileTTF
+        functions, and the interpolatable builds, don't expose it since their
+        post-processor saves the font, which builds all its tables anyway.
         """
-        self.otf = TTFont(sfntVersion=self.sfntVersion)
+        self.lazy = lazy
+        if lazy:
+            self.otf = _LazyTTFont(sfntVersion=self.sfntVersion)
+        else:
+            self.otf = TTFont(sfntVersion=self.sfntVersion)
 
         # only compile vertical metrics tables if vhea metrics are defined
         vertical_metrics = [
@@ -135,26 +173,76 @@ class BaseOutlineCompiler:
         # write the glyph order
         self.otf.setGlyphOrder(self.glyphOrder)
 
-        # populate basic tables
-        self.setupTable_head()
-        self.setupTable_hmtx()
-        self.setupTable_hhea()
-        self.setupTable_name()
-        self.setupTable_maxp()
-        self.setupTable_cmap()
-        self.setupTable_OS2()
-        self.setupTable_post()
-        if self.vertical:
-            self.setupTable_vmtx()
-            self.setupTable_vhea()
-        if self.colorLayers:
-            self.setupTable_COLR()
-            self.setupTable_CPAL()
-        self.setupOtherTables()
+        if lazy:
+            for tags, method in self.getTableBuilders():
+                self.otf.setTableBuilder(tags, self._bindTableBuilder(method))
+            self.setupOtherTables()
+        else:
+            # populate basic tables
+            self.setupTable_head()
+            self.setupTable_hmtx()
+            self.setupTable_hhea()
+            self.setupTable_name()
+            self.setupTable_maxp()
+            self.setupTable_cmap()
+            self.setupTable_OS2()
+            self.setupTable_post()
+            if self.vertical:
+                self.setupTable_vmtx()
+                self.setupTable_vhea()
+            if self.colorLayers:
+                self.setupTable_COLR()
+                self.setupTable_CPAL()
+            self.setupOtherTables()
         self.importTTX()
 
         return self.otf
 
+    def getTableBuilders(self):
+        """
+        Return a list of (tags, method) tuples, where 'method' is the
+        ``setupTable_*`` method that builds the tables listed in 'tags'.
+        This is used by the lazy compile mode.
+
+        **This should not be called externally.** Subclasses that add
+        tables in ``setupOtherTables`` can extend this list, in order for
+        their tables to be compiled lazily, and then not build them in
+        ``setupOtherTables`` when the `lazy` attribute is True.
+        """
+        builders = [
+            ("head", self.setupTable_head),
+            ("hmtx", self.setupTable_hmtx),
+            ("hhea", self.setupTable_hhea),
+            ("name", self.setupTable_name),
+            ("maxp", self.setupTable_maxp),
+            ("cmap", self.setupTable_cmap),
+            ("OS/2", self.setupTable_OS2),
+            ("post", self.setupTable_post),
+        ]
+        if self.vertical:
+            builders.append(("vmtx", self.setupTable_vmtx))
+            builders.append(("vhea", self.setupTable_vhea))
+        if self.colorLayers and self.ufo.lib[COLOR_LAYERS_KEY]:
+            builders.append(("COLR", self.setupTable_COLR))
+        if self.colorLayers:
+            builders.append(("CPAL", self.setupTable_CPAL))
+        return [((tag,), method) for tag, method in builders if tag in self.tables]
+
+    def _bindTableBuilder(self, method):
+        # the table is built into the font returned by the compile call that
+        # registered it, even if the compiler was used to compile another
+        # font in the meantime
+        otf = self.otf
+
+        def builder():
+            current, self.otf = self.otf, otf
+            try:
+                method()
+            finally:
+                self.otf = current
+
+        return builder
+
     def compileGlyphs(self):
         """Compile glyphs and return dict keyed by glyph name.
 
@@ -214,6 +302,11 @@ class BaseOutlineCompiler:
             self._fontBoundingBox = self.makeFontBoundingBox()
         return self._fontBoundingBox
 
+    @property
+    def unicodeCoverage(self):
+        """A UnicodeCoverageIndex for the font's ``unicodeToGlyphNameMapping``."""
+        return self.buildContext.unicodeCoverage
+
     def makeUnicodeToGlyphNameMapping(self):
         """
         Make a ``unicode : glyph name`` mapping for the font.
@@ -614,13 +707,12 @@ class BaseOutlineCompiler:
             os2.ulUnicodeRange3 = intListToNum(uniRanges, 64, 32)
             os2.ulUnicodeRange4 = intListToNum(uniRanges, 96, 32)
         else:
-            os2.recalcUnicodeRanges(self.otf)
+            os2.setUnicodeRanges(self.unicodeCoverage.getUnicodeRanges())
 
         # codepage ranges
         codepageRanges = getAttrWithFallback(font.info, "openTypeOS2CodePageRanges")
         if codepageRanges is None:
-            unicodes = self.unicodeToGlyphNameMapping.keys()
-            codepageRanges = calcCodePageRanges(unicodes)
+            codepageRanges = calcCodePageRanges(self.unicodeCoverage.codepoints)
         os2.ulCodePageRange1 = intListToNum(codepageRanges, 0, 32)
         os2.ulCodePageRange2 = intListToNum(codepageRanges, 32, 32)
 
@@ -984,7 +1076,12 @@ class BaseOutlineCompiler:
 
 
 class OutlineOTFCompiler(BaseOutlineCompiler):
-    """Compile a .otf font with CFF outlines."""
+    """Compile a .otf font with CFF outlines.
+
+    With cffVersion=2, a 'CFF2' table is built instead of 'CFF ': the
+    charstrings don't encode the advance widths, and the glyph names are
+    stored in a format 2 'post' table.
+    """
 
     sfntVersion = "OTTO"
     tables = BaseOutlineCompiler.tables | {"CFF", "VORG"}
@@ -998,7 +1095,12 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
         notdefGlyph=None,
         roundTolerance=None,
         optimizeCFF=True,
+        buildContext=None,
+        cffVersion=1,
     ):
+        if cffVersion not in (1, 2):
+            raise ValueError(f"Unsupported CFF version: {cffVersion!r}")
+        self.cffVersion = cffVersion
         if roundTolerance is not None:
             self.roundTolerance = float(roundTolerance)
         else:
@@ -1010,6 +1112,7 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
             glyphOrder=glyphOrder,
             tables=tables,
             notdefGlyph=notdefGlyph,
+            buildContext=buildContext,
         )
         self.optimizeCFF = optimizeCFF
         self._defaultAndNominalWidths = None
@@ -1044,7 +1147,11 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
 
     def compileGlyphs(self):
         """Compile and return the CFF T2CharStrings for this font."""
-        defaultWidth, nominalWidth = self.getDefaultAndNominalWidths()
+        if self.cffVersion == 2:
+            # CFF2 charstrings don't encode the advance widths
+            defaultWidth = nominalWidth = None
+        else:
+            defaultWidth, nominalWidth = self.getDefaultAndNominalWidths()
         # The real PrivateDict will be created later on in setupTable_CFF.
         # For convenience here we use a namespace object to pass the default/nominal
         # widths that we need to draw the charstrings when computing their bounds.
@@ -1103,10 +1210,11 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
         may override this method to handle the charstring creation
         in a different way if desired.
         """
+        isCFF2 = self.cffVersion == 2
         width = glyph.width
         defaultWidth = private.defaultWidthX
         nominalWidth = private.nominalWidthX
-        if width == defaultWidth:
+        if isCFF2 or width == defaultWidth:
             # if width equals the default it can be omitted from charstring
             width = None
         else:
@@ -1114,7 +1222,9 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
             width -= nominalWidth
         if width is not None:
             width = otRound(width)
-        pen = T2CharStringPen(width, self.allGlyphs, roundTolerance=self.roundTolerance)
+        pen = T2CharStringPen(
+            width, self.allGlyphs, roundTolerance=self.roundTolerance, CFF2=isCFF2
+        )
         glyph.draw(pen)
         charString = pen.getCharString(private, globalSubrs, optimize=self.optimizeCFF)
         return charString
@@ -1128,11 +1238,43 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
         maxp.tableVersion = 0x00005000
         maxp.numGlyphs = len(self.glyphOrder)
 
+    def setupTable_post(self):
+        """Make the post table.
+
+        For CFF2 fonts, which have no charset, this is a format 2 post table
+        with the compiler's glyph order.
+        """
+        super().setupTable_post()
+        if self.cffVersion != 2 or "post" not in self.otf:
+            return
+
+        post = self.otf["post"]
+        post.formatType = 2.0
+        post.extraNames = []
+        post.mapping = {}
+        post.glyphOrder = self.glyphOrder
+
     def setupOtherTables(self):
-        self.setupTable_CFF()
+        if self.lazy:
+            return  # see getTableBuilders
+        if self.cffVersion == 2:
+            self.setupTable_CFF2()
+        else:
+            self.setupTable_CFF()
         if self.vertical:
             self.setupTable_VORG()
 
+    def getTableBuilders(self):
+        builders = super().getTableBuilders()
+        if self.cffVersion == 2:
+            if {"CFF", "CFF2"}.intersection(self.tables):
+                builders.append((("CFF2",), self.setupTable_CFF2))
+        elif {"CFF", "CFF "}.intersection(self.tables):
+            builders.append((("CFF ",), self.setupTable_CFF))
+        if self.vertical and "VORG" in self.tables:
+            builders.append((("VORG",), self.setupTable_VORG))
+        return builders
+
     def setupTable_CFF(self):
         """Make the CFF table."""
         if not {"CFF", "CFF "}.intersection(self.tables):
@@ -1231,6 +1373,30 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
         if nominalWidthX:
             private.rawDict["nominalWidthX"] = nominalWidthX
         # populate hint data
+        self.setupCFFPrivateHintValues(private)
+        # populate glyphs
+        cffGlyphs = self.getCompiledGlyphs()
+        for glyphName in self.glyphOrder:
+            charString = cffGlyphs[glyphName]
+            charString.private = private
+            charString.globalSubrs = globalSubrs
+            # add to the font
+            if glyphName in charStrings:
+                # XXX a glyph already has this name. should we choke?
+                glyphID = charStrings.charStrings[glyphName]
+                charStringsIndex.items[glyphID] = charString
+            else:
+                charStringsIndex.append(charString)
+                glyphID = len(topDict.charset)
+                charStrings.charStrings[glyphName] = glyphID
+                topDict.charset.append(glyphName)
+        topDict.FontBBox = self.fontBoundingBox
+
+    def setupCFFPrivateHintValues(self, private):
+        """Populate the blues and stems of the CFF PrivateDict from the UFO's
+        postscript font info.
+        """
+        info = self.ufo.info
         blueFuzz = otRound(getAttrWithFallback(info, "postscriptBlueFuzz"))
         blueShift = otRound(getAttrWithFallback(info, "postscriptBlueShift"))
         blueScale = getAttrWithFallback(info, "postscriptBlueScale")
@@ -1258,7 +1424,8 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
             private.rawDict["BlueFuzz"] = blueFuzz
             private.rawDict["BlueShift"] = blueShift
             private.rawDict["BlueScale"] = blueScale
-            private.rawDict["ForceBold"] = forceBold
+            if self.cffVersion != 2:
+                private.rawDict["ForceBold"] = forceBold
             if blueValues:
                 private.rawDict["BlueValues"] = blueValues
             if otherBlues:
@@ -1273,23 +1440,52 @@ class OutlineOTFCompiler(BaseOutlineCompiler):
             private.rawDict["StdHW"] = stemSnapH[0]
             private.rawDict["StemSnapV"] = stemSnapV
             private.rawDict["StdVW"] = stemSnapV[0]
-        # populate glyphs
+
+    def setupTable_CFF2(self):
+        """Make the CFF2 table."""
+        if not {"CFF", "CFF2"}.intersection(self.tables):
+            return
+
+        self.otf["CFF2"] = cff2 = newTable("CFF2")
+        cff2.cff = cff = CFFFontSet()
+        cff.major = 2
+        cff.minor = 0
+        cff.hdrSize = 5
+        # CFF2 has neither a Name INDEX nor a String INDEX
+        cff.fontNames = ["CFF2Font"]
+        cff.strings = None
+        cff2GetGlyphOrder = self.otf.getGlyphOrder
+        cff.topDictIndex = topDictIndex = TopDictIndex(None, cff2GetGlyphOrder)
+        globalSubrs = GlobalSubrsIndex()
+        cff.GlobalSubrs = globalSubrs
+        private = PrivateDict()
+        fontDict = FontDict()
+        fontDict.setCFF2(True)
+        fontDict.Private = private
+        fdArray = FDArrayIndex()
+        fdArray.strings = None
+        fdArray.GlobalSubrs = globalSubrs
+        fdArray.append(fontDict)
+        topDict = TopDict(GlobalSubrs=globalSubrs, cff2GetGlyphOrder=cff2GetGlyphOrder)
+        topDict.FDArray = fdArray
+        unitsPerEm = otRound(getAttrWithFallback(self.ufo.info, "unitsPerEm"))
+        topDict.FontMatrix = [1.0 / unitsPerEm, 0, 0, 1.0 / unitsPerEm, 0, 0]
+        self.setupCFFPrivateHintValues(private)
+        charStrings = topDict.CharStrings = CharStrings(
+            file=None,
+            charset=None,
+            globalSubrs=globalSubrs,
+            private=private,
+            fdSelect=None,
+            fdArray=fdArray,
+        )
         cffGlyphs = self.getCompiledGlyphs()
         for glyphName in self.glyphOrder:
             charString = cffGlyphs[glyphName]
             charString.private = private
             charString.globalSubrs = globalSubrs
-            # add to the font
-            if glyphName in charStrings:
-                # XXX a glyph already has this name. should we choke?
-                glyphID = charStrings.charStrings[glyphName]
-                charStringsIndex.items[glyphID] = charString
-            else:
-                charStringsIndex.append(charString)
-                glyphID = len(topDict.charset)
-                charStrings.charStrings[glyphName] = glyphID
-                topDict.charset.append(glyphName)
-        topDict.FontBBox = self.fontBoundingBox
+            charStrings[glyphName] = charString
+        topDictIndex.append(topDict)
 
 
 class OutlineTTFCompiler(BaseOutlineCompiler):
@@ -1365,10 +1561,20 @@ class OutlineTTFCompiler(BaseOutlineCompiler):
         post.glyphOrder = self.glyphOrder
 
     def setupOtherTables(self):
+        if self.lazy:
+            return  # see getTableBuilders
         self.setupTable_glyf()
         if self.ufo.info.openTypeGaspRangeRecords:
             self.setupTable_gasp()
 
+    def getTableBuilders(self):
+        builders = super().getTableBuilders()
+        if {"glyf", "loca"}.issubset(self.tables):
+            builders.append((("glyf", "loca"), self.setupTable_glyf))
+        if self.ufo.info.openTypeGaspRangeRecords and "gasp" in self.tables:
+            builders.append((("gasp",), self.setupTable_gasp))
+        return builders
+
     def setupTable_glyf(self):
         """Make the glyf table."""
         if not {"glyf", "loca"}.issubset(self.tables):
@@ -1412,6 +1618,82 @@ class OutlineTTFCompiler(BaseOutlineCompiler):
                     break
 
 
+class _LazyTTFont(TTFont):
+    """A TTFont whose tables are built on demand by the callables registered
+    with `setTableBuilder`, either when they are first accessed or when the
+    font is saved.
+
+    A table set from outside of the builders, e.g. imported from a TTX file,
+    replaces the one which its builder would set up.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._tableBuilders = {}
+        self._building = 0
+        self._overridden = set()
+
+    def setTableBuilder(self, tags, builder):
+        """Register a callable which takes no arguments and sets up the tables
+        listed in `tags` (sequence of str).
+        """
+        for tag in tags:
+            self._tableBuilders[Tag(tag)] = builder
+
+    def _buildTable(self, tag):
+        builder = self._tableBuilders.get(tag)
+        if builder is None:
+            return
+        # the same builder may set up more than one table (e.g. 'glyf' and
+        # 'loca'); unregister all of them before building so that a builder
+        # requesting other tables can't recurse into itself.
+        for t in [t for t, b in self._tableBuilders.items() if b is builder]:
+            del self._tableBuilders[t]
+        overridden = {t: self.tables[t] for t in self._overridden if t in self.tables}
+        self._building += 1
+        try:
+            builder()
+        finally:
+            self._building -= 1
+        # the builder may also set up the tables that were replaced
+        self.tables.update(overridden)
+
+    def buildTables(self):
+        """Build all the tables that have not been built yet."""
+        while self._tableBuilders:
+            self._buildTable(next(iter(self._tableBuilders)))
+
+    def has_key(self, tag):
+        return Tag(tag) in self._tableBuilders or super().has_key(tag)
+
+    __contains__ = has_key
+
+    def keys(self):
+        self.buildTables()
+        return super().keys()
+
+    def __getitem__(self, tag):
+        self._buildTable(Tag(tag))
+        return super().__getitem__(tag)
+
+    def __setitem__(self, tag, table):
+        tag = Tag(tag)
+        if not self._building:
+            self._tableBuilders.pop(tag, None)
+            self._overridden.add(tag)
+        super().__setitem__(tag, table)
+
+    def __delitem__(self, tag):
+        tag = Tag(tag)
+        if self._tableBuilders.pop(tag, None) is not None and tag not in self.tables:
+            return
+        super().__delitem__(tag)
+
+    def getTableData(self, tag):
+        self._buildTable(Tag(tag))
+        return super().getTableData(tag)
+
+
 class StubGlyph:
 
     """
@@ -1,9 +1,12 @@
 import enum
+import importlib
+import itertools
 import logging
 import re
 from io import BytesIO
 
-from fontTools.ttLib import TTFont
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.standardGlyphOrder import standardGlyphOrder
 
 from ufo2ft.constants import (
     GLYPHS_DONT_USE_PRODUCTION_NAMES,
@@ -19,6 +22,26 @@ class CFFVersion(enum.IntEnum):
     CFF2 = 2
 
 
+STANDARD_GLYPH_NAMES = frozenset(standardGlyphOrder)
+
+CFF_TABLE_TAGS = {CFFVersion.CFF: "CFF ", CFFVersion.CFF2: "CFF2"}
+
+# CFF 1.0 top dict keys which are copied from the font info and don't affect
+# the subroutinization of the charstrings
+CFF_TOP_DICT_METADATA_KEYS = (
+    "version",
+    "Notice",
+    "Copyright",
+    "FullName",
+    "FamilyName",
+    "Weight",
+    "isFixedPitch",
+    "ItalicAngle",
+    "UnderlinePosition",
+    "UnderlineThickness",
+)
+
+
 class PostProcessor:
     """Does some post-processing operations on a compiled OpenType font, using
     info from the source UFO where necessary.
@@ -41,10 +64,12 @@ class PostProcessor:
         self.ufo = ufo
         self.glyphSet = glyphSet if glyphSet is not None else ufo
         stream = BytesIO()
-        otf.save(stream)
+        # the tables are sorted when the final font is saved
+        otf.save(stream, reorderTables=False)
         stream.seek(0)
         self.otf = TTFont(stream)
         self._postscriptNames = ufo.lib.get("public.postscriptNames")
+        self._production_names = {}
 
     def process(
         self,
@@ -52,6 +77,7 @@ class PostProcessor:
         optimizeCFF=True,
         cffVersion=None,
         subroutinizer=None,
+        subroutinizerCache=None,
     ):
         """
         useProductionNames (Optional[bool]):
@@ -93,19 +119,53 @@ class PostProcessor:
           is True and CFF or CFF2 table is present. Choose between "cffsubr" or
           "compreffor". By default "cffsubr" is used for both CFF 1 and CFF 2.
           NOTE: compreffor currently doesn't support input fonts with CFF2 table.
+
+        subroutinizerCache (Optional[Union[str, os.PathLike, FileCache]]):
+          A directory (or ufo2ft.cache.FileCache instance) where subroutinized
+          CFF or CFF2 tables are stored, keyed by the content of the input
+          charstrings, private dicts and output CFF version. If these did not
+          change since a previous build, e.g. after editing only the features
+          or the font info, the stored table is reused instead of running the
+          subroutinizer again.
         """
         if self._get_cff_version(self.otf):
             self.process_cff(
                 optimizeCFF=optimizeCFF,
                 cffVersion=cffVersion,
                 subroutinizer=subroutinizer,
+                subroutinizerCache=subroutinizerCache,
             )
 
         self.process_glyph_names(useProductionNames)
 
         return self.otf
 
-    def process_cff(self, *, optimizeCFF=True, cffVersion=None, subroutinizer=None):
+    def save(self, file=None, flavor=None):
+        """Write the post-processed font to 'file', a path or a writable
+        binary stream. If 'file' is None, return the font data as bytes.
+
+        flavor (Optional[str]):
+          Compress the font as "woff" or "woff2" (the latter requires the
+          brotli module). By default the font is not compressed.
+
+        Only the tables modified by the post-processor are compiled again;
+        the data of the other tables is copied from the compiled input font.
+        """
+        self.otf.flavor = flavor
+        if file is None:
+            stream = BytesIO()
+            self.otf.save(stream)
+            return stream.getvalue()
+        self.otf.save(file)
+
+    def process_cff(
+        self,
+        *,
+        optimizeCFF=True,
+        cffVersion=None,
+        subroutinizer=None,
+        subroutinizerCache=None,
+    ):
         cffInputVersion = self._get_cff_version(self.otf)
         if not cffInputVersion:
             raise ValueError("Missing required 'CFF ' or 'CFF2' table")
@@ -120,7 +180,12 @@ class PostProcessor:
                 backend = self.DEFAULT_SUBROUTINIZER_FOR_CFF_VERSION[cffOutputVersion]
             else:
                 backend = self.SubroutinizerBackend(subroutinizer)
-            self._subroutinize(backend, self.otf, cffOutputVersion)
+            if subroutinizerCache is not None:
+                self._subroutinize_with_cache(
+                    subroutinizerCache, backend, self.otf, cffOutputVersion
+                )
+            else:
+                self._subroutinize(backend, self.otf, cffOutputVersion)
 
         elif cffInputVersion != cffOutputVersion:
             if (
@@ -163,19 +228,28 @@ class PostProcessor:
     def _rename_glyphs_from_ufo(self):
         """Rename glyphs using ufo.lib.public.postscriptNames in UFO."""
         rename_map = self._build_production_names()
+        # only the glyphs whose name changes
+        rename_map = {n: p for n, p in rename_map.items() if n != p}
 
         otf = self.otf
-        otf.setGlyphOrder([rename_map.get(n, n) for n in otf.getGlyphOrder()])
-
-        # we need to compile format 2 'post' table so that the 'extraNames'
-        # attribute is updated with the list of the names outside the
-        # standard Macintosh glyph order; otherwise, if one dumps the font
-        # to TTX directly before compiling first, the post table will not
+        glyph_order = otf.getGlyphOrder()
+        if rename_map:
+            glyph_order = [rename_map.get(n, n) for n in glyph_order]
+            otf.setGlyphOrder(glyph_order)
+
+        # update the 'extraNames' of the format 2 'post' table with the list
+        # of the names outside the standard Macintosh glyph order, like the
+        # table's compile method does; otherwise, if one dumps the font to
+        # TTX directly before compiling first, the post table will not
         # contain the extraNames.
         if "post" in otf and otf["post"].formatType == 2.0:
-            otf["post"].extraNames = []
-            otf["post"].compile(otf)
+            post = otf["post"]
+            post.extraNames = self._post_extra_names(
+                glyph_order, getattr(post, "mapping", {})
+            )
 
+        if not rename_map:
+            return
         cff_tag = "CFF " if "CFF " in otf else "CFF2" if "CFF2" in otf else None
         if cff_tag == "CFF " or (cff_tag == "CFF2" and otf.isLoaded(cff_tag)):
             cff = otf[cff_tag].cff.topDictIndex[0]
@@ -185,6 +259,20 @@ class PostProcessor:
             }
             cff.charset = [rename_map.get(n, n) for n in cff.charset]
 
+    @staticmethod
+    def _post_extra_names(glyph_order, mapping):
+        """Return the names of a format 2 'post' table which are not in the
+        standard Macintosh glyph order, without duplicates.
+        """
+        extra_names = []
+        seen = set(STANDARD_GLYPH_NAMES)
+        for glyph_name in glyph_order:
+            ps_name = mapping.get(glyph_name, glyph_name)
+            if ps_name not in seen:
+                seen.add(ps_name)
+                extra_names.append(ps_name)
+        return extra_names
+
     def _build_production_names(self):
         seen = {}
         rename_map = {}
@@ -226,8 +314,17 @@ class PostProcessor:
         return name
 
     def _build_production_name(self, glyph):
-        """Build a production name for a single glyph."""
+        """Build a production name for a single glyph.
+
+        The names are cached, as the names of the glyphs with suffixes and of
+        the ligatures are built from the production names of other glyphs.
+        """
+        name = glyph.name
+        if name not in self._production_names:
+            self._production_names[name] = self._make_production_name(glyph)
+        return self._production_names[name]
 
+    def _make_production_name(self, glyph):
         # use PostScript names from UFO lib if available
         if self._postscriptNames:
             production_name = self._postscriptNames.get(glyph.name)
@@ -312,6 +409,57 @@ class PostProcessor:
         subroutinize = getattr(cls, f"_subroutinize_with_{backend.value}")
         subroutinize(otf, cffVersion)
 
+    @classmethod
+    def _subroutinize_with_cache(cls, cache, backend, otf, cffVersion):
+        from ufo2ft.cache import FileCache
+
+        if not isinstance(cache, FileCache):
+            cache = FileCache(cache)
+
+        cffInputVersion = cls._get_cff_version(otf)
+        inputTag = CFF_TABLE_TAGS[cffInputVersion]
+        outputTag = CFF_TABLE_TAGS[cffVersion]
+        key = cls._subroutinizer_cache_key(backend, otf, cffVersion)
+        data = cache.get(key)
+        if data is None:
+            cls._subroutinize(backend, otf, cffVersion)
+            cache.set(key, otf.getTableData(outputTag))
+            return
+
+        logger.info("Reusing subroutinized %s table from cache", cffVersion.name)
+        table = newTable(outputTag)
+        table.decompile(data, otf)
+        if cffInputVersion == cffVersion == CFFVersion.CFF:
+            # the metadata were not part of the key, take them from the input
+            _copyCFFTopDictMetadata(otf[inputTag].cff, table.cff)
+        del otf[inputTag]
+        otf[outputTag] = table
+        if cffInputVersion == CFFVersion.CFF2 and cffVersion == CFFVersion.CFF:
+            # like cffsubr does, so that the glyph names aren't stored twice
+            cls.set_post_table_format(otf, 3.0)
+
+    @staticmethod
+    def _subroutinizer_cache_key(backend, otf, cffVersion):
+        from ufo2ft.cache import FileCache
+
+        backendModule = importlib.import_module(backend.value)
+        cffInputVersion = PostProcessor._get_cff_version(otf)
+        inputTag = CFF_TABLE_TAGS[cffInputVersion]
+        parts = [
+            "subroutinize",
+            backend.value,
+            getattr(backendModule, "__version__", ""),
+            cffInputVersion.name,
+            cffVersion.name,
+        ]
+        topDict = otf[inputTag].cff.topDictIndex[0]
+        if cffInputVersion == CFFVersion.CFF and not hasattr(topDict, "ROS"):
+            parts.extend(_iterCFFCacheKeyParts(topDict))
+        else:
+            # CFF2 and CID-keyed fonts: use the whole table
+            parts.append(otf.getTableData(inputTag))
+        return FileCache.makeKey(*parts)
+
     @classmethod
     def _subroutinize_with_compreffor(cls, otf, cffVersion):
         from compreffor import compress
@@ -340,6 +488,40 @@ class PostProcessor:
         return cffsubr.subroutinize(otf, cff_version=cffVersion, keep_glyph_names=False)
 
 
+def _iterCFFCacheKeyParts(topDict):
+    # Yield the parts of a CFF 1.0 (non CID-keyed) font which determine the
+    # output of the subroutinizers: everything but the top dict metadata.
+    excluded = {"CharStrings", "Private", "charset", "Encoding"}
+    excluded.update(CFF_TOP_DICT_METADATA_KEYS)
+    yield repr(sorted((k, v) for k, v in topDict.rawDict.items() if k not in excluded))
+    yield repr(topDict.charset)
+    yield repr(getattr(topDict, "Encoding", None))
+    private = topDict.Private
+    yield repr(sorted((k, v) for k, v in private.rawDict.items() if k != "Subrs"))
+    subrIndexes = [topDict.GlobalSubrs]
+    if "Subrs" in private.rawDict:
+        subrIndexes.append(private.Subrs)
+    charStrings = topDict.CharStrings
+    for charString in itertools.chain(
+        (charStrings[glyphName] for glyphName in topDict.charset), *subrIndexes
+    ):
+        charString.compile()
+        yield charString.bytecode
+
+
+def _copyCFFTopDictMetadata(source, target):
+    # Copy the top dict metadata and font name between two CFF 1.0 FontSets
+    target.fontNames = list(source.fontNames)
+    sourceTopDict = source.topDictIndex[0]
+    targetTopDict = target.topDictIndex[0]
+    for key in CFF_TOP_DICT_METADATA_KEYS:
+        if key in sourceTopDict.rawDict:
+            setattr(targetTopDict, key, getattr(sourceTopDict, key))
+        else:
+            targetTopDict.rawDict.pop(key, None)
+            targetTopDict.__dict__.pop(key, None)
+
+
 # Adapted from fontTools.cff.specializer.programToCommands
 # https://github.com/fonttools/fonttools/blob/babca16
 # /Lib/fontTools/cffLib/specializer.py#L40-L122
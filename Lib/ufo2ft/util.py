@@ -1,4 +1,7 @@
 import logging
+import weakref
+from array import array
+from bisect import bisect_left
 from copy import deepcopy
 from inspect import getfullargspec
 
@@ -7,6 +10,8 @@ from fontTools.feaLib.builder import addOpenTypeFeatures
 from fontTools.misc.transform import Identity, Transform
 from fontTools.pens.reverseContourPen import ReverseContourPen
 from fontTools.pens.transformPen import TransformPen
+from fontTools.ttLib.tables import otTables
+from fontTools.ttLib.tables.O_S_2f_2 import OS2_UNICODE_RANGES
 
 logger = logging.getLogger(__name__)
 
@@ -227,14 +232,143 @@ def compileGSUB(featureFile, glyphOrder):
 
 
 def closeGlyphsOverGSUB(gsub, glyphs):
-    """Use the FontTools subsetter to perform a closure over the GSUB table
-    given the initial `glyphs` (set of glyph names, str). Update the set
-    in-place adding all the glyph names that can be reached via GSUB
-    substitutions from this initial set.
+    """Perform a closure over the GSUB table given the initial `glyphs` (set
+    of glyph names, str). Update the set in-place adding all the glyph names
+    that can be reached via GSUB substitutions from this initial set.
     """
-    subsetter = subset.Subsetter()
-    subsetter.glyphs = glyphs
-    gsub.closure_glyphs(subsetter)
+    glyphs.update(getSubstitutionGraph(gsub).closure(glyphs))
+
+
+class SubstitutionGraph:
+    """The glyphs which can be substituted for other glyphs by a GSUB table,
+    for computing closures of many sets of glyphs over the same table.
+
+    The single, multiple, alternate and ligature substitutions of the lookups
+    referenced by the features are turned into a graph which is traversed
+    from the initial glyphs, a ligature being reached once all its components
+    are. The closure over the contextual lookups depends on the whole set of
+    glyphs, so it is left to the FontTools subsetter, which is run again on
+    these lookups only until no new glyphs are reached.
+
+    The result is the same as the closure computed by the subsetter over the
+    whole table.
+    """
+
+    def __init__(self, gsub):
+        self.table = table = gsub.table
+        # {glyph: set of glyphs substituted for it}
+        self.edges = {}
+        # {glyph: [(frozenset of all components, ligature glyph), ...]}
+        self.ligatures = {}
+        self.contextualLookups = []
+
+        if not table.LookupList:
+            return
+        if table.ScriptList:
+            featureIndices = table.ScriptList.collect_features()
+        else:
+            featureIndices = []
+        if table.FeatureList:
+            lookupIndices = table.FeatureList.collect_lookups(featureIndices)
+        else:
+            lookupIndices = []
+        if getattr(table, "FeatureVariations", None):
+            lookupIndices += table.FeatureVariations.collect_lookups(featureIndices)
+        lookups = table.LookupList.Lookup
+        for i in sorted(set(lookupIndices)):
+            if i >= len(lookups) or not lookups[i]:
+                continue
+            lookup = lookups[i]
+            for st in lookup.SubTable:
+                if st and not self._addSubTable(st):
+                    self.contextualLookups.append(lookup)
+                    break
+
+    def _addSubTable(self, st):
+        # Add the substitutions of the subtable to the graph. Return False
+        # for contextual subtables, which can't be part of the graph.
+        if isinstance(st, otTables.ExtensionSubst):
+            st = st.ExtSubTable
+        edges = self.edges
+        if isinstance(st, otTables.SingleSubst):
+            for glyph, subst in st.mapping.items():
+                edges.setdefault(glyph, set()).add(subst)
+        elif isinstance(st, otTables.MultipleSubst):
+            for glyph, subst in st.mapping.items():
+                edges.setdefault(glyph, set()).update(subst)
+        elif isinstance(st, otTables.AlternateSubst):
+            for glyph, alternates in st.alternates.items():
+                edges.setdefault(glyph, set()).update(alternates)
+        elif isinstance(st, otTables.LigatureSubst):
+            for glyph, ligatures in st.ligatures.items():
+                for lig in ligatures:
+                    components = frozenset([glyph, *lig.Component])
+                    for component in components:
+                        self.ligatures.setdefault(component, []).append(
+                            (components, lig.LigGlyph)
+                        )
+        else:
+            return False
+        return True
+
+    def closure(self, glyphs, closedGlyphs=None):
+        """Return the set of the glyphs that can be reached from `glyphs`
+        (iterable of glyph names) via substitutions, including these.
+
+        `closedGlyphs` is an (optional) set of glyphs which is already closed
+        over the substitutions and is added to the initial glyphs; only the
+        glyphs reachable from `glyphs` are followed when traversing the graph.
+        """
+        result = set(closedGlyphs) if closedGlyphs else set()
+        stack = [g for g in glyphs if g not in result]
+        result.update(stack)
+        edges = self.edges
+        ligatures = self.ligatures
+        while True:
+            while stack:
+                glyph = stack.pop()
+                for subst in edges.get(glyph, ()):
+                    if subst not in result:
+                        result.add(subst)
+                        stack.append(subst)
+                for components, lig in ligatures.get(glyph, ()):
+                    if lig not in result and components.issubset(result):
+                        result.add(lig)
+                        stack.append(lig)
+            if not self.contextualLookups:
+                break
+            stack = list(self._closeOverContextualLookups(result) - result)
+            if not stack:
+                break
+            result.update(stack)
+        return result
+
+    def _closeOverContextualLookups(self, glyphs):
+        subsetter = subset.Subsetter()
+        subsetter.glyphs = set(glyphs)
+        subsetter.table = self.table
+        subsetter._doneLookups = {}
+        for lookup in self.contextualLookups:
+            lookup.closure_glyphs(subsetter)
+        return subsetter.glyphs
+
+
+# {id(gsub): (weakref to gsub, SubstitutionGraph)}; GSUB tables aren't hashable, and the entries
+# are removed when the tables are garbage collected
+_substitutionGraphs = {}
+
+
+def getSubstitutionGraph(gsub):
+    """Return the SubstitutionGraph of the GSUB table, which is only built
+    once for the same table object.
+    """
+    key = id(gsub)
+    ref, graph = _substitutionGraphs.get(key, (None, None))
+    if ref is None or ref() is not gsub:
+        graph = SubstitutionGraph(gsub)
+        _substitutionGraphs[key] = (weakref.ref(gsub), graph)
+        weakref.finalize(gsub, _substitutionGraphs.pop, key, None)
+    return graph
 
 
 def classifyGlyphs(unicodeFunc, cmap, gsub=None):
@@ -259,27 +393,137 @@ def classifyGlyphs(unicodeFunc, cmap, gsub=None):
             glyphSets.setdefault(key, set()).add(glyphName)
 
     if gsub is not None:
-        if neutralGlyphs:
-            closeGlyphsOverGSUB(gsub, neutralGlyphs)
-
-        for glyphs in glyphSets.values():
-            s = glyphs | neutralGlyphs
-            closeGlyphsOverGSUB(gsub, s)
-            glyphs.update(s - neutralGlyphs)
+        _closeGlyphSetsOverGSUB(gsub, glyphSets, neutralGlyphs)
 
     return glyphSets
 
 
+def _closeGlyphSetsOverGSUB(gsub, glyphSets, neutralGlyphs):
+    graph = getSubstitutionGraph(gsub)
+    if neutralGlyphs:
+        neutralGlyphs.update(graph.closure(neutralGlyphs))
+
+    for glyphs in glyphSets.values():
+        s = graph.closure(glyphs, neutralGlyphs)
+        glyphs.update(s - neutralGlyphs)
+
+
 def unicodeInScripts(uv, scripts):
     """Check UnicodeData's ScriptExtension property for unicode codepoint
     'uv' and return True if it intersects with the set of 'scripts' provided,
     False if it does not intersect.
     Return None for 'Common' script ('Zyyy').
     """
-    sx = unicodedata.script_extension(chr(uv))
-    if "Zyyy" in sx:
+    return scriptExtensionsInScripts(unicodedata.script_extension(chr(uv)), scripts)
+
+
+def scriptExtensionsInScripts(scriptExtensions, scripts):
+    """Same as `unicodeInScripts`, but takes the set of ScriptExtension
+    property values of a character instead of its codepoint.
+    """
+    if "Zyyy" in scriptExtensions:
         return None
-    return not sx.isdisjoint(scripts)
+    return not scriptExtensions.isdisjoint(scripts)
+
+
+class UnicodeCoverageIndex:
+    """Index of the Unicode characters mapped by a font, and of their
+    Unicode properties.
+
+    'cmap' is a dictionary mapping Unicode codepoints to glyph names.
+    The codepoints are stored in a sorted array, along with the glyph
+    names they map to. The columns of property values for each codepoint
+    (one of the keys of `PROPERTIES`) are only computed the first time
+    they are requested, and are then shared by all the users of the index.
+    """
+
+    PROPERTIES = {
+        "script": unicodedata.script,
+        "scriptExtensions": lambda char: frozenset(unicodedata.script_extension(char)),
+        "bidiType": unicodedata.bidirectional,
+        "block": unicodedata.block,
+    }
+
+    def __init__(self, cmap):
+        self.codepoints = array("L", sorted(cmap))
+        self.glyphNames = [cmap[uv] for uv in self.codepoints]
+        self._columns = {}
+        self._groups = {}
+
+    def __len__(self):
+        return len(self.codepoints)
+
+    def __contains__(self, uv):
+        i = bisect_left(self.codepoints, uv)
+        return i < len(self.codepoints) and self.codepoints[i] == uv
+
+    def column(self, prop):
+        """Return the list of 'prop' values for each of the codepoints."""
+        try:
+            return self._columns[prop]
+        except KeyError:
+            pass
+        func = self.PROPERTIES[prop]
+        # many characters share the same value: store only one copy of each
+        values = {}
+        column = [
+            values.setdefault(value, value)
+            for value in (func(chr(uv)) for uv in self.codepoints)
+        ]
+        self._columns[prop] = column
+        return column
+
+    def groupGlyphs(self, prop):
+        """Return a dictionary of glyph name sets keyed by 'prop' values."""
+        try:
+            return self._groups[prop]
+        except KeyError:
+            pass
+        groups = {}
+        for value, glyphName in zip(self.column(prop), self.glyphNames):
+            groups.setdefault(value, set()).add(glyphName)
+        self._groups[prop] = groups
+        return groups
+
+    def values(self, prop):
+        """Return the set of distinct 'prop' values in the index."""
+        return self.groupGlyphs(prop).keys()
+
+    def classify(self, prop, func, gsub=None):
+        """Same as `classifyGlyphs`, but 'func' takes a value of the 'prop'
+        column instead of a codepoint, and is only called once for each
+        distinct value.
+        """
+        glyphSets = {}
+        neutralGlyphs = set()
+        for value, glyphNames in self.groupGlyphs(prop).items():
+            key = func(value)
+            if key is None:
+                neutralGlyphs.update(glyphNames)
+            else:
+                glyphSets.setdefault(key, set()).update(glyphNames)
+
+        if gsub is not None:
+            _closeGlyphSetsOverGSUB(gsub, glyphSets, neutralGlyphs)
+
+        return glyphSets
+
+    def getUnicodeRanges(self):
+        """Return the set of OS/2 'ulUnicodeRange' bits for which at least
+        one codepoint is in the respective Unicode block ranges.
+        """
+        codepoints = self.codepoints
+        bits = set()
+        for bit, blocks in enumerate(OS2_UNICODE_RANGES):
+            for _, (start, stop) in blocks:
+                i = bisect_left(codepoints, start)
+                if i < len(codepoints) and codepoints[i] <= stop:
+                    bits.add(bit)
+                    break
+        # bit 57 ("Non Plane 0") is set if any codepoint is beyond the BMP
+        if codepoints and codepoints[-1] >= 0x10000:
+            bits.add(57)
+        return bits
 
 
 def calcCodePageRanges(unicodes):
@@ -290,80 +534,80 @@ def calcCodePageRanges(unicodes):
     """
     codepageRanges = set()
 
-    chars = [chr(u) for u in unicodes]
+    unicodes = set(unicodes)
+    chars = {chr(u) for u in unicodes}
 
     hasAscii = set(range(0x20, 0x7E)).issubset(unicodes)
     hasLineart = "┤" in chars
 
-    for char in chars:
-        if char == "Þ" and hasAscii:
-            codepageRanges.add(0)  # Latin 1
-        elif char == "Ľ" and hasAscii:
-            codepageRanges.add(1)  # Latin 2: Eastern Europe
-            if hasLineart:
-                codepageRanges.add(58)  # Latin 2
-        elif char == "Б":
-            codepageRanges.add(2)  # Cyrillic
-            if "Ѕ" in chars and hasLineart:
-                codepageRanges.add(57)  # IBM Cyrillic
-            if "╜" in chars and hasLineart:
-                codepageRanges.add(49)  # MS-DOS Russian
-        elif char == "Ά":
-            codepageRanges.add(3)  # Greek
-            if hasLineart and "½" in chars:
-                codepageRanges.add(48)  # IBM Greek
-            if hasLineart and "√" in chars:
-                codepageRanges.add(60)  # Greek, former 437 G
-        elif char == "İ" and hasAscii:
-            codepageRanges.add(4)  # Turkish
-            if hasLineart:
-                codepageRanges.add(56)  # IBM turkish
-        elif char == "א":
-            codepageRanges.add(5)  # Hebrew
-            if hasLineart and "√" in chars:
-                codepageRanges.add(53)  # Hebrew
-        elif char == "ر":
-            codepageRanges.add(6)  # Arabic
-            if "√" in chars:
-                codepageRanges.add(51)  # Arabic
-            if hasLineart:
-                codepageRanges.add(61)  # Arabic; ASMO 708
-        elif char == "ŗ" and hasAscii:
-            codepageRanges.add(7)  # Windows Baltic
-            if hasLineart:
-                codepageRanges.add(59)  # MS-DOS Baltic
-        elif char == "₫" and hasAscii:
-            codepageRanges.add(8)  # Vietnamese
-        elif char == "ๅ":
-            codepageRanges.add(16)  # Thai
-        elif char == "エ":
-            codepageRanges.add(17)  # JIS/Japan
-        elif char == "ㄅ":
-            codepageRanges.add(18)  # Chinese: Simplified chars
-        elif char == "ㄱ":
-            codepageRanges.add(19)  # Korean wansung
-        elif char == "央":
-            codepageRanges.add(20)  # Chinese: Traditional chars
-        elif char == "곴":
-            codepageRanges.add(21)  # Korean Johab
-        elif char == "♥" and hasAscii:
-            codepageRanges.add(30)  # OEM Character Set
-        # TODO: Symbol bit has a special meaning (check the spec), we need
-        # to confirm if this is wanted by default.
-        # elif chr(0xF000) <= char <= chr(0xF0FF):
-        #    codepageRanges.add(31)          # Symbol Character Set
-        elif char == "þ" and hasAscii and hasLineart:
-            codepageRanges.add(54)  # MS-DOS Icelandic
-        elif char == "╚" and hasAscii:
-            codepageRanges.add(62)  # WE/Latin 1
-            codepageRanges.add(63)  # US
-        elif hasAscii and hasLineart and "√" in chars:
-            if char == "Å":
-                codepageRanges.add(50)  # MS-DOS Nordic
-            elif char == "é":
-                codepageRanges.add(52)  # MS-DOS Canadian French
-            elif char == "õ":
-                codepageRanges.add(55)  # MS-DOS Portuguese
+    if "Þ" in chars and hasAscii:
+        codepageRanges.add(0)  # Latin 1
+    if "Ľ" in chars and hasAscii:
+        codepageRanges.add(1)  # Latin 2: Eastern Europe
+        if hasLineart:
+            codepageRanges.add(58)  # Latin 2
+    if "Б" in chars:
+        codepageRanges.add(2)  # Cyrillic
+        if "Ѕ" in chars and hasLineart:
+            codepageRanges.add(57)  # IBM Cyrillic
+        if "╜" in chars and hasLineart:
+            codepageRanges.add(49)  # MS-DOS Russian
+    if "Ά" in chars:
+        codepageRanges.add(3)  # Greek
+        if hasLineart and "½" in chars:
+            codepageRanges.add(48)  # IBM Greek
+        if hasLineart and "√" in chars:
+            codepageRanges.add(60)  # Greek, former 437 G
+    if "İ" in chars and hasAscii:
+        codepageRanges.add(4)  # Turkish
+        if hasLineart:
+            codepageRanges.add(56)  # IBM turkish
+    if "א" in chars:
+        codepageRanges.add(5)  # Hebrew
+        if hasLineart and "√" in chars:
+            codepageRanges.add(53)  # Hebrew
+    if "ر" in chars:
+        codepageRanges.add(6)  # Arabic
+        if "√" in chars:
+            codepageRanges.add(51)  # Arabic
+        if hasLineart:
+            codepageRanges.add(61)  # Arabic; ASMO 708
+    if "ŗ" in chars and hasAscii:
+        codepageRanges.add(7)  # Windows Baltic
+        if hasLineart:
+            codepageRanges.add(59)  # MS-DOS Baltic
+    if "₫" in chars and hasAscii:
+        codepageRanges.add(8)  # Vietnamese
+    if "ๅ" in chars:
+        codepageRanges.add(16)  # Thai
+    if "エ" in chars:
+        codepageRanges.add(17)  # JIS/Japan
+    if "ㄅ" in chars:
+        codepageRanges.add(18)  # Chinese: Simplified chars
+    if "ㄱ" in chars:
+        codepageRanges.add(19)  # Korean wansung
+    if "央" in chars:
+        codepageRanges.add(20)  # Chinese: Traditional chars
+    if "곴" in chars:
+        codepageRanges.add(21)  # Korean Johab
+    if "♥" in chars and hasAscii:
+        codepageRanges.add(30)  # OEM Character Set
+    # TODO: Symbol bit has a special meaning (check the spec), we need
+    # to confirm if this is wanted by default.
+    # if any(0xF000 <= u <= 0xF0FF for u in unicodes):
+    #    codepageRanges.add(31)          # Symbol Character Set
+    if "þ" in chars and hasAscii and hasLineart:
+        codepageRanges.add(54)  # MS-DOS Icelandic
+    if "╚" in chars and hasAscii:
+        codepageRanges.add(62)  # WE/Latin 1
+        codepageRanges.add(63)  # US
+    if hasAscii and hasLineart and "√" in chars:
+        if "Å" in chars:
+            codepageRanges.add(50)  # MS-DOS Nordic
+        if "é" in chars:
+            codepageRanges.add(52)  # MS-DOS Canadian French
+        if "õ" in chars:
+            codepageRanges.add(55)  # MS-DOS Portuguese
 
     if hasAscii and "‰" in chars and "∑" in chars:
         codepageRanges.add(29)  # Macintosh Character Set (US Roman)
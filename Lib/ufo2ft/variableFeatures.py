@@ -0,0 +1,489 @@
+"""Generate the features of a variable font from all its masters at once.
+
+By default, the feature writers run for each master, and fontTools.varLib
+merges the layout tables of the masters into variable tables. The writers
+which support it (see `BaseFeatureWriter.supportsVariations`) can instead
+read the data of all the masters, e.g. their kerning, and build lookups
+with variable values (VariationIndex device tables) directly. These are
+then added to the variable font built by varLib from the masters compiled
+without those writers.
+"""
+
+import logging
+from collections import OrderedDict
+
+from fontTools import varLib
+from fontTools.misc.fixedTools import otRound
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables import otTables as ot
+from fontTools.varLib.models import VariationModel
+from fontTools.varLib.varStore import OnlineVarStoreBuilder
+
+from ufo2ft.constants import MTI_FEATURES_PREFIX
+
+logger = logging.getLogger(__name__)
+
+
+# The index of the deltas of a value which doesn't vary, which is not
+# stored in the variation store.
+NO_VARIATION_INDEX = 0xFFFFFFFF
+
+
+class Variations:
+    """The masters of a designspace, from which the feature writers generate
+    the features of the variable font, and the variation store where they
+    add the deltas of the values which vary across the masters.
+
+    Only the sources of the default layer of the UFOs are masters: the
+    sparse layers have no kerning or anchors.
+
+    The glyphs of the masters are read from 'glyphSets', the glyph sets of
+    the masters after they were pre-processed, e.g. with the anchors
+    propagated by the filters (see `setGlyphSets`); by default, the glyphs
+    of the UFOs.
+
+    Args:
+      designSpaceDoc: a DesignSpaceDocument whose sources have the 'font'
+        attribute set to the UFOs.
+    """
+
+    def __init__(self, designSpaceDoc):
+        ds = varLib.load_designspace(designSpaceDoc)
+        self.axisTags = [axis.tag for axis in ds.axes.values()]
+        self.fonts = []
+        self._sourceIndices = []
+        locations = []
+        for i, (source, location) in enumerate(
+            zip(ds.masters, ds.normalized_master_locs)
+        ):
+            if source.layerName is not None:
+                continue
+            if i == ds.base_idx:
+                self.defaultIndex = len(self.fonts)
+            self.fonts.append(source.font)
+            self._sourceIndices.append(i)
+            locations.append({ds.axes[name].tag: v for name, v in location.items()})
+        self.model = VariationModel(locations, axisOrder=self.axisTags)
+        self._storeBuilder = OnlineVarStoreBuilder(self.axisTags)
+        self._storeBuilder.setModel(self.model)
+        self._varIdxs = {}
+        self.glyphSets = list(self.fonts)
+
+    @property
+    def defaultFont(self):
+        return self.fonts[self.defaultIndex]
+
+    @property
+    def defaultGlyphSet(self):
+        return self.glyphSets[self.defaultIndex]
+
+    def setGlyphSets(self, glyphSets):
+        """Set the glyph sets of the masters from the pre-processed glyph
+        sets of all the sources of the designspace, in the same order.
+        """
+        self.glyphSets = [glyphSets[i] for i in self._sourceIndices]
+
+    def storeMasterValues(self, values):
+        """Return the value of the default master and the index of the deltas
+        of the master 'values' (in the order of 'fonts') in the variation
+        store, or NO_VARIATION_INDEX if they are all the same.
+        The values are rounded to integers.
+        """
+        values = tuple(otRound(v) for v in values)
+        default = values[self.defaultIndex]
+        if all(v == default for v in values):
+            return default, NO_VARIATION_INDEX
+        varIdx = self._varIdxs.get(values)
+        if varIdx is None:
+            _, varIdx = self._storeBuilder.storeMasters(values)
+            self._varIdxs[values] = varIdx
+        return default, varIdx
+
+    def getVarStore(self):
+        """Return the variation store with the deltas stored so far, or None
+        if there are none.
+        """
+        if not self._varIdxs:
+            return None
+        return self._storeBuilder.finish()
+
+
+def splitVariableFeatureWriters(ufo, featureWriters=None, featureCompilerClass=None):
+    """Return the feature writers to run for each master, and those which
+    generate the features from all the masters at once (empty if the
+    features of the default master 'ufo' aren't compiled by the default
+    FeatureCompiler).
+
+    The 'featureWriters' are resolved like in the FeatureCompiler: if None,
+    they are loaded from the UFO lib, or the default writers are used.
+    """
+    from ufo2ft.featureCompiler import FeatureCompiler
+    from ufo2ft.featureWriters import loadFeatureWriters
+
+    if featureCompilerClass is None:
+        if any(
+            fn.startswith(MTI_FEATURES_PREFIX) and fn.endswith(".mti")
+            for fn in ufo.data.fileNames
+        ):
+            return featureWriters, []
+    elif not issubclass(featureCompilerClass, FeatureCompiler):
+        return featureWriters, []
+
+    if featureWriters is None:
+        featureWriters = loadFeatureWriters(ufo)
+        if featureWriters is None:
+            featureWriters = FeatureCompiler.defaultFeatureWriters
+    masterWriters = []
+    variableWriters = []
+    for writer in featureWriters:
+        if writer.supportsVariations:
+            variableWriters.append(writer)
+        else:
+            masterWriters.append(writer)
+    return masterWriters, variableWriters
+
+
+def compileVariableFeatures(variations, ttFont, featureWriters, debugFeatureFile=None):
+    """Generate features from all the masters with the feature writers which
+    support variations, and add their lookups to the GPOS table of 'ttFont',
+    the variable font built by varLib from the masters.
+
+    The other GSUB feature writers in 'featureWriters' run first, like in the
+    FeatureCompiler, but only the features of the variable writers are
+    compiled: the others are already in the variable font.
+
+    The generated features are compiled on their own, with the
+    'languagesystem' statements, mark classes and GDEF table block of the
+    default master, so they can't reference the lookups of the UFO features.
+    Their lookups go after those of the variable font (see `mergeGPOS`).
+    """
+    from ufo2ft.featureCompiler import FeatureCompiler, parseLayoutFeatures
+    from ufo2ft.featureWriters import ast
+    from ufo2ft.outlineCompiler import StubGlyph
+
+    ufo = variations.defaultFont
+    defaultGlyphSet = variations.defaultGlyphSet
+    glyphOrder = ttFont.getGlyphOrder()
+    glyphSet = OrderedDict()
+    for glyphName in glyphOrder:
+        if glyphName in defaultGlyphSet:
+            glyphSet[glyphName] = defaultGlyphSet[glyphName]
+        else:
+            # e.g. the .notdef glyph added by the outline compiler
+            glyphSet[glyphName] = StubGlyph(
+                glyphName,
+                0,
+                ufo.info.unitsPerEm,
+                ufo.info.ascender,
+                ufo.info.descender,
+            )
+    tempFont = TTFont()
+    tempFont.setGlyphOrder(glyphOrder)
+    if "cmap" in ttFont:
+        tempFont["cmap"] = ttFont["cmap"]
+
+    writers = [
+        writer
+        for writer in featureWriters
+        if writer.supportsVariations or writer.tableTag == "GSUB"
+    ]
+    compiler = FeatureCompiler(
+        ufo,
+        tempFont,
+        glyphSet=glyphSet,
+        featureWriters=writers,
+        variations=variations,
+    )
+
+    feaFile = parseLayoutFeatures(ufo)
+    existing = None
+    for writer in sorted(compiler.featureWriters, key=lambda w: w.supportsVariations):
+        if writer.supportsVariations and existing is None:
+            existing = {id(st) for st in feaFile.statements}
+        writer.write(ufo, feaFile, compiler=compiler)
+    if existing is None:
+        return
+
+    statements = [st for st in feaFile.statements if id(st) not in existing]
+    if not statements:
+        return
+    variableFeaFile = ast.FeatureFile()
+    variableFeaFile.statements = [
+        st
+        for st in feaFile.statements
+        if isinstance(st, ast.LanguageSystemStatement)
+        or (isinstance(st, ast.TableBlock) and st.name == "GDEF")
+    ] + statements
+    # the mark classes of the generated features may extend those of the
+    # UFO features
+    variableFeaFile.markClasses = feaFile.markClasses
+    if debugFeatureFile:
+        debugFeatureFile.write("\n### Variable features ###\n")
+        debugFeatureFile.write(variableFeaFile.asFea())
+
+    compiler.featureFile = variableFeaFile
+    compiler.buildTables()
+    if "GPOS" not in tempFont:
+        return
+    gdef = tempFont["GDEF"].table if "GDEF" in tempFont else None
+    mergeGPOS(ttFont, tempFont["GPOS"].table, variations.getVarStore(), gdef)
+
+
+def mergeGPOS(ttFont, gpos, varStore=None, gdef=None):
+    """Add the lookups of the GPOS table 'gpos', and the variation store of
+    its device tables, to the GPOS and GDEF tables of 'ttFont'.
+
+    The lookups are appended, so they must not reference other lookups.
+    Their features are added to the language systems of 'ttFont', merged
+    with the features with the same tag: e.g. the lookups of the 'kern'
+    feature of 'gpos' are added to the 'kern' feature of 'ttFont'.
+
+    'gdef' is the GDEF table compiled with 'gpos': its glyph classes and
+    mark filtering sets are added to those of 'ttFont' (its mark attachment
+    classes are not, they aren't generated by the feature writers).
+    """
+    if "GPOS" not in ttFont:
+        table = ttFont["GPOS"] = newTable("GPOS")
+        table.table = _newLayoutTable(ot.GPOS)
+    table = ttFont["GPOS"].table
+    if gdef is not None:
+        _mergeGDEF(ttFont, gpos, gdef)
+    if varStore is not None:
+        _mergeVarStore(ttFont, gpos, varStore)
+
+    lookupOffset = len(table.LookupList.Lookup)
+    table.LookupList.Lookup.extend(gpos.LookupList.Lookup)
+    table.LookupList.LookupCount = len(table.LookupList.Lookup)
+
+    langSystems = dict(_iterLangSys(table))
+    featureRecords = table.FeatureList.FeatureRecord
+    newFeatureIndices = {}
+    for key, otherLangSys in _iterLangSys(gpos):
+        langSys = langSystems.get(key)
+        if langSys is None:
+            langSys = langSystems[key] = _addLangSys(table, *key)
+        for otherIndex in otherLangSys.FeatureIndex:
+            otherRecord = gpos.FeatureList.FeatureRecord[otherIndex]
+            tag = otherRecord.FeatureTag
+            lookupIndices = [
+                i + lookupOffset for i in otherRecord.Feature.LookupListIndex
+            ]
+            # the feature with the same tag in the language system, if any
+            for position, index in enumerate(langSys.FeatureIndex):
+                if featureRecords[index].FeatureTag == tag:
+                    break
+            else:
+                position = index = None
+            # features may be shared by several language systems, so the
+            # merged features are new ones (the unused ones are pruned)
+            newIndex = newFeatureIndices.get((index, otherIndex))
+            if newIndex is None:
+                record = ot.FeatureRecord()
+                record.FeatureTag = tag
+                record.Feature = ot.Feature()
+                record.Feature.FeatureParams = None
+                if index is not None:
+                    feature = featureRecords[index].Feature
+                    record.Feature.FeatureParams = feature.FeatureParams
+                    lookupIndices = feature.LookupListIndex + lookupIndices
+                record.Feature.LookupListIndex = sorted(set(lookupIndices))
+                record.Feature.LookupCount = len(record.Feature.LookupListIndex)
+                newIndex = newFeatureIndices[index, otherIndex] = len(featureRecords)
+                featureRecords.append(record)
+            if position is None:
+                langSys.FeatureIndex.append(newIndex)
+            else:
+                langSys.FeatureIndex[position] = newIndex
+    _sortFeatures(table)
+
+
+def _newLayoutTable(tableClass):
+    table = tableClass()
+    table.Version = 0x00010000
+    table.ScriptList = ot.ScriptList()
+    table.ScriptList.ScriptRecord = []
+    table.ScriptList.ScriptCount = 0
+    table.FeatureList = ot.FeatureList()
+    table.FeatureList.FeatureRecord = []
+    table.FeatureList.FeatureCount = 0
+    table.LookupList = ot.LookupList()
+    table.LookupList.Lookup = []
+    table.LookupList.LookupCount = 0
+    return table
+
+
+def _iterLangSys(table):
+    # yield ((scriptTag, langSysTag), langSys), with langSysTag None for the
+    # default language system of the script
+    for scriptRecord in table.ScriptList.ScriptRecord:
+        script = scriptRecord.Script
+        if script.DefaultLangSys is not None:
+            yield (scriptRecord.ScriptTag, None), script.DefaultLangSys
+        for langSysRecord in script.LangSysRecord:
+            yield (scriptRecord.ScriptTag, langSysRecord.LangSysTag), (
+                langSysRecord.LangSys
+            )
+
+
+def _addLangSys(table, scriptTag, langSysTag):
+    # a language system missing in the table used the features of the
+    # default language system of its script, which it starts with
+    scriptList = table.ScriptList
+    for scriptRecord in scriptList.ScriptRecord:
+        if scriptRecord.ScriptTag == scriptTag:
+            script = scriptRecord.Script
+            break
+    else:
+        scriptRecord = ot.ScriptRecord()
+        scriptRecord.ScriptTag = scriptTag
+        script = scriptRecord.Script = ot.Script()
+        script.DefaultLangSys = None
+        script.LangSysRecord = []
+        script.LangSysCount = 0
+        scriptList.ScriptRecord.append(scriptRecord)
+        scriptList.ScriptRecord.sort(key=lambda r: r.ScriptTag)
+        scriptList.ScriptCount = len(scriptList.ScriptRecord)
+    langSys = ot.LangSys()
+    langSys.LookupOrder = None
+    langSys.ReqFeatureIndex = 0xFFFF
+    langSys.FeatureIndex = []
+    if langSysTag is not None and script.DefaultLangSys is not None:
+        langSys.FeatureIndex = list(script.DefaultLangSys.FeatureIndex)
+    if langSysTag is None:
+        script.DefaultLangSys = langSys
+    else:
+        langSysRecord = ot.LangSysRecord()
+        langSysRecord.LangSysTag = langSysTag
+        langSysRecord.LangSys = langSys
+        script.LangSysRecord.append(langSysRecord)
+        script.LangSysRecord.sort(key=lambda r: r.LangSysTag)
+        script.LangSysCount = len(script.LangSysRecord)
+    return langSys
+
+
+def _sortFeatures(table):
+    # drop the features which are no longer used, and sort the others by
+    # tag as the FeatureList must be
+    featureRecords = table.FeatureList.FeatureRecord
+    langSystems = [langSys for _, langSys in _iterLangSys(table)]
+    substitutions = []
+    if getattr(table, "FeatureVariations", None) is not None:
+        for record in table.FeatureVariations.FeatureVariationRecord:
+            substitutions.extend(record.FeatureTableSubstitution.SubstitutionRecord)
+    used = set()
+    for langSys in langSystems:
+        used.update(langSys.FeatureIndex)
+        if langSys.ReqFeatureIndex != 0xFFFF:
+            used.add(langSys.ReqFeatureIndex)
+    used.update(s.FeatureIndex for s in substitutions)
+    order = sorted(used, key=lambda i: (featureRecords[i].FeatureTag, i))
+    mapping = {index: newIndex for newIndex, index in enumerate(order)}
+    table.FeatureList.FeatureRecord = [featureRecords[i] for i in order]
+    table.FeatureList.FeatureCount = len(order)
+    for langSys in langSystems:
+        langSys.FeatureIndex = sorted(mapping[i] for i in langSys.FeatureIndex)
+        langSys.FeatureCount = len(langSys.FeatureIndex)
+        if langSys.ReqFeatureIndex != 0xFFFF:
+            langSys.ReqFeatureIndex = mapping[langSys.ReqFeatureIndex]
+    for substitution in substitutions:
+        substitution.FeatureIndex = mapping[substitution.FeatureIndex]
+
+
+def _getGDEF(ttFont, version):
+    # the GDEF table of ttFont, created or upgraded to 'version' if needed
+    if "GDEF" not in ttFont:
+        ttFont["GDEF"] = newTable("GDEF")
+        gdef = ttFont["GDEF"].table = ot.GDEF()
+        gdef.GlyphClassDef = None
+        gdef.AttachList = None
+        gdef.LigCaretList = None
+        gdef.MarkAttachClassDef = None
+        gdef.Version = 0x00010000
+    gdef = ttFont["GDEF"].table
+    if gdef.Version < 0x00010002 <= version:
+        gdef.MarkGlyphSetsDef = None
+    if gdef.Version < 0x00010003 <= version:
+        gdef.VarStore = None
+    gdef.Version = max(gdef.Version, version)
+    return gdef
+
+
+def _mergeGDEF(ttFont, gpos, otherGDEF):
+    # add the glyph classes and the mark filtering sets of 'otherGDEF' to the
+    # GDEF table of ttFont, remapping the filtering sets of the lookups of
+    # 'gpos', the table compiled with 'otherGDEF'
+    otherSets = None
+    if otherGDEF.Version >= 0x00010002 and otherGDEF.MarkGlyphSetsDef is not None:
+        otherSets = otherGDEF.MarkGlyphSetsDef.Coverage
+    gdef = _getGDEF(ttFont, 0x00010002 if otherSets else 0x00010000)
+    if otherGDEF.GlyphClassDef is not None:
+        if gdef.GlyphClassDef is None:
+            gdef.GlyphClassDef = ot.GlyphClassDef()
+            gdef.GlyphClassDef.classDefs = {}
+        # the classes of the variable font, e.g. inferred from the GSUB
+        # lookups, take precedence
+        classDefs = gdef.GlyphClassDef.classDefs
+        for glyphName, glyphClass in otherGDEF.GlyphClassDef.classDefs.items():
+            classDefs.setdefault(glyphName, glyphClass)
+    if not otherSets:
+        return
+    if gdef.MarkGlyphSetsDef is None:
+        gdef.MarkGlyphSetsDef = ot.MarkGlyphSetsDef()
+        gdef.MarkGlyphSetsDef.MarkSetTableFormat = 1
+        gdef.MarkGlyphSetsDef.Coverage = []
+    coverages = gdef.MarkGlyphSetsDef.Coverage
+    setIndices = {frozenset(c.glyphs): i for i, c in enumerate(coverages)}
+    setMapping = []
+    for coverage in otherSets:
+        key = frozenset(coverage.glyphs)
+        index = setIndices.get(key)
+        if index is None:
+            index = setIndices[key] = len(coverages)
+            coverages.append(coverage)
+        setMapping.append(index)
+    gdef.MarkGlyphSetsDef.MarkSetCount = len(coverages)
+    for lookup in gpos.LookupList.Lookup:
+        if lookup.LookupFlag & 0x0010:
+            lookup.MarkFilteringSet = setMapping[lookup.MarkFilteringSet]
+
+
+def _mergeVarStore(ttFont, gpos, varStore):
+    # append the variation data of 'varStore' to the variation store of the
+    # GDEF table, then optimize the latter like varLib does
+    gdef = _getGDEF(ttFont, 0x00010003)
+    if gdef.VarStore is None:
+        gdef.VarStore = varStore
+    else:
+        store = gdef.VarStore
+        regions = store.VarRegionList.Region
+        regionIndices = {_regionKey(region): i for i, region in enumerate(regions)}
+        regionMapping = []
+        for region in varStore.VarRegionList.Region:
+            key = _regionKey(region)
+            index = regionIndices.get(key)
+            if index is None:
+                index = regionIndices[key] = len(regions)
+                regions.append(region)
+            regionMapping.append(index)
+        store.VarRegionList.RegionCount = len(regions)
+        varIdxMapping = {}
+        outerOffset = len(store.VarData)
+        for outer, varData in enumerate(varStore.VarData):
+            varData.VarRegionIndex = [regionMapping[i] for i in varData.VarRegionIndex]
+            for inner in range(len(varData.Item)):
+                varIdx = (outer << 16) + inner
+                varIdxMapping[varIdx] = varIdx + (outerOffset << 16)
+            store.VarData.append(varData)
+        store.VarDataCount = len(store.VarData)
+        gpos.remap_device_varidxes(varIdxMapping)
+    varIdxMapping = gdef.VarStore.optimize()
+    gdef.remap_device_varidxes(varIdxMapping)
+    ttFont["GPOS"].table.remap_device_varidxes(varIdxMapping)
+    gpos.remap_device_varidxes(varIdxMapping)
+
+
+def _regionKey(region):
+    return tuple(
+        (axis.StartCoord, axis.PeakCoord, axis.EndCoord)
+        for axis in region.VarRegionAxis
+    )
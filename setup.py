@@ -37,6 +37,7 @@ setup(
     extras_require={
         "pathops": ["skia-pathops>=0.5.1"],
         "cffsubr": ["cffsubr>=0.2.8"],
+        "woff": ["fonttools[woff]>=4.17.1"],
     },
     python_requires=">=3.6",
     classifiers=[
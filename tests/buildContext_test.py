@@ -0,0 +1,139 @@
+import pytest
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables._c_m_a_p import CmapSubtable
+
+from ufo2ft import buildContext, compileTTF
+from ufo2ft.buildContext import BuildContext
+from ufo2ft.featureCompiler import FeatureCompiler, parseLayoutFeatures
+from ufo2ft.outlineCompiler import OutlineTTFCompiler
+from ufo2ft.util import makeOfficialGlyphOrder
+
+
+@pytest.fixture
+def testufo(FontClass):
+    ufo = FontClass()
+    ufo.newGlyph("a").unicodes = [0x61]
+    ufo.newGlyph("b").unicodes = [0x62, 0x42]
+    ufo.newGlyph("acutecomb").unicodes = [0x0301]
+    aacute = ufo.newGlyph("aacute")
+    aacute.unicodes = [0xE1]
+    pen = aacute.getPen()
+    pen.addComponent("a", (1, 0, 0, 1, 0, 0))
+    pen.addComponent("acutecomb", (1, 0, 0, 1, 0, 0))
+    ufo.glyphOrder = ["b", "a", "acutecomb", "aacute"]
+    return ufo
+
+
+class BuildContextTest:
+    def test_derived_data(self, testufo):
+        context = BuildContext(testufo)
+
+        assert context.glyphOrder == ["b", "a", "acutecomb", "aacute"]
+        assert context.unicodeToGlyphNameMapping == {
+            0x42: "b",
+            0x62: "b",
+            0x61: "a",
+            0x0301: "acutecomb",
+            0xE1: "aacute",
+        }
+        assert list(context.orderedGlyphSet) == context.glyphOrder
+        assert list(context.unicodeCoverage.codepoints) == [
+            0x42,
+            0x61,
+            0x62,
+            0xE1,
+            0x0301,
+        ]
+
+    def test_values_are_cached(self, testufo):
+        context = BuildContext(testufo)
+
+        assert context.glyphOrder is context.glyphOrder
+        assert context.unicodeCoverage is context.unicodeCoverage
+
+        feaFile = parseLayoutFeatures(testufo)
+        gdefClasses = context.getGDEFGlyphClasses(feaFile)
+        assert gdefClasses.base is None
+        assert context.getGDEFGlyphClasses(feaFile) is gdefClasses
+
+    def test_set_glyph_order(self, testufo):
+        context = BuildContext(testufo)
+        context.glyphOrder = [".notdef", "a", "b"]
+        context.glyphSet[".notdef"] = testufo["a"]
+
+        assert list(context.orderedGlyphSet) == [".notdef", "a", "b"]
+
+    def test_invalidate(self, testufo):
+        context = BuildContext(testufo)
+        orderedGlyphSet = context.orderedGlyphSet
+        cmap = context.unicodeToGlyphNameMapping
+
+        glyphSet = {"a": testufo["a"], "acutecomb": testufo["acutecomb"]}
+        context.invalidate(glyphSet)
+
+        assert context.glyphSet is glyphSet
+        assert context.glyphOrder == ["a", "acutecomb"]
+        assert list(context.orderedGlyphSet) == ["a", "acutecomb"]
+        assert context.orderedGlyphSet is not orderedGlyphSet
+        assert context.unicodeToGlyphNameMapping is not cmap
+
+
+def test_shared_by_outline_and_feature_compilers(testufo):
+    outlineCompiler = OutlineTTFCompiler(testufo)
+    context = outlineCompiler.buildContext
+
+    # .notdef is added by the outline compiler
+    assert context.glyphOrder[0] == ".notdef"
+    assert context.unicodeToGlyphNameMapping is (
+        outlineCompiler.unicodeToGlyphNameMapping
+    )
+
+    ttFont = outlineCompiler.compile()
+    featureCompiler = FeatureCompiler(testufo, ttFont, buildContext=context)
+
+    assert featureCompiler.buildContext is context
+    assert featureCompiler.glyphSet is context.orderedGlyphSet
+
+
+def test_feature_compiler_uses_ttFont_cmap(testufo):
+    outlineCompiler = OutlineTTFCompiler(testufo)
+    context = outlineCompiler.buildContext
+    ttFont = outlineCompiler.compile()
+    # e.g. the cmap was modified after the outlines were compiled
+    for subtable in ttFont["cmap"].tables:
+        subtable.cmap[0x41] = "a"
+
+    featureCompiler = FeatureCompiler(testufo, ttFont, buildContext=context)
+
+    assert featureCompiler.buildContext is context
+    assert context.unicodeToGlyphNameMapping == ttFont["cmap"].getBestCmap()
+    assert context.unicodeCoverage.codepoints[0] == 0x41
+
+
+def test_feature_compiler_ttFont_cmap_only(testufo, monkeypatch):
+    ttFont = TTFont()
+    ttFont.setGlyphOrder(makeOfficialGlyphOrder(testufo))
+    cmap = ttFont["cmap"] = newTable("cmap")
+    cmap.tableVersion = 0
+    subtable = CmapSubtable.newSubtable(4)
+    subtable.platformID, subtable.platEncID, subtable.language = (3, 1, 0)
+    subtable.cmap = {0x61: "a", 0x62: "b"}
+    cmap.tables = [subtable]
+
+    def makeUnicodeToGlyphNameMapping(*args, **kwargs):
+        raise AssertionError("UFO mapping built")
+
+    monkeypatch.setattr(
+        buildContext, "makeUnicodeToGlyphNameMapping", makeUnicodeToGlyphNameMapping
+    )
+    featureCompiler = FeatureCompiler(testufo, ttFont)
+
+    context = featureCompiler.buildContext
+    assert context.unicodeToGlyphNameMapping == {0x61: "a", 0x62: "b"}
+
+
+def test_compile_with_build_context(testufo):
+    font = compileTTF(testufo)
+
+    assert font.getGlyphOrder() == [".notdef", "b", "a", "acutecomb", "aacute"]
+    assert font.getBestCmap()[0x42] == "b"
@@ -0,0 +1,46 @@
+import os
+
+import pytest
+
+from ufo2ft.cache import FileCache
+
+
+def test_makeKey():
+    key = FileCache.makeKey("a", b"bc")
+    assert key == FileCache.makeKey(b"a", "bc")
+    assert key != FileCache.makeKey("ab", "c")
+
+
+def test_get_set(tmp_path):
+    cache = FileCache(tmp_path / "cache")
+    key = FileCache.makeKey("foo")
+
+    assert key not in cache
+    assert cache.get(key) is None
+
+    cache.set(key, b"bar")
+
+    assert key in cache
+    assert cache.get(key) == b"bar"
+
+
+def test_invalid_key(tmp_path):
+    cache = FileCache(tmp_path)
+    with pytest.raises(ValueError, match="invalid cache key"):
+        cache.get("../foo")
+
+
+def test_evict_least_recently_used(tmp_path):
+    cache = FileCache(tmp_path, maxSize=25)
+    for i, key in enumerate("abc"):
+        cache.set(key, b"x" * 10)
+        os.utime(tmp_path / key, (i, i))
+    assert "a" not in cache
+
+    # reading 'b' makes 'c' the least recently used
+    assert cache.get("b") is not None
+    cache.set("d", b"x" * 10)
+
+    assert "b" in cache
+    assert "c" not in cache
+    assert "d" in cache
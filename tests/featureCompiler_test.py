@@ -1,13 +1,20 @@
 import logging
 import re
+from io import StringIO
 from textwrap import dedent
 
 import py
 import pytest
 from fontTools import ttLib
+from fontTools.feaLib.ast import FeatureFile
 from fontTools.feaLib.error import FeatureLibError, IncludedFeaNotFound
 
-from ufo2ft.featureCompiler import FeatureCompiler, logger, parseLayoutFeatures
+from ufo2ft.featureCompiler import (
+    FeatureCompiler,
+    LayoutFeaturesCache,
+    logger,
+    parseLayoutFeatures,
+)
 from ufo2ft.featureWriters import (
     FEATURE_WRITERS_KEY,
     BaseFeatureWriter,
@@ -77,6 +84,83 @@ class ParseLayoutFeaturesTest:
         assert len(caplog.records) == 1
         assert "change the file name in the include" in caplog.text
 
+    def test_features_cache(self, FontClass, tmpdir):
+        include = tmpdir.join("test.fea")
+        include.write_text("# hello world\n", encoding="utf-8")
+        ufos = []
+        for name in ("A", "B"):
+            ufo = FontClass()
+            ufo.newGlyph("a")
+            ufo.features.text = "include(test.fea)\n"
+            ufo.save(str(tmpdir.join(f"{name}.ufo")))
+            ufos.append(ufo)
+        cache = LayoutFeaturesCache()
+
+        fea1 = parseLayoutFeatures(ufos[0], cache)
+        fea2 = parseLayoutFeatures(ufos[1], cache)
+
+        assert fea2 is not fea1
+        assert str(fea2) == str(fea1)
+        fea2.statements.clear()
+        assert "# hello world" in str(parseLayoutFeatures(ufos[0], cache))
+
+        # a different set of glyph names
+        ufos[1].newGlyph("b")
+        assert cache.get("include(test.fea)\n", str(tmpdir), {"a", "b"}) is None
+
+        # the included file is modified
+        include.write_text("# hello again world\n", encoding="utf-8")
+        assert "# hello again world" in str(parseLayoutFeatures(ufos[0], cache))
+
+    def test_features_cache_empty_include(self, FontClass, tmpdir):
+        include = tmpdir.join("test.fea")
+        include.write_text("", encoding="utf-8")
+        ufo = FontClass()
+        ufo.newGlyph("a")
+        ufo.features.text = "include(test.fea)\n"
+        ufo.save(str(tmpdir.join("A.ufo")))
+        cache = LayoutFeaturesCache()
+
+        assert not parseLayoutFeatures(ufo, cache).statements
+
+        # the included file is modified
+        include.write_text("# hello world\n", encoding="utf-8")
+        assert "# hello world" in str(parseLayoutFeatures(ufo, cache))
+
+    def test_features_cache_compileGSUB(self, FontClass):
+        ufo = FontClass()
+        for name in ("a", "b", "c", "a.alt"):
+            ufo.newGlyph(name)
+        ufo.features.text = dedent(
+            """\
+            lookup kern_ltr {
+                pos a b -10;
+            } kern_ltr;
+
+            feature kern {
+                lookup kern_ltr;
+            } kern;
+
+            feature salt {
+                sub a by a.alt;
+                pos a c -20;
+            } salt;
+            """
+        )
+        cache = LayoutFeaturesCache()
+        glyphOrder = ["a", "b", "c", "a.alt"]
+
+        gsub = cache.compileGSUB(parseLayoutFeatures(ufo), glyphOrder)
+
+        assert [fr.FeatureTag for fr in gsub.table.FeatureList.FeatureRecord] == [
+            "salt"
+        ]
+        assert cache.compileGSUB(parseLayoutFeatures(ufo), glyphOrder) is gsub
+        assert cache.compileGSUB(parseLayoutFeatures(ufo), glyphOrder[:3]) is not gsub
+
+        ufo.features.text = "feature kern { pos a b -10; } kern;"
+        assert cache.compileGSUB(parseLayoutFeatures(ufo), glyphOrder) is None
+
 
 class FeatureCompilerTest:
     def test_ttFont(self, FontClass):
@@ -161,6 +245,114 @@ class FeatureCompilerTest:
         ttFont2 = compiler.compile()
         assert "GPOS" not in ttFont2
 
+    def test_compile_featureFile(self, FontClass, monkeypatch):
+        ufo = FontClass()
+        ufo.newGlyph("a")
+        ufo.newGlyph("v")
+        ufo.kerning.update({("a", "v"): -40})
+        ufo.features.text = "feature liga { sub a by v; } liga;"
+        compiler = FeatureCompiler(ufo, featureWriters=[KernFeatureWriter])
+
+        def asFea(self, *args, **kwargs):
+            raise AssertionError("asFea called")
+
+        with monkeypatch.context() as m:
+            m.setattr(FeatureFile, "asFea", asFea)
+            ttFont = compiler.compile()
+
+        assert "GSUB" in ttFont
+        assert "GPOS" in ttFont
+        # the text is generated on request
+        assert "pos a v -40;" in compiler.features
+        buf = StringIO()
+        compiler.writeFeatures(buf)
+        assert buf.getvalue() == compiler.features
+
+    def test_compile_featureFile_text_writer(self, FontClass):
+        class FooFeatureWriter(BaseFeatureWriter):
+
+            tableTag = "GSUB"
+
+            def write(self, font, feaFile, compiler=None):
+                foo = ast.FeatureBlock("FOO ")
+                # glyph names as strings are only valid as text
+                foo.statements.append(
+                    ast.SingleSubstStatement(
+                        "a", "v", prefix="", suffix="", forceChain=None
+                    )
+                )
+                feaFile.statements.append(foo)
+
+        class CompilableFooFeatureWriter(FooFeatureWriter):
+            compilableStatements = True
+
+        ufo = FontClass()
+        ufo.newGlyph("a")
+        ufo.newGlyph("v")
+        compiler = FeatureCompiler(ufo, featureWriters=[FooFeatureWriter])
+        ttFont = compiler.compile()
+
+        assert "FOO " in [
+            fr.FeatureTag for fr in ttFont["GSUB"].table.FeatureList.FeatureRecord
+        ]
+
+        # the error of a writer is not hidden by compiling the text instead
+        compiler = FeatureCompiler(ufo, featureWriters=[CompilableFooFeatureWriter])
+        with pytest.raises((AttributeError, TypeError)):
+            compiler.compile()
+
+    def test_compile_featureFile_FeatureLibError(self, FontClass, caplog):
+        class FooFeatureWriter(BaseFeatureWriter):
+
+            tableTag = "GSUB"
+            compilableStatements = True
+
+            def write(self, font, feaFile, compiler=None):
+                lookup = ast.LookupBlock("MIXED_TYPE")
+                lookup.statements.append(
+                    ast.SingleSubstStatement(
+                        [ast.GlyphName("a")],
+                        [ast.GlyphName("v")],
+                        prefix=[],
+                        suffix=[],
+                        forceChain=False,
+                    )
+                )
+                lookup.statements.append(
+                    ast.LigatureSubstStatement(
+                        [],
+                        [ast.GlyphName("a"), ast.GlyphName("a")],
+                        [],
+                        "v",
+                        forceChain=False,
+                    )
+                )
+                feaFile.statements.append(lookup)
+
+        ufo = FontClass()
+        ufo.newGlyph("a")
+        ufo.newGlyph("v")
+        compiler = FeatureCompiler(ufo, featureWriters=[FooFeatureWriter])
+
+        tmpfile = None
+        try:
+            with caplog.at_level(logging.DEBUG, logger=logger.name):
+                with pytest.raises(FeatureLibError) as excinfo:
+                    compiler.compile()
+
+            assert len(caplog.records) == 1
+            assert "Compilation failed! Inspect temporary file" in caplog.text
+
+            tmpfile = py.path.local(re.findall(".*: '(.*)'$", caplog.text)[0])
+            assert tmpfile.read_text("utf-8") == compiler.features
+            # the error refers to the line of the invalid rule
+            lines = [line.strip() for line in compiler.features.splitlines()]
+            lineno = lines.index("sub a a by v;") + 1
+            assert str(excinfo.value).startswith(f"{tmpfile}:{lineno}:")
+        finally:
+            if tmpfile is not None:
+                tmpfile.remove(ignore_errors=True)
+
     def test_loadFeatureWriters_from_UFO_lib(self, FontClass):
         ufo = FontClass()
         ufo.newGlyph("a")
@@ -1,6 +1,12 @@
+import logging
+import pickle
+
 from ufo2ft.featureWriters import (
     FEATURE_WRITERS_KEY,
     BaseFeatureWriter,
+    KernFeatureWriter,
+    MarkFeatureWriter,
+    ast,
     loadFeatureWriterFromString,
     loadFeatureWriters,
 )
@@ -17,6 +23,8 @@ except ImportError:
 
 import pytest
 
+from ufo2ft.featureCompiler import FeatureCompiler, parseLayoutFeatures
+
 from ..testSupport import _TempModule
 
 TEST_LIB_PLIST = readPlistFromString(
@@ -93,3 +101,95 @@ def test_loadFeatureWriterFromString_valid(spec, FontClass):
     writer = loadFeatureWriterFromString(spec)
     assert writer.tableTag in {"GSUB", "GPOS"}
     assert callable(writer.write)
+
+
+@pytest.mark.parametrize("directBuild", [False, True])
+def test_cache(FontClass, tmp_path, monkeypatch, directBuild):
+    ufo = FontClass()
+    ufo.newGlyph("a").appendAnchor({"name": "top", "x": 100, "y": 200})
+    ufo.newGlyph("v")
+    for name in ("acutecomb", "gravecomb"):
+        ufo.newGlyph(name).appendAnchor({"name": "_top", "x": 0, "y": 0})
+    ufo.groups["public.kern1.A"] = ["a"]
+    ufo.kerning.update({("a", "v"): -40, ("public.kern1.A", "a"): 5})
+    # the generated mark class definition extends the existing class
+    ufo.features.text = "markClass gravecomb <anchor 0 0> @MC_top;\n"
+
+    def compileFeatures():
+        featureWriters = [
+            KernFeatureWriter(cache=tmp_path, directBuild=directBuild),
+            MarkFeatureWriter(cache=tmp_path, directBuild=directBuild),
+        ]
+        compiler = FeatureCompiler(ufo, featureWriters=featureWriters)
+        ttFont = compiler.compile()
+        return compiler.features, ttFont["GPOS"].compile(ttFont)
+
+    expected = compileFeatures()
+    assert "@kern1.A" in expected[0]
+    assert "markClass acutecomb <anchor 0 0> @MC_top;" in expected[0]
+    assert len(list(tmp_path.iterdir())) == 2
+
+    with monkeypatch.context() as m:
+        for cls in (KernFeatureWriter, MarkFeatureWriter):
+            m.setattr(cls, "setContext", None)
+            m.setattr(cls, "_write", None)
+        assert compileFeatures() == expected
+
+    # a different input of the mark writer, the kerning is reused
+    ufo["a"].anchors[0].x = 110
+    with monkeypatch.context() as m:
+        m.setattr(KernFeatureWriter, "_write", None)
+        features, _ = compileFeatures()
+    assert "pos base a <anchor 110 200> mark @MC_top;" in features
+    assert len(list(tmp_path.iterdir())) == 3
+
+    # a different input of the kern writer, the marks are reused, and the
+    # context is set once on a cache miss
+    ufo.kerning["a", "v"] = -50
+    calls = []
+    findFeatureTags = ast.findFeatureTags
+    with monkeypatch.context() as m:
+        m.setattr(MarkFeatureWriter, "_write", None)
+        m.setattr(
+            ast,
+            "findFeatureTags",
+            lambda feaFile: calls.append(feaFile) or findFeatureTags(feaFile),
+        )
+        features, _ = compileFeatures()
+    assert "pos a v -50;" in features
+    assert "pos base a <anchor 110 200> mark @MC_top;" in features
+    assert len(calls) == 2
+    assert len(list(tmp_path.iterdir())) == 4
+
+    # nothing generated
+    feaFile = parseLayoutFeatures(ufo)
+    writer = KernFeatureWriter(features=["dist"], cache=tmp_path)
+    assert not writer.write(ufo, feaFile)
+    with monkeypatch.context() as m:
+        m.setattr(KernFeatureWriter, "setContext", None)
+        assert not writer.write(ufo, feaFile)
+    assert str(feaFile) == str(parseLayoutFeatures(ufo))
+
+
+class _Unsafe:
+    def __reduce__(self):
+        return (exec, ("raise SystemExit('unsafe')",))
+
+
+def test_cache_unsafe_entry(FontClass, tmp_path, caplog):
+    ufo = FontClass()
+    ufo.newGlyph("a")
+    ufo.newGlyph("v")
+    ufo.kerning.update({("a", "v"): -40})
+    writer = KernFeatureWriter(cache=tmp_path)
+    expected = parseLayoutFeatures(ufo)
+    assert writer.write(ufo, expected)
+    (entry,) = tmp_path.iterdir()
+    entry.write_bytes(pickle.dumps((True, [_Unsafe()])))
+
+    feaFile = parseLayoutFeatures(ufo)
+    with caplog.at_level(logging.WARNING):
+        assert writer.write(ufo, feaFile)
+
+    assert "global 'builtins.exec' is forbidden" in caplog.text
+    assert str(feaFile) == str(expected)
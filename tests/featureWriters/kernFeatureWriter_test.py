@@ -4,8 +4,14 @@ from textwrap import dedent
 import pytest
 
 from ufo2ft.errors import InvalidFeaturesData
-from ufo2ft.featureCompiler import parseLayoutFeatures
-from ufo2ft.featureWriters import KernFeatureWriter, ast
+from ufo2ft.featureCompiler import FeatureCompiler, parseLayoutFeatures
+from ufo2ft.featureWriters import KernFeatureWriter, ast, kernFeatureWriter
+from ufo2ft.featureWriters.kernFeatureWriter import (
+    KerningPair,
+    KerningPairs,
+    KerningRules,
+    optimizeKerning,
+)
 
 from . import FeatureWriterTest
 
@@ -539,6 +545,159 @@ class KernFeatureWriterTest(FeatureWriterTest):
         assert (pairs[4].firstIsClass, pairs[4].secondIsClass) == (True, True)
         assert pairs[4].glyphs == {"A", "B", "C", "D"}
 
+    def test_KerningPairs(self):
+        cls = ast.makeGlyphClassDefinition("kern1.A", ["A", "Aacute"])
+        pairs = KerningPairs()
+        pairs.append(cls, "V", -40.4)
+        pairs.append("A", "V", -50, directions=2)
+        pairs.append(cls, "W", -30)
+
+        # the sides are only stored once
+        assert len(pairs.sides) == 4
+        assert list(pairs.side1) == [0, 2, 0]
+        assert list(pairs.values) == [-40, -50, -30]
+        assert "@kern1.A V -40" in repr(pairs[0])
+        assert pairs[1].directions == {"RTL"}
+
+        subset = pairs.subset([2, 1])
+        assert subset.sides is pairs.sides
+        assert [repr(p) for p in subset] == [repr(pairs[2]), repr(pairs[1])]
+        assert not pairs.subset(())
+        assert [repr(p) for p in pairs[1:]] == [repr(pairs[1]), repr(pairs[2])]
+
+        copy = KerningPairs.fromPairs(pairs)
+        assert [repr(p) for p in copy] == [repr(p) for p in pairs]
+        assert copy.directions == pairs.directions
+
+    def test_optimizeKerning(self):
+        side1Groups = {
+            "public.kern1.A": ["A", "Aacute"],
+            "public.kern1.O": ["O"],
+            "public.kern1.D": ["D"],
+        }
+        side2Groups = {
+            "public.kern2.V": ["V"],
+            "public.kern2.W": ["W"],
+            "public.kern2.T": ["T"],
+        }
+        kerning = {
+            ("public.kern1.A", "public.kern2.V"): -40,
+            ("public.kern1.A", "public.kern2.W"): -40,
+            ("public.kern1.O", "public.kern2.V"): -20,
+            ("public.kern1.O", "public.kern2.W"): -20,
+            ("public.kern1.D", "public.kern2.V"): -20,
+            ("public.kern1.D", "public.kern2.W"): -20.2,
+            # redundant exceptions
+            ("Aacute", "public.kern2.V"): -40,
+            ("A", "V"): -40,
+            ("public.kern1.A", "T"): 0,
+            # zero-valued pairs overriding nothing
+            ("public.kern1.A", "public.kern2.T"): 0,
+            ("A", "T"): 0,
+            # a real exception
+            ("Aacute", "T"): -10,
+        }
+
+        def lookup(kerning, side1Groups, side2Groups, glyph1, glyph2):
+            group1 = {g: n for n, gs in side1Groups.items() for g in gs}.get(glyph1)
+            group2 = {g: n for n, gs in side2Groups.items() for g in gs}.get(glyph2)
+            for pair in [
+                (glyph1, glyph2),
+                (glyph1, group2),
+                (group1, glyph2),
+                (group1, group2),
+            ]:
+                if pair in kerning:
+                    return round(kerning[pair])
+            return 0
+
+        result = optimizeKerning(kerning, side1Groups, side2Groups)
+
+        assert result == (
+            {
+                ("public.kern1.A", "public.kern2.V"): -40,
+                ("public.kern1.D", "public.kern2.V"): -20,
+                ("Aacute", "T"): -10,
+            },
+            {"public.kern1.A": ["A", "Aacute"], "public.kern1.D": ["D", "O"]},
+            {"public.kern2.V": ["V", "W"], "public.kern2.T": ["T"]},
+        )
+        glyphs = ["A", "Aacute", "O", "D", "V", "W", "T"]
+        for glyph1 in glyphs:
+            for glyph2 in glyphs:
+                assert lookup(kerning, side1Groups, side2Groups, glyph1, glyph2) == (
+                    lookup(*result, glyph1, glyph2)
+                )
+
+    def test_optimizeKerning_mixed_scripts(self, FontClass, caplog):
+        glyphs = {
+            "O": 0x4F,
+            "Q": 0x51,
+            "quotedbl": 0x22,
+            "alef-ar": 0x627,
+            "beh-ar": 0x628,
+        }
+        groups = {
+            "public.kern2.O": ["O", "Q"],
+            "public.kern2.alef": ["alef-ar", "beh-ar"],
+        }
+        kerning = {
+            ("quotedbl", "public.kern2.O"): -50,
+            ("quotedbl", "public.kern2.alef"): -50,
+        }
+        features = dedent(
+            """\
+            languagesystem DFLT dflt;
+            languagesystem latn dflt;
+            languagesystem arab dflt;
+            """
+        )
+        ufo = makeUFO(FontClass, glyphs, groups, kerning, features)
+
+        with caplog.at_level(logging.INFO, logger=kernFeatureWriter.logger.name):
+            generated = self.writeFeatures(ufo, optimizeKerning=True)
+
+        # the Latin and Arabic groups are not merged
+        assert "ambiguous direction" not in caplog.text
+        assert "bytes saved" in caplog.text
+        assert str(generated) == str(self.writeFeatures(ufo))
+        assert "lookup kern_ltr" in str(generated)
+        assert "lookup kern_rtl" in str(generated)
+
+    def test_optimizeKerning_marks(self, FontClass):
+        ufo = makeUFO(
+            FontClass,
+            {"A": 0x41, "V": 0x56, "acutecomb": 0x301, "gravecomb": 0x300},
+            groups={
+                "public.kern2.V": ["V"],
+                "public.kern2.marks": ["acutecomb", "gravecomb"],
+            },
+            kerning={
+                ("A", "public.kern2.V"): -40,
+                ("A", "public.kern2.marks"): -40,
+            },
+            features=dedent(
+                """\
+                @Bases = [A V];
+                @Marks = [acutecomb gravecomb];
+                table GDEF {
+                    GlyphClassDef @Bases, [], @Marks, ;
+                } GDEF;
+                """
+            ),
+        )
+
+        generated = self.writeFeatures(ufo, optimizeKerning=True)
+
+        # the base pairs stay in the lookup with IgnoreMarks
+        assert str(generated) == str(self.writeFeatures(ufo))
+        (lookup, markLookup) = getLookups(generated)
+        assert lookup.name == "kern_ltr"
+        assert "IgnoreMarks" in str(lookup)
+        assert "@kern2.V" in str(lookup)
+        assert markLookup.name == "kern_ltr_marks"
+        assert "@kern2.marks" in str(markLookup)
+
     def test_kern_LTR_and_RTL(self, FontClass):
         glyphs = {
             ".notdef": None,
@@ -631,6 +790,48 @@ class KernFeatureWriterTest(FeatureWriterTest):
             """
         )
 
+    def test_kern_LTR_and_RTL_legacy_subclass(self, FontClass):
+        # subclasses returning a list from getKerningPairs, and calling the
+        # 'exclude' argument of _makeKerningLookup with a KerningPair
+        class LegacyKernFeatureWriter(KernFeatureWriter):
+            @staticmethod
+            def getKerningPairs(*args, **kwargs):
+                return list(KernFeatureWriter.getKerningPairs(*args, **kwargs))
+
+            def _makeKerningLookup(self, name, pairs, exclude=None, **kwargs):
+                def legacyExclude(pair):
+                    assert isinstance(pair, KerningPair)
+                    return exclude(pair)
+
+                return super()._makeKerningLookup(
+                    name, pairs, exclude=legacyExclude, **kwargs
+                )
+
+        glyphs = {
+            "A": 0x41,
+            "V": 0x56,
+            "seven": 0x37,
+            "four": 0x34,
+            "reh-ar": 0x631,
+            "alef-ar": 0x627,
+        }
+        kerning = {
+            ("A", "V"): -40,
+            ("seven", "four"): -25,
+            ("reh-ar", "alef-ar"): -100,
+        }
+        features = "languagesystem latn dflt;\nlanguagesystem arab dflt;\n"
+        ufo = makeUFO(FontClass, glyphs, None, kerning, features)
+
+        expected = parseLayoutFeatures(ufo)
+        KernFeatureWriter().write(ufo, expected)
+        feaFile = parseLayoutFeatures(ufo)
+        with pytest.warns(DeprecationWarning, match="lists of KerningPair"):
+            LegacyKernFeatureWriter().write(ufo, feaFile)
+
+        assert str(feaFile) == str(expected)
+        assert "pos reh-ar alef-ar <-100 0 -100 0>;" in str(feaFile)
+
     def test_kern_LTR_and_RTL_with_marks(self, FontClass):
         glyphs = {
             ".notdef": None,
@@ -1094,6 +1295,202 @@ class KernFeatureWriterTest(FeatureWriterTest):
             """
         )
 
+    def test_directBuild(self, FontClass):
+        glyphs = {
+            "four": 0x34,
+            "seven": 0x37,
+            "A": 0x41,
+            "V": 0x56,
+            "Aacute": 0xC1,
+            "acutecomb": 0x301,
+            "alef-ar": 0x627,
+            "reh-ar": 0x631,
+            "zain-ar": 0x632,
+            "four-ar": 0x664,
+            "seven-ar": 0x667,
+        }
+        groups = {
+            "public.kern1.A": ["A", "Aacute"],
+            "public.kern1.reh": ["reh-ar", "zain-ar"],
+            "public.kern2.alef": ["alef-ar"],
+        }
+        kerning = {
+            ("public.kern1.A", "V"): -40,
+            ("seven", "four"): -25,
+            ("public.kern1.reh", "public.kern2.alef"): -100,
+            ("reh-ar", "alef-ar"): 0,
+            ("four-ar", "seven-ar"): -30,
+            ("V", "acutecomb"): 70,
+        }
+        features = dedent(
+            """            languagesystem DFLT dflt;
+            languagesystem latn dflt;
+            languagesystem arab dflt;
+
+            table GDEF {
+                GlyphClassDef [A V Aacute alef-ar reh-ar zain-ar], , [acutecomb], ;
+            } GDEF;
+            """
+        )
+        results = []
+        for directBuild in (False, True):
+            ufo = makeUFO(FontClass, glyphs, groups, kerning, features)
+            writer = KernFeatureWriter(directBuild=directBuild)
+            compiler = FeatureCompiler(ufo, featureWriters=[writer])
+            font = compiler.compile()
+            results.append((str(compiler.featureFile), font["GPOS"].compile(font)))
+
+        assert results[0] == results[1]
+        assert "lookup kern_ltr_marks {" in results[1][0]
+
+        lookups = {
+            st.name: st
+            for st in compiler.featureFile.statements
+            if isinstance(st, ast.LookupBlock)
+        }
+        assert isinstance(lookups["kern_rtl"].statements[-1], KerningRules)
+
+    def test_scriptLookups(self, FontClass):
+        glyphs = {
+            "period": 0x2E,
+            "quoteright": 0x2019,
+            "A": 0x41,
+            "V": 0x56,
+            "Aacute": 0xC1,
+            "O": 0x4F,
+            "de-cy": 0x434,
+            "el-cy": 0x43B,
+            "o-cy": 0x43E,
+            "Alpha": 0x391,
+            "Tau": 0x3A4,
+            "alef-ar": 0x627,
+            "reh-ar": 0x631,
+            "four-ar": 0x664,
+            "seven-ar": 0x667,
+        }
+        groups = {
+            "public.kern1.A": ["A", "Aacute"],
+            "public.kern1.O": ["O", "o-cy"],
+        }
+        kerning = {
+            ("public.kern1.A", "V"): -40,
+            ("A", "V"): -50,
+            ("A", "period"): -10,
+            # Latin and Cyrillic
+            ("public.kern1.O", "V"): -10,
+            ("de-cy", "el-cy"): -20,
+            # no languagesystem for Greek
+            ("Alpha", "Tau"): -5,
+            # neutral only, and a Latin pair with the same first glyph
+            ("period", "quoteright"): 10,
+            ("period", "A"): 5,
+            ("reh-ar", "alef-ar"): -100,
+            ("four-ar", "seven-ar"): -30,
+        }
+        features = dedent(
+            """\
+            languagesystem DFLT dflt;
+            languagesystem latn dflt;
+            languagesystem latn TRK;
+            languagesystem cyrl dflt;
+            languagesystem arab dflt;
+            """
+        )
+        ufo = makeUFO(FontClass, glyphs, groups, kerning, features)
+
+        generated = self.writeFeatures(ufo, ignoreMarks=False, scriptLookups=True)
+
+        assert str(generated) == dedent(
+            """\
+            @kern1.A = [A Aacute];
+            @kern1.O = [O o-cy];
+
+            lookup kern_Arab {
+                pos four-ar seven-ar -30;
+                pos reh-ar alef-ar <-100 0 -100 0>;
+            } kern_Arab;
+
+            lookup kern_Cyrl {
+                pos de-cy el-cy -20;
+            } kern_Cyrl;
+
+            lookup kern_dflt {
+                pos period quoteright 10;
+            } kern_dflt;
+
+            lookup kern_ltr {
+                pos Alpha Tau -5;
+                pos period A 5;
+                enum pos @kern1.O V -10;
+            } kern_ltr;
+
+            lookup kern_Latn {
+                pos A V -50;
+                pos A period -10;
+                enum pos @kern1.A V -40;
+            } kern_Latn;
+
+            feature kern {
+                lookup kern_dflt;
+                script DFLT;
+                language dflt;
+                lookup kern_ltr;
+                script latn;
+                language dflt;
+                lookup kern_ltr;
+                language TRK;
+                script cyrl;
+                language dflt;
+                lookup kern_ltr;
+                script latn;
+                language dflt;
+                lookup kern_Latn;
+                language TRK;
+                script cyrl;
+                language dflt;
+                lookup kern_Cyrl;
+                script arab;
+                language dflt;
+                lookup kern_Arab;
+            } kern;
+            """
+        )
+
+    def test_subtable_breaks(self, FontClass, monkeypatch):
+        glyphs = {f"g{i}": None for i in range(12)}
+        groups = {f"public.kern1.K{i}": [f"g{i}"] for i in range(6)}
+        groups.update({f"public.kern2.K{i}": [f"g{i + 6}"] for i in range(6)})
+        kerning = {
+            (f"public.kern1.K{i}", f"public.kern2.K{j}"): -10 * (i + j + 1)
+            for i in range(6)
+            for j in range(6)
+            if (i + j) % 2
+        }
+        kerning[("g0", "g6")] = 5
+        # only the pairs of three first classes fit in a subtable
+        size = kernFeatureWriter._estimateClassPairPosSize(3, 6, 3, 6, 2)
+        monkeypatch.setattr(kernFeatureWriter, "MAX_CLASS_PAIR_POS_SIZE", size)
+
+        results = []
+        for directBuild in (False, True):
+            ufo = makeUFO(FontClass, glyphs, groups, kerning)
+            writer = KernFeatureWriter(directBuild=directBuild)
+            compiler = FeatureCompiler(ufo, featureWriters=[writer])
+            font = compiler.compile()
+            results.append((str(compiler.featureFile), font["GPOS"].compile(font)))
+
+        assert results[0] == results[1]
+        fea = results[0][0]
+        assert fea.count("subtable;") == 1
+        # the rules for the same first class are never split
+        assert fea.index("pos @kern1.K2 @kern2.K5 -80;") < fea.index("subtable;")
+        assert fea.index("subtable;") < fea.index("pos @kern1.K3 @kern2.K0 -40;")
+
+        lookup = font["GPOS"].table.LookupList.Lookup[0]
+        assert [st.Format for st in lookup.SubTable] == [1, 2, 2]
+        coverages = [set(st.Coverage.glyphs) for st in lookup.SubTable[1:]]
+        assert coverages == [{"g0", "g1", "g2"}, {"g3", "g4", "g5"}]
+
 
 if __name__ == "__main__":
     import sys
@@ -5,10 +5,13 @@ from textwrap import dedent
 import pytest
 
 from ufo2ft.errors import InvalidFeaturesData
-from ufo2ft.featureCompiler import parseLayoutFeatures
+from ufo2ft.featureCompiler import FeatureCompiler, parseLayoutFeatures
 from ufo2ft.featureWriters import ast
 from ufo2ft.featureWriters.markFeatureWriter import (
     MarkFeatureWriter,
+    MarkRules,
+    MarkToBasePos,
+    MarkToLigaPos,
     NamedAnchor,
     parseAnchorName,
 )
@@ -63,6 +66,57 @@ def test_NamedAnchor_repr():
     assert repr(NamedAnchor("top", 1.0, 2.0)) == expected
 
 
+@pytest.mark.parametrize(
+    "pos",
+    [
+        MarkToBasePos(
+            "a",
+            [NamedAnchor(name, 100, 200) for name in ("top", "bottom", "ogonek")],
+        ),
+        MarkToLigaPos(
+            "f_i",
+            [
+                [NamedAnchor("top_1", 100, 500), NamedAnchor("bottom_1", 100, 0)],
+                [],
+                [NamedAnchor("top_3", 600, 500)],
+            ],
+        ),
+    ],
+)
+def test_groupMarks(pos):
+    lookups = {"top": 0, "bottom": 1, "ogonek": 0}
+
+    def key(anchor):
+        return lookups[anchor.key]
+
+    groups = pos.groupMarks(key)
+
+    assert sorted(groups) == [0, 1]
+    for i, group in groups.items():
+        expected = pos.filter(lambda anchor: key(anchor) == i)
+        assert type(group) is type(pos)
+        assert group.name == pos.name
+        assert group.marks == expected.marks
+
+
+def test_makeMarkClassAdjacency():
+    markGlyphToMarkClasses = {
+        "acutecomb": {"MC_top"},
+        "cedillacomb": {"MC_bottom", "MC_cedilla"},
+        "ogonekcomb": {"MC_bottom", "MC_ogonek"},
+        "dotbelowcomb": {"MC_bottom", "MC_ogonek"},
+    }
+
+    adjacency = MarkFeatureWriter._makeMarkClassAdjacency(markGlyphToMarkClasses)
+
+    assert adjacency == {
+        "MC_top": set(),
+        "MC_bottom": {"MC_cedilla", "MC_ogonek"},
+        "MC_cedilla": {"MC_bottom"},
+        "MC_ogonek": {"MC_bottom"},
+    }
+
+
 class MarkFeatureWriterTest(FeatureWriterTest):
 
     FeatureWriter = MarkFeatureWriter
@@ -712,6 +766,18 @@ class MarkFeatureWriterTest(FeatureWriterTest):
             """  # noqa: B950
         )
 
+    def test_no_gsub_without_indic_characters(self, testufo, monkeypatch):
+        testufo["a"].unicode = 0x61
+        testufo["acutecomb"].unicode = 0x0301
+
+        def compileGSUB(self):
+            raise AssertionError("GSUB compiled without Indic characters")
+
+        monkeypatch.setattr(MarkFeatureWriter, "compileGSUB", compileGSUB)
+        generated = self.writeFeatures(testufo)
+
+        assert "feature mark" in str(generated)
+
     def test_all_features(self, testufo):
         ufo = testufo
         ufo.info.unitsPerEm = 1000
@@ -1065,6 +1131,30 @@ class MarkFeatureWriterTest(FeatureWriterTest):
             """
         )
 
+    def test_directBuild(self, testufo):
+        testufo.newGlyph("b").appendAnchor({"name": "top", "x": 100, "y": 200})
+        testufo.newGlyph("gravecomb").appendAnchor({"name": "_top", "x": 50, "y": 200})
+        testufo.features.text = dedent(
+            """            table GDEF {
+                GlyphClassDef [a b], [f_i], [acutecomb gravecomb tildecomb], ;
+            } GDEF;
+            """
+        )
+        testufo.glyphOrder = sorted(testufo.keys())
+
+        results = []
+        for directBuild in (False, True):
+            writer = MarkFeatureWriter(directBuild=directBuild)
+            compiler = FeatureCompiler(testufo, featureWriters=[writer])
+            font = compiler.compile()
+            results.append((str(compiler.featureFile), font["GPOS"].compile(font)))
+
+        assert results[0] == results[1]
+        mark = next(ast.iterFeatureBlocks(compiler.featureFile, "mark"))
+        for lookup in mark.statements:
+            assert len(lookup.statements) == 1
+            assert isinstance(lookup.statements[0], MarkRules)
+
 
 if __name__ == "__main__":
     import sys
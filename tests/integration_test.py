@@ -4,15 +4,19 @@ import os
 import sys
 
 import pytest
+from fontTools.ttLib import TTFont
 
 from ufo2ft import (
     compileInterpolatableTTFs,
     compileOTF,
+    compileOTFs,
     compileTTF,
     compileVariableCFF2,
     compileVariableTTF,
+    compressFonts,
 )
 from ufo2ft.constants import KEEP_GLYPH_NAMES
+from ufo2ft.outlineCompiler import OutlineOTFCompiler
 
 
 def getpath(filename):
@@ -190,6 +194,132 @@ class IntegrationTest:
         )
         expectTTX(otf, expected_ttx)
 
+    def test_outlineCompilerClass_without_cffVersion(self, testufo):
+        class LegacyOutlineCompiler(OutlineOTFCompiler):
+            def __init__(
+                self,
+                font,
+                glyphSet=None,
+                glyphOrder=None,
+                tables=None,
+                notdefGlyph=None,
+                roundTolerance=None,
+                optimizeCFF=True,
+            ):
+                super().__init__(
+                    font,
+                    glyphSet=glyphSet,
+                    glyphOrder=glyphOrder,
+                    tables=tables,
+                    notdefGlyph=notdefGlyph,
+                    roundTolerance=roundTolerance,
+                    optimizeCFF=optimizeCFF,
+                )
+
+        otf = compileOTF(
+            testufo, outlineCompilerClass=LegacyOutlineCompiler, optimizeCFF=0
+        )
+        expectTTX(otf, "TestFont-NoOptimize-CFF.ttx")
+
+    @pytest.mark.parametrize("subroutinizer", ["cffsubr", "compreffor"])
+    def test_compileOTFs(self, FontClass, subroutinizer):
+        ufos = [FontClass(getpath("TestFont.ufo")) for _ in range(3)]
+        expected = "TestFont-CFF.ttx"
+        if subroutinizer == "compreffor":
+            expected = "TestFont-CFF-compreffor.ttx"
+
+        otfs = compileOTFs(ufos, maxWorkers=2, subroutinizer=subroutinizer)
+
+        assert len(otfs) == 3
+        for otf in otfs:
+            expectTTX(otf, expected)
+
+    def test_compileOTFs_flavor(self, FontClass):
+        ufos = [FontClass(getpath("TestFont.ufo")) for _ in range(2)]
+
+        fonts = compileOTFs(ufos, maxWorkers=2, flavor="woff")
+
+        assert len(fonts) == 2
+        for data in fonts:
+            otf = TTFont(io.BytesIO(data))
+            assert otf.flavor == "woff"
+            otf.flavor = None
+            expectTTX(otf, "TestFont-CFF.ttx")
+
+    def test_compressFonts(self, testufo):
+        pytest.importorskip("brotli")
+        stream = io.BytesIO()
+        compileTTF(testufo, output=stream)
+        fonts = [stream.getvalue(), compileOTF(testufo)]
+
+        woffs = compressFonts(fonts, flavor="woff2")
+
+        assert [TTFont(io.BytesIO(data)).flavor for data in woffs] == ["woff2"] * 2
+
+    def test_compressFonts_invalid_flavor(self, testufo):
+        with pytest.raises(ValueError, match="Unsupported font flavor"):
+            compressFonts([compileTTF(testufo)], flavor="zip")
+
+    def test_compile_output(self, testufo, tmp_path):
+        path = tmp_path / "TestFont.otf"
+        assert compileOTF(testufo, output=str(path)) is None
+        expectTTX(TTFont(str(path)), "TestFont-CFF.ttx")
+
+        stream = io.BytesIO()
+        assert compileTTF(testufo, output=stream, flavor="woff") is None
+        font = TTFont(io.BytesIO(stream.getvalue()))
+        assert font.flavor == "woff"
+        font.flavor = None
+        expectTTX(font, "TestFont.ttx")
+
+    @pytest.mark.parametrize(
+        "subroutinizer, cff_version, expected_ttx",
+        [
+            ("compreffor", 1, "TestFont-CFF-compreffor.ttx"),
+            ("cffsubr", 1, "TestFont-CFF.ttx"),
+            ("cffsubr", 2, "TestFont-CFF2-cffsubr.ttx"),
+        ],
+        ids=["compreffor-cff1", "cffsubr-cff1", "cffsubr-cff2"],
+    )
+    def test_subroutinizerCache(
+        self, testufo, tmp_path, monkeypatch, subroutinizer, cff_version, expected_ttx
+    ):
+        from ufo2ft.postProcessor import PostProcessor
+
+        calls = []
+        subroutinize = PostProcessor._subroutinize.__func__
+
+        def _subroutinize(cls, *args):
+            calls.append(args)
+            return subroutinize(cls, *args)
+
+        monkeypatch.setattr(PostProcessor, "_subroutinize", classmethod(_subroutinize))
+
+        options = dict(
+            cffVersion=cff_version,
+            subroutinizer=subroutinizer,
+            subroutinizerCache=str(tmp_path),
+        )
+        otf = compileOTF(testufo, **options)
+        expectTTX(otf, expected_ttx)
+        assert len(calls) == 1
+
+        # the font info isn't part of the cache key
+        otf = compileOTF(testufo, **options)
+        expectTTX(otf, expected_ttx)
+        assert len(calls) == 1
+
+        testufo.info.copyright = "Changed"
+        otf = compileOTF(testufo, **options)
+        assert len(calls) == 1
+        if cff_version == 1:
+            assert otf["CFF "].cff.topDictIndex[0].Copyright == "Changed"
+
+        # a change in the outlines invalidates the cached table
+        testufo["a"].move((10, 0))
+        compileOTF(testufo, **options)
+        assert len(calls) == 2
+
     def test_compileVariableTTF(self, designspace, useProductionNames):
         varfont = compileVariableTTF(designspace, useProductionNames=useProductionNames)
         expectTTX(
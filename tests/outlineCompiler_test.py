@@ -1,9 +1,11 @@
+import io
 import logging
 import os
 
 import pytest
 from cu2qu.ufo import font_to_quadratic
-from fontTools.ttLib import TTFont
+from fontTools.ttLib import TTFont, newTable
+from fontTools.ttLib.tables.O_S_2f_2 import intersectUnicodeRanges
 from fontTools.ttLib.tables._g_l_y_f import USE_MY_METRICS
 
 from ufo2ft import (
@@ -21,6 +23,7 @@ from ufo2ft.constants import (
 )
 from ufo2ft.fontInfoData import intListToNum
 from ufo2ft.outlineCompiler import OutlineOTFCompiler, OutlineTTFCompiler
+from ufo2ft.util import UnicodeCoverageIndex
 
 
 def getpath(filename):
@@ -517,6 +520,33 @@ class OutlineOTFCompilerTest:
         assert private.defaultWidthX == 500
         assert private.nominalWidthX == 0
 
+    def test_setupTable_CFF2(self, testufo):
+        testufo.info.postscriptForceBold = True
+        compiler = OutlineOTFCompiler(testufo, cffVersion=2)
+        otf = compiler.compile()
+
+        assert "CFF " not in otf
+        assert otf["post"].formatType == 2.0
+
+        # compile and decompile the font again
+        stream = io.BytesIO()
+        otf.save(stream)
+        otf = TTFont(stream)
+        topDict = otf["CFF2"].cff.topDictIndex[0]
+        private = topDict.FDArray[0].Private
+
+        assert not hasattr(topDict, "FontBBox")
+        assert topDict.FontMatrix == [0.001, 0, 0, 0.001, 0, 0]
+        assert private.BlueValues == [500, 510]
+        assert "ForceBold" not in private.rawDict
+        # the charstrings encode neither the width, nor the 'endchar' operator
+        charString, _ = topDict.CharStrings.getItemAndSelector("a")
+        charString.decompile()
+        self.assertProgramEqual(
+            charString.program,
+            [66, "hmoveto", 256, "hlineto", -128, 510, "rlineto"],
+        )
+
 
 class GlyphOrderTest:
     def test_compile_original_glyph_order(self, testufo):
@@ -767,6 +797,27 @@ class NamesTest:
         # original name is used
         assert name in result
 
+    def test_production_names_of_suffixes_and_ligatures(self, testufo):
+        for name in ("a.alt", "a.alt.ss01", "a_b", "a_b.alt", "space_a"):
+            testufo.newGlyph(name)
+        testufo["space"].unicodes = [0x10020]
+
+        result = compileTTF(testufo, useProductionNames=True)
+
+        glyphOrder = result.getGlyphOrder()
+        assert glyphOrder[-5:] == [
+            "uni0061.alt",
+            "uni0061.alt.ss01",
+            "uni00610062",
+            "uni00610062.alt",
+            "u10020_uni0061",
+        ]
+        # the extraNames are the same as after compiling the table
+        post = result["post"]
+        extraNames = list(post.extraNames)
+        post.compile(result)
+        assert post.extraNames == extraNames
+
 
 class ColrCpalTest:
     def test_colr_cpal(self, FontClass):
@@ -860,6 +911,44 @@ def test_calcCodePageRanges(emptyufo, unicodes, expected):
     )
 
 
+def test_unicode_ranges_from_coverage(emptyufo):
+    font = emptyufo
+    unicodes = [0x20, 0x41, 0x0410, 0x0627, 0x0915, 0x4E00, 0xF000, 0x1F600]
+    for i, uv in enumerate(unicodes):
+        font.newGlyph("glyph%d" % i).unicode = uv
+
+    compiler = OutlineTTFCompiler(font)
+    otf = compiler.compile()
+    os2 = otf["OS/2"]
+
+    assert os2.getUnicodeRanges() == intersectUnicodeRanges(unicodes)
+    assert 57 in os2.getUnicodeRanges()  # Non-Plane 0
+    assert os2.recalcUnicodeRanges(otf) == os2.getUnicodeRanges()
+
+
+def test_unicode_coverage_index():
+    cmap = {0x0627: "alef-ar", 0x0041: "A", 0x0661: "one-ar", 0x0020: "space"}
+    coverage = UnicodeCoverageIndex(cmap)
+
+    assert list(coverage.codepoints) == [0x20, 0x41, 0x0627, 0x0661]
+    assert coverage.glyphNames == ["space", "A", "alef-ar", "one-ar"]
+    assert 0x41 in coverage
+    assert 0x42 not in coverage
+    assert coverage.column("script") == ["Zyyy", "Latn", "Arab", "Arab"]
+    assert set(coverage.values("bidiType")) == {"WS", "L", "AL", "AN"}
+
+    calls = []
+
+    def isArabic(script):
+        calls.append(script)
+        return None if script == "Zyyy" else script == "Arab"
+
+    glyphSets = coverage.classify("script", isArabic)
+    assert glyphSets == {True: {"alef-ar", "one-ar"}, False: {"A"}}
+    # the classifying function is called only once per distinct value
+    assert sorted(calls) == ["Arab", "Latn", "Zyyy"]
+
+
 def test_custom_layer_compilation(layertestrgufo):
     ufo = layertestrgufo
 
@@ -980,6 +1069,95 @@ def test_compile_empty_ufo(FontClass):
     assert font["OS/2"].sTypoDescender == -200
 
 
+def _saveWithFixedTimestamps(font):
+    font.recalcTimestamp = False
+    font["head"].created = font["head"].modified = 0
+    buf = io.BytesIO()
+    font.save(buf)
+    return buf.getvalue()
+
+
+class LazyCompileTest:
+    @pytest.mark.parametrize(
+        "compilerClass", [OutlineOTFCompiler, OutlineTTFCompiler], ids=["otf", "ttf"]
+    )
+    def test_lazy_same_as_eager(self, testufo, compilerClass):
+        if compilerClass is OutlineTTFCompiler:
+            font_to_quadratic(testufo)
+        eager = compilerClass(testufo).compile()
+        lazy = compilerClass(testufo).compile(lazy=True)
+
+        assert sorted(lazy.keys()) == sorted(eager.keys())
+        assert _saveWithFixedTimestamps(lazy) == _saveWithFixedTimestamps(eager)
+
+    def test_tables_built_on_demand(self, testufo):
+        font_to_quadratic(testufo)
+        font = OutlineTTFCompiler(testufo).compile(lazy=True)
+
+        assert "hhea" in font
+        assert "glyf" in font
+        assert not font.isLoaded("hhea")
+        assert not font.isLoaded("hmtx")
+
+        # 'hhea' requires 'hmtx' which is built along with it
+        assert font["hhea"].advanceWidthMax == 600
+        assert font.isLoaded("hmtx")
+        assert not font.isLoaded("glyf")
+
+        # 'glyf' and 'loca' are built together
+        assert font["loca"] is not None
+        assert font.isLoaded("glyf")
+
+    def test_delete_pending_table(self, testufo):
+        font = OutlineOTFCompiler(testufo).compile(lazy=True)
+        del font["OS/2"]
+
+        assert "OS/2" not in font
+        assert "OS/2" not in font.keys()
+        with pytest.raises(KeyError):
+            font["OS/2"]
+
+    def test_ttx_override(self, testufo):
+        font = OutlineOTFCompiler(testufo).compile()
+        font["OS/2"].xAvgCharWidth = 1234
+        ttx = io.StringIO()
+        font.saveXML(ttx, tables=["OS/2"])
+        testufo.data["com.github.fonttools.ttx/OS_2.ttx"] = ttx.getvalue().encode()
+
+        eager = OutlineOTFCompiler(testufo).compile()
+        lazy = OutlineOTFCompiler(testufo).compile(lazy=True)
+
+        assert eager["OS/2"].xAvgCharWidth == 1234
+        assert lazy["OS/2"].xAvgCharWidth == 1234
+        assert _saveWithFixedTimestamps(lazy) == _saveWithFixedTimestamps(eager)
+
+    def test_setupOtherTables_override(self, testufo):
+        class CustomCompiler(OutlineOTFCompiler):
+            def setupOtherTables(self):
+                super().setupOtherTables()
+                self.otf["DSIG"] = newTable("DSIG")
+                self.otf["DSIG"].ulVersion = 1
+                self.otf["DSIG"].usFlag = 0
+                self.otf["DSIG"].usNumSigs = 0
+                self.otf["DSIG"].signatureRecords = []
+
+        font = CustomCompiler(testufo).compile(lazy=True)
+
+        # the table of the subclass is built upfront, the others on demand
+        assert "DSIG" in font.tables
+        assert "CFF " not in font.tables
+        assert "DSIG" in font
+        assert "CFF " in font
+
+    def test_sparse_tables(self, testufo):
+        compiler = OutlineOTFCompiler(testufo, tables=SPARSE_OTF_MASTER_TABLES)
+        font = compiler.compile(lazy=True)
+
+        # 'CUST' is imported from the UFO's data directory
+        tags = [tag for tag in font.keys() if tag not in ("GlyphOrder", "CUST")]
+        assert SPARSE_OTF_MASTER_TABLES.issuperset(tags)
+
+
 if __name__ == "__main__":
     import sys
 
@@ -0,0 +1,53 @@
+from io import StringIO
+from textwrap import dedent
+
+from fontTools import subset
+from fontTools.feaLib.parser import Parser
+
+from ufo2ft.util import compileGSUB, getSubstitutionGraph
+
+GLYPHS = ["a", "b", "c", "f", "i", "f_i", "a.alt", "a.sc", "b.sc", "c.ctx", "d"]
+
+FEATURES = dedent(
+    """\
+    lookup ctx_sub {
+        sub c by c.ctx;
+    } ctx_sub;
+
+    feature salt {
+        sub a from [a.alt a.sc];
+    } salt;
+
+    feature liga {
+        sub f i by f_i;
+    } liga;
+
+    feature calt {
+        sub a.alt c' lookup ctx_sub;
+    } calt;
+
+    feature smcp {
+        sub b by b.sc;
+    } smcp;
+    """
+)
+
+
+def _subsetterClosure(gsub, glyphs):
+    subsetter = subset.Subsetter()
+    subsetter.glyphs = set(glyphs)
+    gsub.closure_glyphs(subsetter)
+    return subsetter.glyphs
+
+
+def test_substitution_graph_closure():
+    feaFile = Parser(StringIO(FEATURES), GLYPHS).parse()
+    gsub = compileGSUB(feaFile, GLYPHS)
+    graph = getSubstitutionGraph(gsub)
+
+    assert getSubstitutionGraph(gsub) is graph
+    for glyphs in [{"a"}, {"f"}, {"f", "i"}, {"c"}, {"a", "c"}, {"b", "d"}]:
+        assert graph.closure(glyphs) == _subsetterClosure(gsub, glyphs)
+
+    assert graph.closure({"a", "c"}) == {"a", "a.alt", "a.sc", "c", "c.ctx"}
+    assert graph.closure({"i"}, closedGlyphs={"f"}) == {"f", "i", "f_i"}
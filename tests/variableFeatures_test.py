@@ -0,0 +1,255 @@
+import io
+import itertools
+
+import pytest
+from fontTools.ttLib import TTFont
+from fontTools.varLib.instancer import instantiateVariableFont
+
+from ufo2ft import compileVariableCFF2, compileVariableTTF
+from ufo2ft.constants import FILTERS_KEY
+from ufo2ft.errors import InvalidFontData
+from ufo2ft.featureWriters import KernFeatureWriter, MarkFeatureWriter
+from ufo2ft.variableFeatures import (
+    NO_VARIATION_INDEX,
+    Variations,
+    splitVariableFeatureWriters,
+)
+
+
+@pytest.fixture
+def kerningDesignspace(designspace):
+    regular, bold = (s.font for s in designspace.sources if s.layerName is None)
+    for ufo in (regular, bold):
+        ufo.groups["public.kern1.A"] = ["a", "e"]
+        ufo.groups["public.kern2.S"] = ["s"]
+    regular.kerning[("public.kern1.A", "public.kern2.S")] = -10
+    bold.kerning[("public.kern1.A", "public.kern2.S")] = -30
+    regular.kerning[("public.kern1.A", "a")] = 15
+    bold.kerning[("public.kern1.A", "a")] = 15
+    # only kerned in one master, and an exception in the other
+    regular.kerning[("a", "a")] = 5
+    bold.kerning[("e", "s")] = -20
+    return designspace
+
+
+def instantiateGPOS(varfont, location):
+    buf = io.BytesIO()
+    varfont.save(buf)
+    buf.seek(0)
+    font = TTFont(buf)
+    # the instancer doesn't support CFF2, only the GPOS table matters here
+    if "CFF2" in font:
+        del font["CFF2"]
+    instantiateVariableFont(font, {"wght": location}, inplace=True)
+    return font
+
+
+def getKerning(varfont, location):
+    # the kerning of each pair of glyphs at the location, from the first
+    # subtable of each lookup of the 'kern' feature that applies to it
+    font = instantiateGPOS(varfont, location)
+    gpos = font["GPOS"].table
+    lookupIndices = set()
+    for record in gpos.FeatureList.FeatureRecord:
+        if record.FeatureTag == "kern":
+            lookupIndices.update(record.Feature.LookupListIndex)
+    glyphs = [g for g in font.getGlyphOrder() if g != ".notdef"]
+    kerning = {}
+    for glyph1, glyph2 in itertools.product(glyphs, repeat=2):
+        value = 0
+        for index in sorted(lookupIndices):
+            for st in gpos.LookupList.Lookup[index].SubTable:
+                if glyph1 not in st.Coverage.glyphs:
+                    continue
+                if st.Format == 1:
+                    pairSet = st.PairSet[st.Coverage.glyphs.index(glyph1)]
+                    records = [
+                        r for r in pairSet.PairValueRecord if r.SecondGlyph == glyph2
+                    ]
+                    if not records:
+                        continue
+                    valueRecord = records[0].Value1
+                else:
+                    class1 = st.ClassDef1.classDefs.get(glyph1, 0)
+                    class2 = st.ClassDef2.classDefs.get(glyph2, 0)
+                    record = st.Class1Record[class1].Class2Record[class2]
+                    valueRecord = record.Value1
+                value += getattr(valueRecord, "XAdvance", 0) or 0
+                break
+        if value:
+            kerning[glyph1, glyph2] = value
+    return kerning
+
+
+def test_Variations(designspace):
+    variations = Variations(designspace)
+
+    # the sparse layer is not a master
+    assert len(variations.fonts) == 2
+    assert variations.defaultFont is designspace.findDefault().font
+    assert variations.storeMasterValues([10, 10.2]) == (10, NO_VARIATION_INDEX)
+    assert variations.getVarStore() is None
+
+    value, varIdx = variations.storeMasterValues([10, 20])
+    assert value == 10
+    assert varIdx != NO_VARIATION_INDEX
+    assert variations.storeMasterValues([10, 20]) == (10, varIdx)
+    varStore = variations.getVarStore()
+    assert varStore.VarData[varIdx >> 16].Item[varIdx & 0xFFFF] == [10]
+
+
+def test_splitVariableFeatureWriters(FontClass):
+    ufo = FontClass()
+
+    masterWriters, variableWriters = splitVariableFeatureWriters(ufo)
+
+    assert masterWriters == []
+    assert variableWriters == [KernFeatureWriter, MarkFeatureWriter]
+
+    writer = KernFeatureWriter(ignoreMarks=False)
+    assert splitVariableFeatureWriters(ufo, [writer]) == ([], [writer])
+
+
+@pytest.mark.parametrize("compileFunc", [compileVariableTTF, compileVariableCFF2])
+def test_variable_kerning(kerningDesignspace, compileFunc):
+    expected = compileFunc(kerningDesignspace)
+    debugFeatureFile = io.StringIO()
+
+    varfont = compileFunc(
+        kerningDesignspace,
+        variableFeatures=True,
+        debugFeatureFile=debugFeatureFile,
+    )
+
+    # the masters were compiled without kerning
+    assert (
+        "pos @kern1.A @kern2.S -10;"
+        not in debugFeatureFile.getvalue().split("### Variable features ###")[0]
+    )
+    gdef = varfont["GDEF"].table
+    assert gdef.Version == 0x00010003
+    assert gdef.VarStore.VarData
+    # the mark feature was merged by varLib
+    assert [r.FeatureTag for r in varfont["GPOS"].table.FeatureList.FeatureRecord] == [
+        "kern",
+        "mark",
+    ]
+
+    # the kerning is the same at any location
+    for location in (350, 500, 625):
+        kerning = getKerning(varfont, location)
+        assert kerning == getKerning(expected, location)
+        assert kerning
+    assert getKerning(varfont, 625)["a", "s"] == -30
+
+
+def test_variable_kerning_merged_features(kerningDesignspace):
+    # the generated lookups are added to the existing 'kern' features, which
+    # are shared by the language systems
+    for source in kerningDesignspace.sources:
+        if source.layerName is None:
+            source.font.features.text = (
+                "languagesystem DFLT dflt;\n"
+                "languagesystem latn dflt;\n"
+                "languagesystem latn TRK;\n"
+                "feature kern { pos s s -5; } kern;\n"
+            )
+    featureWriters = [KernFeatureWriter(mode="append"), MarkFeatureWriter]
+    expected = compileVariableTTF(kerningDesignspace, featureWriters=featureWriters)
+
+    varfont = compileVariableTTF(
+        kerningDesignspace, featureWriters=featureWriters, variableFeatures=True
+    )
+
+    gpos = varfont["GPOS"].table
+    assert [r.FeatureTag for r in gpos.FeatureList.FeatureRecord] == ["kern", "mark"]
+    assert [r.ScriptTag for r in gpos.ScriptList.ScriptRecord] == ["DFLT", "latn"]
+    latn = gpos.ScriptList.ScriptRecord[1].Script
+    assert latn.LangSysRecord[0].LangSys.FeatureIndex == [0, 1]
+    assert gpos.FeatureList.FeatureRecord[0].Feature.LookupListIndex == [0, 1]
+    for location in (350, 500, 625):
+        kerning = getKerning(varfont, location)
+        assert kerning == getKerning(expected, location)
+        assert kerning["s", "s"] == -5
+
+
+def getMarkAnchors(varfont, location):
+    # the base and mark anchors of the mark-to-base subtables at the location
+    gpos = instantiateGPOS(varfont, location)["GPOS"].table
+    anchors = {}
+    for lookup in gpos.LookupList.Lookup:
+        for st in lookup.SubTable:
+            if lookup.LookupType != 4:
+                continue
+            for glyphName, record in zip(
+                st.BaseCoverage.glyphs, st.BaseArray.BaseRecord
+            ):
+                anchors[glyphName] = [
+                    (a.XCoordinate, a.YCoordinate) for a in record.BaseAnchor
+                ]
+            for glyphName, record in zip(
+                st.MarkCoverage.glyphs, st.MarkArray.MarkRecord
+            ):
+                anchor = record.MarkAnchor
+                anchors[glyphName] = (anchor.XCoordinate, anchor.YCoordinate)
+    return anchors
+
+
+@pytest.mark.parametrize("compileFunc", [compileVariableTTF, compileVariableCFF2])
+def test_variable_mark(designspace, compileFunc):
+    expected = compileFunc(designspace)
+    debugFeatureFile = io.StringIO()
+
+    varfont = compileFunc(
+        designspace, variableFeatures=True, debugFeatureFile=debugFeatureFile
+    )
+
+    # the text has the anchors of the default master
+    variableFeatures = debugFeatureFile.getvalue().split("### Variable features ###")
+    assert "pos base e" not in variableFeatures[0]
+    assert "pos base e <anchor 314 556> mark @MC_top;" in variableFeatures[1]
+    gdef = varfont["GDEF"].table
+    assert gdef.GlyphClassDef.classDefs["dotabovecomb"] == 3
+    assert gdef.GlyphClassDef.classDefs["e"] == 1
+
+    for location in (350, 500, 625):
+        anchors = getMarkAnchors(varfont, location)
+        assert anchors == getMarkAnchors(expected, location)
+        assert anchors
+    assert getMarkAnchors(varfont, 625)["e"] == [(315, 644)]
+
+
+@pytest.mark.parametrize("compileFunc", [compileVariableTTF, compileVariableCFF2])
+def test_variable_mark_filters(designspace, compileFunc):
+    # the anchors are read from the pre-processed glyphs
+    for source in designspace.sources:
+        if source.layerName is None:
+            ufo = source.font
+            ufo.lib[FILTERS_KEY] = [{"name": "propagateAnchors", "pre": True}]
+            glyph = ufo.newGlyph("ealt")
+            glyph.width = ufo["e"].width
+            glyph.getPen().addComponent("e", (1, 0, 0, 1, 0, 0))
+    expected = compileFunc(designspace)
+    debugFeatureFile = io.StringIO()
+
+    varfont = compileFunc(
+        designspace, variableFeatures=True, debugFeatureFile=debugFeatureFile
+    )
+
+    assert "pos base ealt <anchor 314 556> mark @MC_top;" in (
+        debugFeatureFile.getvalue().split("### Variable features ###")[1]
+    )
+    for location in (350, 500, 625):
+        anchors = getMarkAnchors(varfont, location)
+        assert anchors == getMarkAnchors(expected, location)
+    assert getMarkAnchors(varfont, 625)["ealt"] == [(315, 644)]
+
+
+def test_variable_mark_incompatible_anchors(designspace):
+    bold = designspace.sources[2].font
+    bold["e"].anchors[0].name = "bottom"
+
+    with pytest.raises(
+        InvalidFontData, match="Glyph 'e' has incompatible anchors in master"
+    ):
+        compileVariableTTF(designspace, variableFeatures=True)